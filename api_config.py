@@ -10,8 +10,9 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.21.H05.1 ($Rev: 2 $)"
 
+import atexit
+import os
 import threading
-import time
 from flask import Flask
 from flask_jwt_extended import JWTManager
 from apps.api_authentication.view_endpoints import authorization_api
@@ -19,13 +20,83 @@ from apps.estado.view_endpoints import state_api
 from apps.municipio.view_endpoints import town_api
 from apps.ciudad.view_endpoints import city_api
 from apps.colonia.view_endpoints import suburb_api
+from apps.codigo_postal.view_endpoints import postal_code_api
+from apps.cache.view_endpoints import cache_api
+from db_controller.database_backend import commit_db_session, close_db_connection
+from db_controller.schema_bootstrap import bootstrap_database, init_db_command
+from db_controller.catalog_import import import_catalog_command, rollback_catalog_command
+from db_controller.catalog_sync import sync_catalog_command
+from db_controller.catalog_notifications import catalog_listener
+from cache_controller.postal_code_index import postal_code_index
+from cache_controller.postal_code_bloom import postal_code_bloom
+from cache_controller.filter_cache import background_refresher, cache_backend
+from cache_controller.backends import InProcessCacheBackend
+from cache_controller.cache_snapshot import CacheSnapshot
 from utilities.Utility import *
 
 cfg_db = get_config_settings_db()
 cfg_app = get_config_settings_app()
 
+cache_snapshot = None
+
+# Process that started the background jobs, the threads are not copied to a forked worker
+_background_jobs_pid = None
+_background_jobs_lock = threading.Lock()
+
+
+def start_background_jobs():
+    r"""
+    Start the threads of the worker once by process: catalog listener, postal code index refresher, build of
+    the Bloom filter and cache snapshot. The cache refresher starts on his first key queued.
+
+    Registered before every request, so every worker starts his own threads, also a worker forked from a
+    master that already created the app (gunicorn --preload).
+    """
+
+    global _background_jobs_pid
+
+    if _background_jobs_pid == os.getpid():
+        return
+
+    with _background_jobs_lock:
+        if _background_jobs_pid == os.getpid():
+            return
+
+        # The writes of the catalog committed by the other workers invalidate the caches of this one
+        if cfg_app.catalog_listen_enabled:
+            catalog_listener.start()
+
+        # Lookups by postal code from memory, reloaded when the catalog version changes
+        if cfg_app.postal_code_index_enabled:
+            postal_code_index.start(cfg_app.postal_code_index_refresh)
+
+        # Postal codes that are definitely not on the catalog are rejected without query the database
+        if cfg_app.postal_code_bloom_enabled:
+            postal_code_bloom.start()
+
+        # The in-process cache starts warm from the snapshot of the previous workers with the same catalog version
+        if cache_snapshot is not None:
+            cache_snapshot.start()
+
+        _background_jobs_pid = os.getpid()
+
+
+def stop_background_jobs():
+    r"""
+    Stop the threads of the worker: cache refresher, postal code index refresher and catalog listener.
+    """
+
+    background_refresher.shutdown()
+    postal_code_index.stop()
+    catalog_listener.stop()
+
+    if cache_snapshot is not None:
+        cache_snapshot.stop()
+
 
 def create_app():
+    global cache_snapshot
+
     app_api = Flask(__name__, static_url_path='/static')
 
     app_api.config['JWT_SECRET_KEY'] = cfg_app.api_key.__str__()
@@ -40,6 +111,27 @@ def create_app():
 
     app_api.config['SQLALCHEMY_DATABASE_URI'] = cfg_db.Development.SQLALCHEMY_DATABASE_URI.__str__()
 
+    # One transaction by request, return his connection to the pool of the shared engine
+    app_api.after_request(commit_db_session)
+    app_api.teardown_appcontext(close_db_connection)
+
+    # Verify the schema only once on start, the requests never inspect the database objects
+    app_api.cli.add_command(init_db_command)
+    app_api.cli.add_command(import_catalog_command)
+    app_api.cli.add_command(rollback_catalog_command)
+    app_api.cli.add_command(sync_catalog_command)
+
+    if cfg_db.bootstrap_on_start:
+        app_api.config['SCHEMA_VERSION'] = bootstrap_database()
+
+    if cfg_app.cache_snapshot_path and isinstance(cache_backend, InProcessCacheBackend):
+        cache_snapshot = CacheSnapshot(cache_backend, cfg_app.cache_snapshot_path, cfg_app.cache_snapshot_interval)
+
+    # The threads of the worker are started by his first request, not on the process that creates the app
+    app_api.before_request(start_background_jobs)
+
+    atexit.register(stop_background_jobs)
+
     # USER
     app_api.register_blueprint(authorization_api, url_prefix='/api/v1/manager/sepomex/')
 
@@ -55,6 +147,12 @@ def create_app():
     # SUBURB
     app_api.register_blueprint(suburb_api, url_prefix='/api/v1/manager/sepomex/colonia')
 
+    # POSTAL CODE
+    app_api.register_blueprint(postal_code_api, url_prefix='/api/v1/manager/sepomex/codigo_postal')
+
+    # CACHE
+    app_api.register_blueprint(cache_api, url_prefix='/api/v1/manager/sepomex/cache')
+
     jwt_manager = JWTManager(app_api)
 
     jwt_manager.init_app(app_api)
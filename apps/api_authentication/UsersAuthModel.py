@@ -127,8 +127,6 @@ class UsersAuthModel(Base):
                 'Row not stored in "{}". IntegrityError: {}'.format(data.get('username'),
                                                                     str(str(exc.args) + ':' + str(exc.code)))
             )
-        finally:
-            session.close()
 
         return row_exists
 
@@ -176,14 +174,14 @@ class UsersAuthModel(Base):
                                                                                   row_inserted.is_active,
                                                                                   row_inserted.creation_date))
 
-                    endpoint_response = json.dumps({
+                    endpoint_response = {
                         "Username": row_inserted.user_name,
                         "Password": row_inserted.password,
                         "IsActive": row_inserted.is_active,
                         "IsStaff": row_inserted.is_staff,
                         "IsSuperUser": row_inserted.is_superuser,
                         "CreationDate": row_inserted.creation_date
-                    })
+                    }
 
             except SQLAlchemyError as exc:
                 endpoint_response = None
@@ -194,8 +192,6 @@ class UsersAuthModel(Base):
                     'Row not stored in "{}". IntegrityError: {}'.format(data.get('username'),
                                                                         str(str(exc.args) + ':' + str(exc.code)))
                 )
-            finally:
-                session.close()
 
         return endpoint_response
 
@@ -234,7 +230,7 @@ class UsersAuthModel(Base):
                 if row_updated:
                     logger.info('Data User updated')
 
-                    endpoint_response = json.dumps({
+                    endpoint_response = {
                         "Username": row_updated.user_name,
                         "Password": row_updated.password,
                         "IsActive": row_updated.is_active,
@@ -242,7 +238,7 @@ class UsersAuthModel(Base):
                         "IsSuperUser": row_updated.is_superuser,
                         "CreationDate": row_updated.creation_date,
                         "UpdatedDate": row_updated.last_update_date
-                    })
+                    }
 
             except SQLAlchemyError as exc:
                 session.rollback()
@@ -255,8 +251,6 @@ class UsersAuthModel(Base):
                     'Row not stored in "{}". IntegrityError: {}'.format(data.get('username'),
                                                                         str(str(exc.args) + ':' + str(exc.code)))
                 )
-            finally:
-                session.close()
 
         return endpoint_response
 
@@ -289,9 +283,6 @@ class UsersAuthModel(Base):
                 )
             )
 
-        finally:
-            session.close()
-
         return row
 
     def get_one_user(self, session, data):
@@ -320,8 +311,6 @@ class UsersAuthModel(Base):
                     data.get('user_id'), UsersAuthModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
                 )
             )
-        finally:
-            session.close()
 
         return row_user
 
@@ -362,7 +351,7 @@ class UsersAuthModel(Base):
                 }
             }]
 
-        return json.dumps(user_data)
+        return user_data
 
     def __repr__(self):
         return "<AuthUserModel(id_user='%s', username='%s', password='%s', email='%s', " \
@@ -11,8 +11,6 @@ __history__ = """ """
 __version__ = "1.21.H05.1 ($Rev: 2 $)"
 
 import re
-import time
-import threading
 from flask import Blueprint, json, request, render_template, redirect
 from flask_jwt_extended import jwt_required
 from db_controller.database_backend import *
@@ -30,20 +28,8 @@ authorization_api = Blueprint('authorization_api', __name__, url_prefix='/auth')
 logger = configure_logger('ws')
 
 
-# Se inicializa la App con un hilo para evitar problemas de ejecución
-# (Falta validacion para cuando ya exista hilo corriendo)
-def activate_job():
-    def run_job():
-        while True:
-            time.sleep(2)
-
-    thread = threading.Thread(target=run_job)
-    thread.start()
-
-
 # Contiene la llamada al HTML que soporta la documentacion de la API,
 # sus metodos, y endpoints con los modelos de datos I/O
-# @authorization_api.before_app_first_request(activate_job())
 @authorization_api.route('/')
 def main():
     return render_template('api_manage_sepomex.html')
@@ -125,7 +111,7 @@ def get_list_users_auth():
 
             users_on_db = user_model.get_all_users(session_db, data)
 
-            if not bool(users_on_db) or not users_on_db or "[]" == users_on_db:
+            if not users_on_db:
                 return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, users_on_db)
 
             return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, users_on_db)
@@ -0,0 +1 @@
+# -*- coding: utf-8 -*-
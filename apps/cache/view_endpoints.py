@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+from flask import Blueprint, request
+from flask_jwt_extended import jwt_required
+from cache_controller.filter_cache import cache_backend, background_refresher
+from cache_controller.postal_code_index import postal_code_index
+from cache_controller.postal_code_bloom import postal_code_bloom
+from cache_controller.single_flight import catalog_flights
+from cache_controller.pinned_tables import pinned_states, pinned_towns
+from cache_controller.response_cache import response_cache
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from handler_controller.messages import SuccessMsg, ErrorMsg
+from logger_controller.logger_control import *
+from utilities.Utility import *
+
+cfg_app = get_config_settings_app()
+cache_api = Blueprint('cache_api', __name__)
+logger = configure_logger('ws')
+
+
+@cache_api.route('/stats', methods=['GET'])
+@jwt_required
+def get_cache_stats():
+
+    headers = request.headers
+    auth = headers.get('Authorization')
+
+    if not auth or 'Bearer' not in auth:
+        return HandlerResponse.request_unauthorized(ErrorMsg.ERROR_REQUEST_UNAUTHORIZED, auth)
+    else:
+
+        cache_stats = {
+            "cache": cache_backend.get_stats(),
+            "background_refresher": background_refresher.get_stats(),
+            "response_cache": response_cache.get_stats(),
+            "postal_code_index": postal_code_index.get_stats(),
+            "postal_code_bloom": postal_code_bloom.get_stats(),
+            "single_flight": catalog_flights.get_stats(),
+            "pinned_tables": {
+                "estado": pinned_states.get_stats(),
+                "municipio": pinned_towns.get_stats()
+            }
+        }
+
+        return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, cache_stats)
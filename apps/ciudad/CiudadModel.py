@@ -28,8 +28,11 @@ import json
 import logging
 from apps.municipio.MunicipioModel import MunicipioModel
 from sqlalchemy_filters import apply_filters
-from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence
+from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence, Index
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import deferred
 from db_controller.database_backend import *
+from db_controller.catalog_events import mark_catalog_write
 from db_controller import mvc_exceptions as mvc_exc
 
 cfg_db = get_config_settings_db()
@@ -49,18 +52,26 @@ class CiudadModel(Base):
 
     __tablename__ = 'ciudad'
 
+    # Natural key of the City, conflict target of insert_data
+    __table_args__ = (
+        Index('ux_ciudad_id_municipio_clave_ciudad', 'id_municipio', 'clave_ciudad', unique=True),
+    )
+
     id_ciudad = Column('id_ciudad', Integer, CITY_ID_SEQ,
                        primary_key=True, server_default=CITY_ID_SEQ.next_value())
     nombre_ciudad = Column('nombre_ciudad', String, nullable=False, index=True)
     clave_ciudad = Column('clave_ciudad', Integer, nullable=False, index=True)
 
+    # Hash of the content of the row on the SEPOMEX file, compared by the catalog sync. Deferred, so the
+    # lookups select only the columns of his covering indexes
+    row_hash = deferred(Column('row_hash', String(32), nullable=True))
+
     ciudad_id_municipio = Column(
         'id_municipio',
         Integer,
-        ForeignKey('MunicipioModel.id_municipio', onupdate='CASCADE', ondelete='CASCADE'),
-        nullable=True,
-        unique=True
-        # no need to add index=True, all FKs have indexes
+        ForeignKey('municipio.id_municipio', onupdate='CASCADE', ondelete='CASCADE'),
+        nullable=True
+        # no need to add index=True, the natural key index starts with id_municipio
     )
 
     id_municipio = relationship(MunicipioModel,
@@ -71,50 +82,10 @@ class CiudadModel(Base):
         self.clave_ciudad = data_city.get('clave_ciudad')
         self.ciudad_id_municipio = data_city.get('id_municipio')
 
-    def check_if_row_exists(self, session, data):
-        """
-        Validate if row exists on database from dictionary data
-
-        :param session: Session database object
-        :param data: Dictionary with data to make validation function
-        :return: row_exists: Object with boolean response from db
-        """
-
-        row_exists = None
-        id_city = 0
-
-        try:
-            # for example to check if the insert on db is correct
-            row_city = self.get_city_id(session, data)
-
-            if row_city is not None:
-                id_city = row_city.id_ciudad
-            else:
-                id_city = 0
-
-            logger.info('Municipio Row object in DB: %s', str(id_city))
-
-            row_exists = session.query(CiudadModel).filter(CiudadModel.id_ciudad == id_city).scalar()
-
-            logger.info('Row to data: {}, Exists: %s'.format(data), str(row_exists))
-
-        except SQLAlchemyError as exc:
-            row_exists = None
-
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.IntegrityError(
-                'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_ciudad'),
-                                                                    str(str(exc.args) + ':' + str(exc.code)))
-            )
-        finally:
-            session.close()
-
-        return row_exists
-
     def insert_data(self, session, data):
         """
-        Function to insert new row on database
+        Function to insert new row on database, one statement with the natural key (id_municipio, clave_ciudad)
+        as conflict target
 
         :param session: Session database object
         :param data: Dictionary to insert new the data containing on the db
@@ -123,167 +94,96 @@ class CiudadModel(Base):
 
         endpoint_response = None
 
-        if not self.check_if_row_exists(session, data):
-
-            try:
-
-                new_row = CiudadModel(data)
-
-                logger.info('New Row Ciudad: %s', str(new_row.nombre_ciudad))
-
-                session.add(new_row)
-
-                row_city = self.get_city_id(session, data)
-
-                logger.info('Ciudad ID Inserted: %s', str(row_city.id_ciudad))
-
-                session.flush()
-
-                data['id_ciudad'] = row_city.id_ciudad
-
-                # check insert correct
-                row_inserted = self.get_one_city(session, data)
-
-                logger.info('Data Ciudad inserted: %s, Original Data: {}'.format(data), str(row_inserted))
-
-                if row_inserted:
-                    endpoint_response = json.dumps({
-                        "id_ciudad": str(row_inserted.id_ciudad),
-                        "nombre_ciudad": row_inserted.nombre_ciudad,
-                        "clave_ciudad": row_inserted.clave_ciudad,
-                        "clave_municipio": row_inserted.ciudad_id_municipio
-                    })
-
-            except SQLAlchemyError as exc:
-                endpoint_response = None
-                session.rollback()
-
-                logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                 str(exc.code)))
-                raise mvc_exc.IntegrityError(
-                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_ciudad'),
-                                                                        str(str(exc.args) + ':' + str(exc.code)))
-                )
-            finally:
-                session.close()
-
-        return endpoint_response
+        try:
 
-    @staticmethod
-    def get_city_id(session, data):
-        """
-        Get Ciudad object row registered on database to get the ID
+            ciudad_table = CiudadModel.__table__
 
-        :param session: Database session object
-        :param data: Dictionary with data to get row
-        :return: row_city: The row on database registered
-        """
+            statement = insert(ciudad_table).values(nombre_ciudad=data.get('nombre_ciudad'),
+                                                    clave_ciudad=data.get('clave_ciudad'),
+                                                    id_municipio=data.get('id_municipio')). \
+                on_conflict_do_nothing(index_elements=[ciudad_table.c.id_municipio, ciudad_table.c.clave_ciudad]). \
+                returning(ciudad_table.c.id_ciudad, ciudad_table.c.nombre_ciudad,
+                          ciudad_table.c.clave_ciudad, ciudad_table.c.id_municipio)
 
-        row_city = None
+            row_inserted = session.execute(statement).first()
 
-        try:
+            logger.info('Data Ciudad inserted: %s, Original Data: {}'.format(data), str(row_inserted))
 
-            row_exists = session.query(CiudadModel). \
-                filter(CiudadModel.nombre_ciudad == data.get('nombre_ciudad')). \
-                filter(CiudadModel.clave_ciudad == data.get('clave_ciudad')).scalar()
+            if row_inserted:
 
-            logger.info('Row Data Ciudad Exists on DB: %s', str(row_exists))
+                data['id_ciudad'] = row_inserted.id_ciudad
 
-            if row_exists:
-                row_city = session.query(CiudadModel). \
-                    filter(CiudadModel.nombre_ciudad == data.get('nombre_ciudad')). \
-                    filter(CiudadModel.clave_ciudad == data.get('clave_ciudad')).one()
+                mark_catalog_write(session, CiudadModel.__tablename__, {'id_ciudad': row_inserted.id_ciudad})
 
-                logger.info('Row ID Ciudad data from database object: {}'.format(str(row_city)))
+                endpoint_response = {
+                    "id_ciudad": str(row_inserted.id_ciudad),
+                    "nombre_ciudad": row_inserted.nombre_ciudad,
+                    "clave_ciudad": row_inserted.clave_ciudad,
+                    "clave_municipio": row_inserted.id_municipio
+                }
 
         except SQLAlchemyError as exc:
-
+            # The transaction of the request is rolled back by his teardown, see database_backend
             logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
                                                                                              str(exc.code)))
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_ciudad'), CiudadModel.__tablename__, str(str(exc.args) + ':' +
-                                                                              str(exc.code))
-                )
+            raise mvc_exc.IntegrityError(
+                'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_ciudad'),
+                                                                    str(str(exc.args) + ':' + str(exc.code)))
             )
 
-        finally:
-            session.close()
-
-        return row_city
+        return endpoint_response
 
     @staticmethod
-    def get_one_city(session, data):
-        row = None
-
-        try:
-
-            row = session.query(CiudadModel). \
-                filter(CiudadModel.nombre_ciudad == data.get('nombre_ciudad')). \
-                filter(CiudadModel.clave_ciudad == data.get('clave_ciudad')).one()
-
-            if row:
-                logger.info('Data Ciudad on Db: %s',
-                            'Nombre: {}, Clave: {}, Estado: {}'.format(row.nombre_ciudad,
-                                                                       row.clave_ciudad,
-                                                                       row.ciudad_id_municipio))
-
-        except SQLAlchemyError as exc:
-            row = None
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
+    def stream_all_cities(session):
+        """
+        Iterate over all the Ciudades objects data registered on database through a server-side cursor,
+        the rows are fetched by batches of STREAM_BATCH_SIZE so the memory doesn't grow with the table.
 
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_ciudad'), CiudadModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
+        :param session: Database session
+        :return: generator of dict
+        """
 
-        finally:
-            session.close()
+        query = session.query(CiudadModel).order_by(CiudadModel.id_ciudad). \
+            execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
 
-        return row
+        for row in query:
+            yield {
+                "City": row.to_dict()
+            }
 
     @staticmethod
     def get_all_cities(session, data):
         """
-        Get all Ciudades objects data registered on database.
+        Get a page of Ciudades objects data registered on database, sought with the id after the last row
+        of the previous page (keyset pagination). The cursor of the next page is set on data['next_cursor'].
 
         :param data: Dictionary contains relevant data to filter Query on resultSet DB
         :param session: Database session
-        :return: json.dumps dict
+        :return: list of dict
         """
 
-        all_cities = None
         city_data = []
 
-        page = None
-        per_page = None
+        after_id = data.get('after_id', 0)
+        limit = get_page_limit(data.get('limit'))
 
-        all_cities = session.query(CiudadModel).all()
+        # One row more than the page to know if there is a next page
+        all_rows = session.query(CiudadModel).filter(CiudadModel.id_ciudad > after_id). \
+            order_by(CiudadModel.id_ciudad).limit(limit + 1).all()
 
-        if 'offset' in data.keys() and 'limit' in data.keys():
-            page = data.get('offset')
-            per_page = data('limit')
+        data['next_cursor'] = None
 
-            all_cities = session.query(CiudadModel).paginate(page=page, per_page=per_page, error_out=False).all()
+        if len(all_rows) > limit:
+            all_rows = all_rows[:limit]
 
-        for city in all_cities:
-            city_id = city.id_ciudad
-            city_name = city.nombre_ciudad
-            city_key = city.clave_ciudad
-            city_id_town = city.ciudad_id_municipio
+            data['next_cursor'] = encode_page_cursor(all_rows[-1].id_ciudad)
 
+        for row in all_rows:
             city_data += [{
-                "City": {
-                    "id_ciudad": str(city_id),
-                    "nombre_ciudad": city_name,
-                    "clave_ciudad": city_key,
-                    "clave_municipio": city_id_town
-                }
+                "City": row.to_dict()
             }]
 
-        return json.dumps(city_data)
+        return city_data
 
     @staticmethod
     def get_cities_by_filters(session, data, filter_spec):
@@ -293,46 +193,42 @@ class CiudadModel(Base):
         :param session: Database session
         :param data: Dictionary contains relevant data to filter Query on resultSet DB
         :param filter_spec: List of options defined by user request
-        :return: json.dumps dict
+        :return: list of dict
         """
 
-        page = 1
-        per_page = 10
-
-        query_result = None
         city_data = []
 
-        if 'offset' in data.keys() and 'limit' in data.keys():
-            page = data.get('offset')
-            per_page = data('limit')
-
-        query_result = session.query(CiudadModel).all()
+        page = get_page_number(data.get('offset'))
+        per_page = get_page_limit(data.get('limit'))
 
-        query = session.query(CiudadModel)
+        query = session.query(CiudadModel).order_by(CiudadModel.id_ciudad)
 
         filtered_query = apply_filters(query, filter_spec)
 
-        if filter_spec is not None and filtered_query is not None:
-            query_result = filtered_query.paginate(page=page, per_page=per_page, error_out=False).all()
+        query_result = filtered_query.offset((page - 1) * per_page).limit(per_page).all()
 
         logger.info('Query filtered resultSet: %s', str(query_result))
 
-        for city in query_result:
-            city_id = city.id_ciudad
-            city_name = city.nombre_ciudad
-            city_key = city.clave_ciudad
-            city_id_town = city.ciudad_id_municipio
-
+        for row in query_result:
             city_data += [{
-                "City": {
-                    "id_ciudad": str(city_id),
-                    "nombre_ciudad": city_name,
-                    "clave_ciudad": city_key,
-                    "clave_municipio": city_id_town
-                }
+                "City": row.to_dict()
             }]
 
-        return json.dumps(city_data)
+        return city_data
+
+    def to_dict(self):
+        """
+        Get the data of the City as dictionary to serialize on the responses.
+
+        :return: dict
+        """
+
+        return {
+            "id_ciudad": str(self.id_ciudad),
+            "nombre_ciudad": self.nombre_ciudad,
+            "clave_ciudad": self.clave_ciudad,
+            "clave_municipio": self.ciudad_id_municipio
+        }
 
     def __repr__(self):
         return "<CiudadModel(id_ciudad='%s', " \
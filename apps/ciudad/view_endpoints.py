@@ -14,7 +14,9 @@ from flask import Blueprint, json, request
 from flask_jwt_extended import jwt_required
 from db_controller.database_backend import *
 from .CiudadModel import CiudadModel
+from cache_controller.filter_cache import get_filtered_rows
 from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from handler_controller.conditional_requests import catalog_conditional
 from handler_controller.messages import SuccessMsg, ErrorMsg
 from logger_controller.logger_control import *
 from utilities.Utility import *
@@ -28,6 +30,7 @@ logger = configure_logger('ws')
 
 @city_api.route('/', methods=['POST', 'GET'])
 @jwt_required
+@catalog_conditional
 def endpoint_manage_city_data():
     conn_db, session_db = init_db_connection()
 
@@ -63,17 +66,26 @@ def endpoint_manage_city_data():
             data = dict()
             city_on_db = None
 
-            data['offset'] = request.args.get('offset', 1)
-            data['limit'] = request.args.get('limit', 10)
+            # All the catalog as NDJSON, read from a server-side cursor
+            if 'ndjson' == request.args.get('stream'):
+                return HandlerResponse.response_stream(CiudadModel.stream_all_cities(session_db))
+
+            # Keyset pagination, the cursor is the one returned on the previous page
+            try:
+                data['after_id'] = decode_page_cursor(request.args.get('cursor'))
+            except ValueError:
+                return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+            data['limit'] = request.args.get('limit', DEFAULT_PAGE_LIMIT)
 
             city_model = CiudadModel(data)
 
             city_on_db = city_model.get_all_cities(session_db, data)
 
-            if not bool(city_on_db) or not city_on_db or "[]" == city_on_db:
+            if not city_on_db:
                 return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, city_on_db)
 
-            return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, city_on_db)
+            return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, city_on_db, data.get('next_cursor'))
 
         else:
             return HandlerResponse.request_not_found(ErrorMsg.ERROR_METHOD_NOT_ALLOWED)
@@ -81,8 +93,8 @@ def endpoint_manage_city_data():
 
 @city_api.route('/filter', methods=['GET'])
 @jwt_required
+@catalog_conditional
 def get_looking_for_cities():
-    conn_db, session_db = init_db_connection()
 
     headers = request.headers
     auth = headers.get('Authorization')
@@ -117,11 +129,14 @@ def get_looking_for_cities():
 
                 filter_spec.append({'field': 'clave_ciudad', 'op': '==', 'value': city_key})
 
-            city_model = CiudadModel(data)
+            def load_cities(session_db):
+                return CiudadModel.get_cities_by_filters(session_db, data, filter_spec)
 
-            city_on_db = city_model.get_cities_by_filters(session_db, data, filter_spec)
+            # Same filters and page are answered from the cache until the TTL or a write of the catalog
+            city_on_db = get_filtered_rows(CiudadModel.__tablename__, filter_spec, data['offset'], data['limit'],
+                                           load_cities)
 
-            if not bool(city_on_db) or not city_on_db or "[]" == city_on_db:
+            if not city_on_db:
                 return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, city_on_db)
 
             return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, city_on_db)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import re
+from flask import Blueprint, json, request
+from flask_jwt_extended import jwt_required
+from db_controller.database_backend import *
+from apps.colonia.ColoniaModel import ColoniaModel
+from cache_controller.postal_code_index import lookup_postal_code
+from cache_controller.postal_code_bloom import postal_code_may_exist
+from cache_controller.filter_cache import get_postal_codes
+from cache_controller.single_flight import catalog_flights
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from handler_controller.conditional_requests import catalog_conditional
+from cache_controller.response_cache import cached_response
+from handler_controller.messages import SuccessMsg, ErrorMsg
+from logger_controller.logger_control import *
+from utilities.Utility import *
+
+cfg_app = get_config_settings_app()
+postal_code_api = Blueprint('postal_code_api', __name__)
+logger = configure_logger('ws')
+
+# The postal codes of SEPOMEX have 5 digits
+REGEX_POSTAL_CODE = re.compile(r"^[0-9]{5}$")
+
+# Postal codes by request of the batch lookup
+MAX_BATCH_POSTAL_CODES = 100
+
+
+def load_hierarchies(session_db, postal_codes):
+    return ColoniaModel.get_hierarchy_by_postal_codes(session_db, postal_codes)
+
+
+@postal_code_api.route('/', methods=['GET'])
+@jwt_required
+@catalog_conditional
+def get_postal_codes_hierarchy():
+
+    headers = request.headers
+    auth = headers.get('Authorization')
+
+    if not auth or 'Bearer' not in auth:
+        return HandlerResponse.request_unauthorized(ErrorMsg.ERROR_REQUEST_UNAUTHORIZED, auth)
+    else:
+
+        # ?codigo_postal=01000,01010,...
+        postal_codes = list(dict.fromkeys(request.args.get('codigo_postal', '').split(',')))
+
+        if len(postal_codes) > MAX_BATCH_POSTAL_CODES or \
+                not all(REGEX_POSTAL_CODE.match(postal_code) for postal_code in postal_codes):
+            return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+        logger.info('Postal codes to looking for: %s', str(len(postal_codes)))
+
+        # The postal codes that are definitely not on the catalog are not looked for
+        postal_codes_on_db = {postal_code: [] for postal_code in postal_codes
+                              if not postal_code_may_exist(postal_code)}
+
+        # Answered from the in-memory index when it is built, otherwise from the cache with one multi-get
+        for postal_code in postal_codes:
+            if postal_code in postal_codes_on_db:
+                continue
+
+            entries = lookup_postal_code(postal_code)
+
+            if entries is not None:
+                postal_codes_on_db[postal_code] = list(entries)
+
+        missing = [postal_code for postal_code in postal_codes if postal_code not in postal_codes_on_db]
+
+        if missing:
+            postal_codes_on_db.update(get_postal_codes(missing, load_hierarchies))
+
+        if not any(postal_codes_on_db.values()):
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, [])
+
+        return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD,
+                                                {postal_code: postal_codes_on_db[postal_code]
+                                                 for postal_code in postal_codes})
+
+
+@postal_code_api.route('/<codigo_postal>', methods=['GET'])
+@jwt_required
+@catalog_conditional
+@cached_response
+def get_postal_code_hierarchy(codigo_postal):
+
+    headers = request.headers
+    auth = headers.get('Authorization')
+
+    if not auth or 'Bearer' not in auth:
+        return HandlerResponse.request_unauthorized(ErrorMsg.ERROR_REQUEST_UNAUTHORIZED, auth)
+    else:
+
+        if not REGEX_POSTAL_CODE.match(codigo_postal):
+            return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+        logger.info('Postal code to looking for: %s', codigo_postal)
+
+        # The postal code that is definitely not on the catalog doesn't query the database
+        if not postal_code_may_exist(codigo_postal):
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, [])
+
+        # Answered from the in-memory index when it is built, without connect to the database
+        postal_code_on_db = lookup_postal_code(codigo_postal)
+
+        def load_hierarchy():
+            return get_postal_codes([codigo_postal], load_hierarchies)[codigo_postal]
+
+        # The concurrent lookups of the same postal code wait for the one that runs the query
+        if postal_code_on_db is None:
+            postal_code_on_db = catalog_flights.do(('codigo_postal', codigo_postal), load_hierarchy)
+        else:
+            postal_code_on_db = list(postal_code_on_db)
+
+        if not postal_code_on_db:
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, postal_code_on_db)
+
+        return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, postal_code_on_db)
@@ -26,10 +26,15 @@ __version__ = "1.21.H05.1 ($Rev: 2 $)"
 
 import json
 import logging
+from apps.estado.EstadoModel import EstadoModel
+from apps.municipio.MunicipioModel import MunicipioModel
 from apps.ciudad.CiudadModel import CiudadModel
 from sqlalchemy_filters import apply_filters
-from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence, Float
+from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence, Float, Index
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import deferred
 from db_controller.database_backend import *
+from db_controller.catalog_events import mark_catalog_write
 from db_controller import mvc_exceptions as mvc_exc
 
 cfg_db = get_config_settings_db()
@@ -49,6 +54,15 @@ class ColoniaModel(Base):
 
     __tablename__ = 'colonia'
 
+    # Natural key of the Suburb, conflict target of insert_data
+    # The covering index answers the lookups by codigo_postal with an index-only scan ordered by id_colonia.
+    __table_args__ = (
+        Index('ux_colonia_codigo_postal_nombre_tipo', 'codigo_postal', 'nombre_colonia', 'tipo_asentamiento',
+              unique=True),
+        Index('ix_colonia_codigo_postal_cover', 'codigo_postal', 'id_colonia', 'nombre_colonia',
+              'tipo_asentamiento', 'zona_asentamiento', 'id_ciudad'),
+    )
+
     id_colonia = Column('id_colonia', Integer, SUBURB_ID_SEQ,
                         primary_key=True, server_default=SUBURB_ID_SEQ.next_value())
     nombre_colonia = Column('nombre_colonia', String, nullable=False, index=True)
@@ -57,15 +71,19 @@ class ColoniaModel(Base):
 
     zona_colonia = Column('zona_asentamiento', String, nullable=False)
 
-    codigo_postal = Column('codigo_postal', String, nullable=False, index=True)
+    codigo_postal = Column('codigo_postal', String, nullable=False)
+
+    # Hash of the content of the row on the SEPOMEX file, compared by the catalog sync. Deferred, so the
+    # lookups select only the columns of his covering indexes
+    row_hash = deferred(Column('row_hash', String(32), nullable=True))
 
     colonia_id_ciudad = Column(
         'id_ciudad',
         Integer,
-        ForeignKey('CiudadModel.id_ciudad', onupdate='CASCADE', ondelete='CASCADE'),
+        ForeignKey('ciudad.id_ciudad', onupdate='CASCADE', ondelete='CASCADE'),
         nullable=True,
-        unique=True
-        # no need to add index=True, all FKs have indexes
+        index=True
+        # PostgreSQL doesn't index the FKs, the lookups of the suburbs of a city need it
     )
 
     id_ciudad = relationship(CiudadModel,
@@ -78,282 +96,273 @@ class ColoniaModel(Base):
         self.codigo_postal = data_colonia.get('codigo_postal')
         self.colonia_id_ciudad = data_colonia.get('id_ciudad')
 
-    def check_if_row_exists(self, session, data):
+    def insert_data(self, session, data):
         """
-        Validate if row exists on database from dictionary data
+        Function to insert new row on database, one statement with the natural key
+        (codigo_postal, nombre_colonia, tipo_asentamiento) as conflict target
 
         :param session: Session database object
-        :param data: Dictionary with data to make validation function
-        :return: row_exists: Object with boolean response from db
+        :param data: Dictionary to insert new the data containing on the db
+        :return: endpoint_response
         """
 
-        row_exists = None
-        id_city = 0
+        endpoint_response = None
 
         try:
-            # for example to check if the insert on db is correct
-            row_city = self.get_suburb_id(session, data)
 
-            if row_city is not None:
-                id_city = row_city.id_ciudad
-            else:
-                id_city = 0
+            colonia_table = ColoniaModel.__table__
 
-            logger.info('Municipio Row object in DB: %s', str(id_city))
+            statement = insert(colonia_table).values(nombre_colonia=data.get('nombre_colonia'),
+                                                     tipo_asentamiento=data.get('tipo_colonia'),
+                                                     zona_asentamiento=data.get('zona'),
+                                                     codigo_postal=data.get('codigo_postal'),
+                                                     id_ciudad=data.get('id_ciudad')). \
+                on_conflict_do_nothing(index_elements=[colonia_table.c.codigo_postal,
+                                                       colonia_table.c.nombre_colonia,
+                                                       colonia_table.c.tipo_asentamiento]). \
+                returning(colonia_table.c.id_colonia, colonia_table.c.nombre_colonia,
+                          colonia_table.c.tipo_asentamiento, colonia_table.c.zona_asentamiento,
+                          colonia_table.c.codigo_postal, colonia_table.c.id_ciudad)
 
-            row_exists = session.query(CiudadModel).filter(CiudadModel.id_ciudad == id_city).scalar()
+            row_inserted = session.execute(statement).first()
 
-            logger.info('Row to data: {}, Exists: %s'.format(data), str(row_exists))
+            logger.info('Data Colonia inserted: %s, Original Data: {}'.format(data), str(row_inserted))
 
-        except SQLAlchemyError as exc:
-            row_exists = None
+            if row_inserted:
+
+                data['id_colonia'] = row_inserted.id_colonia
+
+                mark_catalog_write(session, ColoniaModel.__tablename__, {'id_colonia': row_inserted.id_colonia,
+                                                                         'codigo_postal': row_inserted.codigo_postal})
+
+                endpoint_response = {
+                    "id_colonia": str(row_inserted.id_colonia),
+                    "nombre_colonia": row_inserted.nombre_colonia,
+                    "tipo_colonia": row_inserted.tipo_asentamiento,
+                    "zona_colonia": row_inserted.zona_asentamiento,
+                    "codigo_postal": row_inserted.codigo_postal,
+                    "id_ciudad": str(row_inserted.id_ciudad)
+                }
 
+        except SQLAlchemyError as exc:
+            # The transaction of the request is rolled back by his teardown, see database_backend
             logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
                                                                                              str(exc.code)))
             raise mvc_exc.IntegrityError(
-                'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_ciudad'),
+                'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_colonia'),
                                                                     str(str(exc.args) + ':' + str(exc.code)))
             )
-        finally:
-            session.close()
 
-        return row_exists
+        return endpoint_response
 
-    def insert_data(self, session, data):
+    @staticmethod
+    def stream_all_suburbs(session):
         """
-        Function to insert new row on database
+        Iterate over all the Colonias objects data registered on database through a server-side cursor,
+        the rows are fetched by batches of STREAM_BATCH_SIZE so the memory doesn't grow with the table.
 
-        :param session: Session database object
-        :param data: Dictionary to insert new the data containing on the db
-        :return: endpoint_response
+        :param session: Database session
+        :return: generator of dict
         """
 
-        endpoint_response = None
-
-        if not self.check_if_row_exists(session, data):
+        query = session.query(ColoniaModel).order_by(ColoniaModel.id_colonia). \
+            execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
 
-            try:
+        for row in query:
+            yield {
+                "Suburb": row.to_dict()
+            }
 
-                new_row = ColoniaModel(data)
+    @staticmethod
+    def get_all_suburbs(session, data):
+        """
+        Get a page of Colonias objects data registered on database, sought with the id after the last row
+        of the previous page (keyset pagination). The cursor of the next page is set on data['next_cursor'].
 
-                logger.info('New Row Colonia: %s', str(new_row.nombre_colonia))
+        :param data: Dictionary contains relevant data to filter Query on resultSet DB
+        :param session: Database session
+        :return: list of dict
+        """
 
-                session.add(new_row)
+        suburb_data = []
 
-                row_suburb = self.get_suburb_id(session, data)
+        after_id = data.get('after_id', 0)
+        limit = get_page_limit(data.get('limit'))
 
-                logger.info('Ciudad ID Inserted: %s', str(row_suburb.id_colonia))
+        # One row more than the page to know if there is a next page
+        all_rows = session.query(ColoniaModel).filter(ColoniaModel.id_colonia > after_id). \
+            order_by(ColoniaModel.id_colonia).limit(limit + 1).all()
 
-                session.flush()
+        data['next_cursor'] = None
 
-                data['id_colonia'] = row_suburb.id_colonia
+        if len(all_rows) > limit:
+            all_rows = all_rows[:limit]
 
-                # check insert correct
-                row_inserted = self.get_one_suburb(session, data)
+            data['next_cursor'] = encode_page_cursor(all_rows[-1].id_colonia)
 
-                logger.info('Data Colonia inserted: %s, Original Data: {}'.format(data), str(row_inserted))
+        for row in all_rows:
+            suburb_data += [{
+                "Suburb": row.to_dict()
+            }]
 
-                if row_inserted:
-                    endpoint_response = json.dumps({
-                        "id_colonia": str(row_inserted.id_colonia),
-                    "nombre_colonia": row_inserted.nombre_colonia,
-                    "tipo_colonia": row_inserted.tipo_colonia,
-                    "zona_colonia": row_inserted.zona_colonia,
-                    "codigo_postal": row_inserted.codigo_postal,
-                    "id_ciudad": str(row_inserted.colonia_id_ciudad)
-                    })
-
-            except SQLAlchemyError as exc:
-                endpoint_response = None
-                session.rollback()
-
-                logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                 str(exc.code)))
-                raise mvc_exc.IntegrityError(
-                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_colonia'),
-                                                                        str(str(exc.args) + ':' + str(exc.code)))
-                )
-            finally:
-                session.close()
-
-        return endpoint_response
+        return suburb_data
 
     @staticmethod
-    def get_suburb_id(session, data):
+    def get_suburbs_by_filters(session, data, filter_spec):
         """
-        Get Colonia object row registered on database to get the ID
+        Get list of Colonias filtered by options by user request
 
-        :param session: Database session object
-        :param data: Dictionary with data to get row
-        :return: row_suburb: The row on database registered
+        :param session: Database session
+        :param data: Dictionary contains relevant data to filter Query on resultSet DB
+        :param filter_spec: List of options defined by user request
+        :return: list of dict
         """
 
-        row_suburb = None
-
-        try:
+        suburb_data = []
 
-            row_exists = session.query(ColoniaModel). \
-                filter(ColoniaModel.nombre_colonia == data.get('nombre_colonia')). \
-                filter(ColoniaModel.tipo_colonia == data.get('tipo_colonia')). \
-                filter(ColoniaModel.codigo_postal == data.get('codigo_postal')).scalar()
+        page = get_page_number(data.get('offset'))
+        per_page = get_page_limit(data.get('limit'))
 
-            logger.info('Row Data Colonia Exists on DB: %s', str(row_exists))
+        query = session.query(ColoniaModel).order_by(ColoniaModel.id_colonia)
 
-            if row_exists:
-                row_suburb = session.query(ColoniaModel). \
-                    filter(ColoniaModel.nombre_colonia == data.get('nombre_colonia')). \
-                    filter(ColoniaModel.tipo_colonia == data.get('tipo_colonia')). \
-                    filter(ColoniaModel.codigo_postal == data.get('codigo_postal')).one()
+        filtered_query = apply_filters(query, filter_spec)
 
-                logger.info('Row ID Colonia data from database object: {}'.format(str(row_suburb)))
+        query_result = filtered_query.offset((page - 1) * per_page).limit(per_page).all()
 
-        except SQLAlchemyError as exc:
-
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_colonia'), ColoniaModel.__tablename__, str(str(exc.args) + ':' +
-                                                                                str(exc.code))
-                )
-            )
+        logger.info('Query filtered resultSet: %s', str(query_result))
 
-        finally:
-            session.close()
+        for row in query_result:
+            suburb_data += [{
+                "Suburb": row.to_dict()
+            }]
 
-        return row_suburb
+        return suburb_data
 
     @staticmethod
-    def get_one_suburb(session, data):
-        row = None
+    def get_hierarchy_by_postal_code(session, postal_code):
+        """
+        Get all the Colonias of a postal code with his Ciudad, Municipio and Estado, resolved by one joined query.
 
-        try:
+        :param session: Database session
+        :param postal_code: The postal code to looking for
+        :return: list of dict
+        """
 
-            row = session.query(ColoniaModel). \
-                    filter(ColoniaModel.nombre_colonia == data.get('nombre_colonia')). \
-                    filter(ColoniaModel.tipo_colonia == data.get('tipo_colonia')). \
-                    filter(ColoniaModel.zona_colonia == data.get('zona')). \
-                    filter(ColoniaModel.codigo_postal == data.get('codigo_postal')).one()
+        hierarchy_data = []
 
-            if row:
-                logger.info('Data Colonia on Db: %s',
-                            'Nombre: {}, Tipo: {}, Codigo Postal: {}'.format(row.nombre_colonia,
-                                                                             row.tipo_colonia,
-                                                                             row.codigo_postal))
+        query_result = ColoniaModel.query_hierarchy(session). \
+            filter(ColoniaModel.codigo_postal == postal_code). \
+            order_by(ColoniaModel.id_colonia).all()
 
-        except SQLAlchemyError as exc:
-            row = None
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_colonia'), ColoniaModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
+        logger.info('Postal code %s hierarchy resultSet: %s', postal_code, str(len(query_result)))
 
-        finally:
-            session.close()
+        for suburb, city, town, state in query_result:
+            hierarchy_data += [ColoniaModel.hierarchy_to_dict(suburb, city, town, state)]
 
-        return row
+        return hierarchy_data
 
     @staticmethod
-    def get_all_suburbs(session, data):
+    def get_hierarchy_by_postal_codes(session, postal_codes):
         """
-        Get all Colonias objects data registered on database.
+        Get all the Colonias of many postal codes with his Ciudad, Municipio and Estado, resolved by one joined query.
 
-        :param data: Dictionary contains relevant data to filter Query on resultSet DB
         :param session: Database session
-        :return: json.dumps dict
+        :param postal_codes: List of postal codes to looking for
+        :return: dict postal code: list of dict
         """
 
-        all_suburbs = None
-        suburb_data = []
+        hierarchy_data = {postal_code: [] for postal_code in postal_codes}
 
-        page = None
-        per_page = None
+        query_result = ColoniaModel.query_hierarchy(session). \
+            filter(ColoniaModel.codigo_postal.in_(postal_codes)). \
+            order_by(ColoniaModel.codigo_postal, ColoniaModel.id_colonia).all()
 
-        all_suburbs = session.query(ColoniaModel).all()
+        logger.info('Postal codes %s hierarchy resultSet: %s', str(len(postal_codes)), str(len(query_result)))
 
-        if 'offset' in data.keys() and 'limit' in data.keys():
-            page = data.get('offset')
-            per_page = data('limit')
+        for suburb, city, town, state in query_result:
+            hierarchy_data[suburb.codigo_postal] += [ColoniaModel.hierarchy_to_dict(suburb, city, town, state)]
 
-            all_suburbs = session.query(ColoniaModel).paginate(page=page, per_page=per_page, error_out=False).all()
+        return hierarchy_data
 
-        for suburb in all_suburbs:
-            suburb_id = suburb.id_colonia
-            suburb_name = suburb.nombre_colonia
-            suburb_type = suburb.tipo_colonia
-            suburn_zone = suburb.zona_colonia
-            zip_postal_code = suburb.codigo_postal
-            city_id = suburb.colonia_id_ciudad
+    @staticmethod
+    def get_all_postal_codes(session):
+        """
+        Get all the postal codes distinct of the Colonias, read from the covering index.
 
-            suburb_data += [{
-                "Suburb": {
-                    "id_colonia": str(suburb_id),
-                    "nombre_colonia": suburb_name,
-                    "tipo_colonia": suburb_type,
-                    "zona_colonia": suburn_zone,
-                    "codigo_postal": zip_postal_code,
-                    "id_ciudad": str(city_id)
-                }
-            }]
+        :param session: Database session
+        :return: list of str
+        """
 
-        return json.dumps(suburb_data)
+        query_result = session.query(ColoniaModel.codigo_postal).distinct().all()
+
+        return [row.codigo_postal for row in query_result]
 
     @staticmethod
-    def get_suburbs_by_filters(session, data, filter_spec):
+    def stream_hierarchy(session):
         """
-        Get list of Colonias filtered by options by user request
+        Iterate over all the Colonias with his Ciudad, Municipio and Estado ordered by postal code, through a
+        server-side cursor fetched by batches of STREAM_BATCH_SIZE.
 
         :param session: Database session
-        :param data: Dictionary contains relevant data to filter Query on resultSet DB
-        :param filter_spec: List of options defined by user request
-        :return: json.dumps dict
+        :return: generator of tuple (ColoniaModel, CiudadModel, MunicipioModel, EstadoModel)
         """
 
-        page = 1
-        per_page = 10
+        query = ColoniaModel.query_hierarchy(session). \
+            order_by(ColoniaModel.codigo_postal, ColoniaModel.id_colonia). \
+            execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
 
-        query_result = None
-        suburb_data = []
+        for suburb, city, town, state in query:
+            yield suburb, city, town, state
 
-        if 'offset' in data.keys() and 'limit' in data.keys():
-            page = data.get('offset')
-            per_page = data('limit')
+    @staticmethod
+    def query_hierarchy(session):
+        """
+        Query of the Colonias joined with his Ciudad, Municipio and Estado.
 
-        query_result = session.query(CiudadModel).all()
+        :param session: Database session
+        :return: Query object
+        """
 
-        query = session.query(CiudadModel)
+        # Outer joins, the FKs of the catalog are nullable
+        return session.query(ColoniaModel, CiudadModel, MunicipioModel, EstadoModel). \
+            outerjoin(CiudadModel, ColoniaModel.colonia_id_ciudad == CiudadModel.id_ciudad). \
+            outerjoin(MunicipioModel, CiudadModel.ciudad_id_municipio == MunicipioModel.id_municipio). \
+            outerjoin(EstadoModel, MunicipioModel.ciudad_id_estado == EstadoModel.id_estado)
 
-        filtered_query = apply_filters(query, filter_spec)
+    @staticmethod
+    def hierarchy_to_dict(suburb, city, town, state):
+        """
+        Get the data of a Suburb with his City, Town and State as dictionary to serialize on the responses.
 
-        if filter_spec is not None and filtered_query is not None:
-            query_result = filtered_query.paginate(page=page, per_page=per_page, error_out=False).all()
+        :param suburb: ColoniaModel object
+        :param city: CiudadModel object or None
+        :param town: MunicipioModel object or None
+        :param state: EstadoModel object or None
+        :return: dict
+        """
 
-        logger.info('Query filtered resultSet: %s', str(query_result))
+        return {
+            "Suburb": suburb.to_dict(),
+            "City": city.to_dict() if city is not None else None,
+            "Town": town.to_dict() if town is not None else None,
+            "State": state.to_dict() if state is not None else None
+        }
 
-        for suburb in query_result:
-            suburb_id = suburb.id_colonia
-            suburb_name = suburb.nombre_colonia
-            suburb_type = suburb.tipo_colonia
-            suburn_zone = suburb.zona_colonia
-            zip_postal_code = suburb.codigo_postal
-            city_id = suburb.colonia_id_ciudad
+    def to_dict(self):
+        """
+        Get the data of the Suburb as dictionary to serialize on the responses.
 
-            suburb_data += [{
-                "Suburb": {
-                    "id_colonia": str(suburb_id),
-                    "nombre_colonia": suburb_name,
-                    "tipo_colonia": suburb_type,
-                    "zona_colonia": suburn_zone,
-                    "codigo_postal": zip_postal_code,
-                    "id_ciudad": str(city_id)
-                }
-            }]
+        :return: dict
+        """
 
-        return json.dumps(suburb_data)
+        return {
+            "id_colonia": str(self.id_colonia),
+            "nombre_colonia": self.nombre_colonia,
+            "tipo_colonia": self.tipo_colonia,
+            "zona_colonia": self.zona_colonia,
+            "codigo_postal": self.codigo_postal,
+            "id_ciudad": str(self.colonia_id_ciudad)
+        }
 
     def __repr__(self):
         return "<ColoniaModel(id_colonia='%s', " \
@@ -14,7 +14,12 @@ from flask import Blueprint, json, request
 from flask_jwt_extended import jwt_required
 from db_controller.database_backend import *
 from .ColoniaModel import ColoniaModel
+from cache_controller.postal_code_index import lookup_suburbs_page
+from cache_controller.postal_code_bloom import postal_code_may_exist
+from cache_controller.filter_cache import get_filtered_rows
 from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from handler_controller.conditional_requests import catalog_conditional
+from cache_controller.response_cache import cached_response
 from handler_controller.messages import SuccessMsg, ErrorMsg
 from logger_controller.logger_control import *
 from utilities.Utility import *
@@ -28,6 +33,7 @@ logger = configure_logger('ws')
 
 @suburb_api.route('/', methods=['POST', 'GET'])
 @jwt_required
+@catalog_conditional
 def endpoint_manage_suburb_data():
     conn_db, session_db = init_db_connection()
 
@@ -63,17 +69,26 @@ def endpoint_manage_suburb_data():
             data = dict()
             suburb_on_db = None
 
-            data['offset'] = request.args.get('offset', 1)
-            data['limit'] = request.args.get('limit', 10)
+            # All the catalog as NDJSON, read from a server-side cursor
+            if 'ndjson' == request.args.get('stream'):
+                return HandlerResponse.response_stream(ColoniaModel.stream_all_suburbs(session_db))
+
+            # Keyset pagination, the cursor is the one returned on the previous page
+            try:
+                data['after_id'] = decode_page_cursor(request.args.get('cursor'))
+            except ValueError:
+                return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+            data['limit'] = request.args.get('limit', DEFAULT_PAGE_LIMIT)
 
             suburb_model = ColoniaModel(data)
 
             suburb_on_db = suburb_model.get_all_suburbs(session_db, data)
 
-            if not bool(suburb_on_db) or not suburb_on_db or "[]" == suburb_on_db:
+            if not suburb_on_db:
                 return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, suburb_on_db)
 
-            return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, suburb_on_db)
+            return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, suburb_on_db, data.get('next_cursor'))
 
         else:
             return HandlerResponse.request_not_found(ErrorMsg.ERROR_METHOD_NOT_ALLOWED)
@@ -81,8 +96,9 @@ def endpoint_manage_suburb_data():
 
 @suburb_api.route('/filter', methods=['GET'])
 @jwt_required
+@catalog_conditional
+@cached_response
 def get_looking_for_suburbs():
-    conn_db, session_db = init_db_connection()
 
     headers = request.headers
     auth = headers.get('Authorization')
@@ -117,11 +133,23 @@ def get_looking_for_suburbs():
 
                 filter_spec.append({'field': 'codigo_postal', 'op': '==', 'value': zip_postal_code})
 
-            suburb_model = ColoniaModel(data)
+            # The postal code that is definitely not on the catalog doesn't query the database
+            if 'codigo_postal' in data and not postal_code_may_exist(data['codigo_postal']):
+                return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, [])
+
+            # The exact postal code alone is answered from the in-memory index when it is built
+            if 'codigo_postal' in data and 'nombre_colonia' not in data:
+                suburb_on_db = lookup_suburbs_page(data['codigo_postal'], data['offset'], data['limit'])
+
+            def load_suburbs(session_db):
+                return ColoniaModel.get_suburbs_by_filters(session_db, data, filter_spec)
 
-            suburb_on_db = suburb_model.get_suburbs_by_filters(session_db, data, filter_spec)
+            # Same filters and page are answered from the cache until the TTL or a write of the catalog
+            if suburb_on_db is None:
+                suburb_on_db = get_filtered_rows(ColoniaModel.__tablename__, filter_spec, data['offset'], data['limit'],
+                                                 load_suburbs)
 
-            if not bool(suburb_on_db) or not suburb_on_db or "[]" == suburb_on_db:
+            if not suburb_on_db:
                 return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, suburb_on_db)
 
             return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, suburb_on_db)
@@ -25,8 +25,11 @@ __version__ = "1.21.H05.1 ($Rev: 2 $)"
 import json
 import logging
 from sqlalchemy_filters import apply_filters
-from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence
+from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence, Index
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import deferred
 from db_controller.database_backend import *
+from db_controller.catalog_events import mark_catalog_write
 from db_controller import mvc_exceptions as mvc_exc
 
 cfg_db = get_config_settings_db()
@@ -46,59 +49,27 @@ class EstadoModel(Base):
 
     __tablename__ = 'estado'
 
+    # Natural key of the State, conflict target of insert_data
+    __table_args__ = (
+        Index('ux_estado_clave_estado', 'clave_estado', unique=True),
+    )
+
     id_estado = Column('id_estado', Integer, ESTADO_ID_SEQ,
                        primary_key=True, server_default=ESTADO_ID_SEQ.next_value())
     nombre_estado = Column('nombre_estado', String, nullable=False, index=True)
-    clave_estado = Column('clave_estado', Integer, nullable=False, index=True)
+    clave_estado = Column('clave_estado', Integer, nullable=False)
+
+    # Hash of the content of the row on the SEPOMEX file, compared by the catalog sync. Deferred, so the
+    # lookups select only the columns of his covering indexes
+    row_hash = deferred(Column('row_hash', String(32), nullable=True))
 
     def __init__(self, data_driver):
         self.nombre_estado = data_driver.get('nombre_estado')
         self.clave_estado = data_driver.get('clave_estado')
 
-    def check_if_row_exists(self, session, data):
-        """
-        Validate if row exists on database from dictionary data
-
-        :param session: Session database object
-        :param data: Dictionary with data to make validation function
-        :return: row_exists: Object with boolean response from db
-        """
-
-        row_exists = None
-        id_estado = 0
-
-        try:
-            # for example to check if the insert on db is correct
-            row_estado = self.get_state_id(session, data)
-
-            if row_estado is not None:
-                id_estado = row_estado.id_estado
-            else:
-                id_estado = 0
-
-            logger.info('Estado Row object in DB: %s', str(id_estado))
-
-            row_exists = session.query(EstadoModel).filter(EstadoModel.id_estado == id_estado).scalar()
-
-            logger.info('Row to data: {}, Exists: %s'.format(data), str(row_exists))
-
-        except SQLAlchemyError as exc:
-            row_exists = None
-
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.IntegrityError(
-                'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_estado'),
-                                                                    str(str(exc.args) + ':' + str(exc.code)))
-            )
-        finally:
-            session.close()
-
-        return row_exists
-
     def insert_data(self, session, data):
         """
-        Function to insert new row on database
+        Function to insert new row on database, one statement with the natural key (clave_estado) as conflict target
 
         :param session: Session database object
         :param data: Dictionary to insert new the data containing on the db
@@ -107,163 +78,93 @@ class EstadoModel(Base):
 
         endpoint_response = None
 
-        if not self.check_if_row_exists(session, data):
-
-            try:
-
-                new_row = EstadoModel(data)
-
-                logger.info('New Row Estado: %s', str(new_row.nombre_estado))
-
-                session.add(new_row)
-
-                row_estado = self.get_state_id(session, data)
-
-                logger.info('Estado ID Inserted: %s', str(row_estado.id_estado))
-
-                session.flush()
-
-                data['id_estado'] = row_estado.id_estado
-
-                # check insert correct
-                row_inserted = self.get_one_state(session, data)
-
-                logger.info('Data Estado inserted: %s, Original Data: {}'.format(data), str(row_inserted))
-
-                if row_inserted:
-
-                    endpoint_response = json.dumps({
-                        "id_estado": row_inserted.id_estado,
-                        "nombre_estado": row_inserted.nombre_estado,
-                        "clave_estado": row_inserted.clave_estado
-                    })
-
-            except SQLAlchemyError as exc:
-                endpoint_response = None
-                session.rollback()
-
-                logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                 str(exc.code)))
-                raise mvc_exc.IntegrityError(
-                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_estado'),
-                                                                        str(str(exc.args) + ':' + str(exc.code)))
-                )
-            finally:
-                session.close()
-
-        return endpoint_response
-
-    @staticmethod
-    def get_state_id(session, data):
-        """
-        Get Estado object row registered on database to get the ID
+        try:
 
-        :param session: Database session object
-        :param data: Dictionary with data to get row
-        :return: row_estado: The row on database registered
-        """
+            estado_table = EstadoModel.__table__
 
-        row_estado = None
+            statement = insert(estado_table).values(nombre_estado=data.get('nombre_estado'),
+                                                    clave_estado=data.get('clave_estado')). \
+                on_conflict_do_nothing(index_elements=[estado_table.c.clave_estado]). \
+                returning(estado_table.c.id_estado, estado_table.c.nombre_estado, estado_table.c.clave_estado)
 
-        try:
+            row_inserted = session.execute(statement).first()
 
-            row_exists = session.query(EstadoModel).filter(EstadoModel.nombre_estado == data.get('nombre_estado')).\
-                filter(EstadoModel.clave_estado == data.get('clave_estado')).scalar()
+            logger.info('Data Estado inserted: %s, Original Data: {}'.format(data), str(row_inserted))
 
-            logger.info('Row Data Estado Exists on DB: %s', str(row_exists))
+            if row_inserted:
 
-            if row_exists:
+                data['id_estado'] = row_inserted.id_estado
 
-                row_estado = session.query(EstadoModel). \
-                    filter(EstadoModel.nombre_estado == data.get('nombre_estado')). \
-                    filter(EstadoModel.clave_estado == data.get('clave_estado')).one()
+                mark_catalog_write(session, EstadoModel.__tablename__, {'id_estado': row_inserted.id_estado})
 
-                logger.info('Row ID Estado data from database object: {}'.format(str(row_estado)))
+                endpoint_response = {
+                    "id_estado": row_inserted.id_estado,
+                    "nombre_estado": row_inserted.nombre_estado,
+                    "clave_estado": row_inserted.clave_estado
+                }
 
         except SQLAlchemyError as exc:
-
+            # The transaction of the request is rolled back by his teardown, see database_backend
             logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
                                                                                              str(exc.code)))
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_estado'), EstadoModel.__tablename__, str(str(exc.args) + ':' +
-                                                                              str(exc.code))
-                )
+            raise mvc_exc.IntegrityError(
+                'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_estado'),
+                                                                    str(str(exc.args) + ':' + str(exc.code)))
             )
 
-        finally:
-            session.close()
-
-        return row_estado
+        return endpoint_response
 
     @staticmethod
-    def get_one_state(session, data):
-        row = None
-
-        try:
-
-            row = session.query(EstadoModel).filter(EstadoModel.id_estado == data.get('id_estado')).\
-                filter(EstadoModel.clave_estado == data.get('clave_estado')).one()
-
-            if row:
-                logger.info('Data Estado on Db: %s',
-                            'Nombre Estado: {}, Clave Estado: {}'.format(row.nombre_estado,
-                                                                         row.clave_estado))
-
-        except SQLAlchemyError as exc:
-            row = None
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
+    def stream_all_states(session):
+        """
+        Iterate over all the States objects data registered on database through a server-side cursor,
+        the rows are fetched by batches of STREAM_BATCH_SIZE so the memory doesn't grow with the table.
 
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_estado'), EstadoModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
+        :param session: Database session
+        :return: generator of dict
+        """
 
-        finally:
-            session.close()
+        query = session.query(EstadoModel).order_by(EstadoModel.id_estado). \
+            execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
 
-        return row
+        for row in query:
+            yield {
+                "State": row.to_dict()
+            }
 
     @staticmethod
     def get_all_states(session, data):
         """
-        Get all States objects data registered on database.
+        Get a page of States objects data registered on database, sought with the id after the last row
+        of the previous page (keyset pagination). The cursor of the next page is set on data['next_cursor'].
 
         :param data: Dictionary contains relevant data to filter Query on resultSet DB
         :param session: Database session
-        :return: json.dumps dict
+        :return: list of dict
         """
 
-        all_states = None
         states_data = []
 
-        page = None
-        per_page = None
+        after_id = data.get('after_id', 0)
+        limit = get_page_limit(data.get('limit'))
 
-        all_states = session.query(EstadoModel).all()
+        # One row more than the page to know if there is a next page
+        all_rows = session.query(EstadoModel).filter(EstadoModel.id_estado > after_id). \
+            order_by(EstadoModel.id_estado).limit(limit + 1).all()
 
-        if 'offset' in data.keys() and 'limit' in data.keys():
-            page = data.get('offset')
-            per_page = data('limit')
+        data['next_cursor'] = None
 
-            all_states = session.query(EstadoModel).paginate(page=page, per_page=per_page, error_out=False).all()
+        if len(all_rows) > limit:
+            all_rows = all_rows[:limit]
 
-        for state in all_states:
-            state_id = state.id_estado
-            state_name = state.nombre_estado
-            state_key = state.clave_estado
+            data['next_cursor'] = encode_page_cursor(all_rows[-1].id_estado)
 
+        for row in all_rows:
             states_data += [{
-                "State": {
-                    "id_estado": str(state_id),
-                    "nombre_estado": state_name,
-                    "clave_estado": state_key
-                }
+                "State": row.to_dict()
             }]
 
-        return json.dumps(states_data)
+        return states_data
 
     @staticmethod
     def get_states_by_filters(session, data, filter_spec):
@@ -273,44 +174,41 @@ class EstadoModel(Base):
         :param session: Database session
         :param data: Dictionary contains relevant data to filter Query on resultSet DB
         :param filter_spec: List of options defined by user request
-        :return: json.dumps dict
+        :return: list of dict
         """
 
-        page = 1
-        per_page = 10
-
-        query_result = None
         states_data = []
 
-        if 'offset' in data.keys() and 'limit' in data.keys():
-            page = data.get('offset')
-            per_page = data('limit')
-
-        query_result = session.query(EstadoModel).all()
+        page = get_page_number(data.get('offset'))
+        per_page = get_page_limit(data.get('limit'))
 
-        query = session.query(EstadoModel)
+        query = session.query(EstadoModel).order_by(EstadoModel.id_estado)
 
         filtered_query = apply_filters(query, filter_spec)
 
-        if filter_spec is not None and filtered_query is not None:
-            query_result = filtered_query.paginate(page=page, per_page=per_page, error_out=False).all()
+        query_result = filtered_query.offset((page - 1) * per_page).limit(per_page).all()
 
         logger.info('Query filtered resultSet: %s', str(query_result))
 
-        for state in query_result:
-            state_id = state.id_estado
-            state_name = state.nombre_estado
-            state_key = state.clave_estado
-
+        for row in query_result:
             states_data += [{
-                "State": {
-                    "id_estado": str(state_id),
-                    "nombre_estado": state_name,
-                    "clave_estado": state_key
-                }
+                "State": row.to_dict()
             }]
 
-        return json.dumps(states_data)
+        return states_data
+
+    def to_dict(self):
+        """
+        Get the data of the State as dictionary to serialize on the responses.
+
+        :return: dict
+        """
+
+        return {
+            "id_estado": str(self.id_estado),
+            "nombre_estado": self.nombre_estado,
+            "clave_estado": self.clave_estado
+        }
 
     def __repr__(self):
         return "<EstadoModel(id_estado='%s', " \
@@ -14,7 +14,10 @@ from flask import Blueprint, json, request
 from flask_jwt_extended import JWTManager, jwt_required
 from db_controller.database_backend import *
 from .EstadoModel import EstadoModel
+from cache_controller.filter_cache import get_filtered_rows
+from cache_controller.pinned_tables import pinned_states
 from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from handler_controller.conditional_requests import catalog_conditional
 from handler_controller.messages import SuccessMsg, ErrorMsg
 from logger_controller.logger_control import *
 from utilities.Utility import *
@@ -27,8 +30,8 @@ logger = configure_logger('ws')
 
 @state_api.route('/', methods=['POST', 'GET'])
 @jwt_required
+@catalog_conditional
 def endpoint_manage_state_data():
-    conn_db, session_db = init_db_connection()
 
     headers = request.headers
     auth = headers.get('Authorization')
@@ -38,6 +41,7 @@ def endpoint_manage_state_data():
     else:
 
         if request.method == 'POST':
+            conn_db, session_db = init_db_connection()
 
             data = request.get_json(force=True)
 
@@ -61,17 +65,35 @@ def endpoint_manage_state_data():
             data = dict()
             states_on_db = None
 
-            data['offset'] = request.args.get('offset', 1)
-            data['limit'] = request.args.get('limit', 10)
+            # All the catalog as NDJSON, from memory or read from a server-side cursor
+            if 'ndjson' == request.args.get('stream'):
+                if cfg_app.pinned_tables_enabled:
+                    return HandlerResponse.response_stream(pinned_states.get_all())
 
-            state_model = EstadoModel(data)
+                conn_db, session_db = init_db_connection()
+
+                return HandlerResponse.response_stream(EstadoModel.stream_all_states(session_db))
 
-            states_on_db = state_model.get_all_states(session_db, data)
+            # Keyset pagination, the cursor is the one returned on the previous page
+            try:
+                data['after_id'] = decode_page_cursor(request.args.get('cursor'))
+            except ValueError:
+                return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-            if not bool(states_on_db) or not states_on_db or "[]" == states_on_db:
+            data['limit'] = request.args.get('limit', DEFAULT_PAGE_LIMIT)
+
+            # The table is pinned on memory, the database is read only if it is disabled
+            if cfg_app.pinned_tables_enabled:
+                states_on_db = pinned_states.get_page(data)
+            else:
+                conn_db, session_db = init_db_connection()
+
+                states_on_db = EstadoModel.get_all_states(session_db, data)
+
+            if not states_on_db:
                 return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, states_on_db)
 
-            return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, states_on_db)
+            return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, states_on_db, data.get('next_cursor'))
 
         else:
             return HandlerResponse.request_not_found(ErrorMsg.ERROR_METHOD_NOT_ALLOWED)
@@ -79,8 +101,8 @@ def endpoint_manage_state_data():
 
 @state_api.route('/filter', methods=['GET'])
 @jwt_required
+@catalog_conditional
 def get_looking_for_state():
-    conn_db, session_db = init_db_connection()
 
     headers = request.headers
     auth = headers.get('Authorization')
@@ -116,11 +138,18 @@ def get_looking_for_state():
 
                 filter_spec.append({'field': 'clave_estado', 'op': '==', 'value': state_key})
 
-            state_model = EstadoModel(data)
+            def load_states(session_db):
+                return EstadoModel.get_states_by_filters(session_db, data, filter_spec)
 
-            state_on_db = state_model.get_states_by_filters(session_db, data, filter_spec)
+            # The table is pinned on memory, otherwise the same filters and page are answered from the cache
+            # until the TTL or a write of the catalog
+            if cfg_app.pinned_tables_enabled:
+                state_on_db = pinned_states.get_by_filters(data, filter_spec)
+            else:
+                state_on_db = get_filtered_rows(EstadoModel.__tablename__, filter_spec, data['offset'], data['limit'],
+                                                load_states)
 
-            if not bool(state_on_db) or not state_on_db or "[]" == state_on_db:
+            if not state_on_db:
                 return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, state_on_db)
 
             return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, state_on_db)
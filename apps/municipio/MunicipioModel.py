@@ -28,8 +28,11 @@ import json
 import logging
 from apps.estado.EstadoModel import EstadoModel
 from sqlalchemy_filters import apply_filters
-from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence
+from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence, Index
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import deferred
 from db_controller.database_backend import *
+from db_controller.catalog_events import mark_catalog_write
 from db_controller import mvc_exceptions as mvc_exc
 
 cfg_db = get_config_settings_db()
@@ -47,18 +50,26 @@ class MunicipioModel(Base):
 
     __tablename__ = 'municipio'
 
+    # Natural key of the Town, conflict target of insert_data
+    __table_args__ = (
+        Index('ux_municipio_id_estado_clave_municipio', 'id_estado', 'clave_municipio', unique=True),
+    )
+
     id_municipio = Column('id_municipio', Integer, MUNICIPIO_ID_SEQ,
                           primary_key=True, server_default=MUNICIPIO_ID_SEQ.next_value())
     nombre_municipio = Column('nombre_municipio', String, nullable=False)
     clave_municipio = Column('clave_municipio', Integer, nullable=False, index=True)
 
+    # Hash of the content of the row on the SEPOMEX file, compared by the catalog sync. Deferred, so the
+    # lookups select only the columns of his covering indexes
+    row_hash = deferred(Column('row_hash', String(32), nullable=True))
+
     ciudad_id_estado = Column(
         'id_estado',
         Integer,
-        ForeignKey('EstadoModel.id_estado', onupdate='CASCADE', ondelete='CASCADE'),
-        nullable=True,
-        unique=True
-        # no need to add index=True, all FKs have indexes
+        ForeignKey('estado.id_estado', onupdate='CASCADE', ondelete='CASCADE'),
+        nullable=True
+        # no need to add index=True, the natural key index starts with id_estado
     )
 
     id_estado = relationship(EstadoModel,
@@ -69,50 +80,10 @@ class MunicipioModel(Base):
         self.clave_municipio = data_town.get('clave_municipio')
         self.ciudad_id_estado = data_town.get('id_estado')
 
-    def check_if_row_exists(self, session, data):
-        """
-        Validate if row exists on database from dictionary data
-
-        :param session: Session database object
-        :param data: Dictionary with data to make validation function
-        :return: row_exists: Object with boolean response from db
-        """
-
-        row_exists = None
-        id_town = 0
-
-        try:
-            # for example to check if the insert on db is correct
-            row_town = self.get_town_id(session, data)
-
-            if row_town is not None:
-                id_town = row_town.id_municipio
-            else:
-                id_town = 0
-
-            logger.info('Municipio Row object in DB: %s', str(id_town))
-
-            row_exists = session.query(MunicipioModel).filter(MunicipioModel.id_municipio == id_town).scalar()
-
-            logger.info('Row to data: {}, Exists: %s'.format(data), str(row_exists))
-
-        except SQLAlchemyError as exc:
-            row_exists = None
-
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.IntegrityError(
-                'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_municipio'),
-                                                                    str(str(exc.args) + ':' + str(exc.code)))
-            )
-        finally:
-            session.close()
-
-        return row_exists
-
     def insert_data(self, session, data):
         """
-        Function to insert new row on database
+        Function to insert new row on database, one statement with the natural key (id_estado, clave_municipio)
+        as conflict target
 
         :param session: Session database object
         :param data: Dictionary to insert new the data containing on the db
@@ -121,168 +92,97 @@ class MunicipioModel(Base):
 
         endpoint_response = None
 
-        if not self.check_if_row_exists(session, data):
-
-            try:
-
-                new_row = MunicipioModel(data)
-
-                logger.info('New Row Municipio: %s', str(new_row.nombre_municipio))
-
-                session.add(new_row)
-
-                row_town = self.get_town_id(session, data)
-
-                logger.info('Municipio ID Inserted: %s', str(row_town.id_municipio))
-
-                session.flush()
-
-                data['id_municipio'] = row_town.id_municipio
-
-                # check insert correct
-                row_inserted = self.get_one_town(session, data)
-
-                logger.info('Data Municipio inserted: %s, Original Data: {}'.format(data), str(row_inserted))
-
-                if row_inserted:
-                    endpoint_response = json.dumps({
-                        "id_municipio": row_inserted.id_municipio,
-                        "nombre_municipio": row_inserted.nombre_municipio,
-                        "clave_municipio": row_inserted.clave_municipio,
-                        "clave_estado": row_inserted.ciudad_id_estado
-                    })
-
-            except SQLAlchemyError as exc:
-                endpoint_response = None
-                session.rollback()
-
-                logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                 str(exc.code)))
-                raise mvc_exc.IntegrityError(
-                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_municipio'),
-                                                                        str(str(exc.args) + ':' + str(exc.code)))
-                )
-            finally:
-                session.close()
-
-        return endpoint_response
-
-    @staticmethod
-    def get_town_id(session, data):
-        """
-        Get Municipio object row registered on database to get the ID
+        try:
 
-        :param session: Database session object
-        :param data: Dictionary with data to get row
-        :return: row_town: The row on database registered
-        """
+            municipio_table = MunicipioModel.__table__
 
-        row_town = None
+            statement = insert(municipio_table).values(nombre_municipio=data.get('nombre_municipio'),
+                                                       clave_municipio=data.get('clave_municipio'),
+                                                       id_estado=data.get('id_estado')). \
+                on_conflict_do_nothing(index_elements=[municipio_table.c.id_estado,
+                                                       municipio_table.c.clave_municipio]). \
+                returning(municipio_table.c.id_municipio, municipio_table.c.nombre_municipio,
+                          municipio_table.c.clave_municipio, municipio_table.c.id_estado)
 
-        try:
+            row_inserted = session.execute(statement).first()
 
-            row_exists = session.query(MunicipioModel).\
-                filter(MunicipioModel.nombre_municipio == data.get('nombre_municipio')).\
-                filter(MunicipioModel.clave_municipio == data.get('clave_municipio')).scalar()
+            logger.info('Data Municipio inserted: %s, Original Data: {}'.format(data), str(row_inserted))
 
-            logger.info('Row Data Municipio Exists on DB: %s', str(row_exists))
+            if row_inserted:
 
-            if row_exists:
+                data['id_municipio'] = row_inserted.id_municipio
 
-                row_town = session.query(MunicipioModel). \
-                    filter(MunicipioModel.nombre_municipio == data.get('nombre_municipio')). \
-                    filter(MunicipioModel.clave_municipio == data.get('clave_municipio')).one()
+                mark_catalog_write(session, MunicipioModel.__tablename__, {'id_municipio': row_inserted.id_municipio})
 
-                logger.info('Row ID Municipio data from database object: {}'.format(str(row_town)))
+                endpoint_response = {
+                    "id_municipio": row_inserted.id_municipio,
+                    "nombre_municipio": row_inserted.nombre_municipio,
+                    "clave_municipio": row_inserted.clave_municipio,
+                    "clave_estado": row_inserted.id_estado
+                }
 
         except SQLAlchemyError as exc:
-
+            # The transaction of the request is rolled back by his teardown, see database_backend
             logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
                                                                                              str(exc.code)))
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_municipio'), MunicipioModel.__tablename__, str(str(exc.args) + ':' +
-                                                                                    str(exc.code))
-                )
+            raise mvc_exc.IntegrityError(
+                'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_municipio'),
+                                                                    str(str(exc.args) + ':' + str(exc.code)))
             )
 
-        finally:
-            session.close()
-
-        return row_town
+        return endpoint_response
 
     @staticmethod
-    def get_one_town(session, data):
-        row = None
-
-        try:
-
-            row = session.query(MunicipioModel).\
-                filter(MunicipioModel.nombre_municipio == data.get('nombre_municipio')).\
-                filter(MunicipioModel.clave_municipio == data.get('clave_municipio')).one()
-
-            if row:
-                logger.info('Data Municipio on Db: %s',
-                            'Nombre: {}, Clave: {}, Estado: {}'.format(row.nombre_municipio,
-                                                                       row.clave_municipio,
-                                                                       row.ciudad_id_estado))
-
-        except SQLAlchemyError as exc:
-            row = None
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
+    def stream_all_towns(session):
+        """
+        Iterate over all the Municipios objects data registered on database through a server-side cursor,
+        the rows are fetched by batches of STREAM_BATCH_SIZE so the memory doesn't grow with the table.
 
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_municipio'), MunicipioModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
+        :param session: Database session
+        :return: generator of dict
+        """
 
-        finally:
-            session.close()
+        query = session.query(MunicipioModel).order_by(MunicipioModel.id_municipio). \
+            execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
 
-        return row
+        for row in query:
+            yield {
+                "Town": row.to_dict()
+            }
 
     @staticmethod
     def get_all_towns(session, data):
         """
-        Get all Municipios objects data registered on database.
+        Get a page of Municipios objects data registered on database, sought with the id after the last row
+        of the previous page (keyset pagination). The cursor of the next page is set on data['next_cursor'].
 
         :param data: Dictionary contains relevant data to filter Query on resultSet DB
         :param session: Database session
-        :return: json.dumps dict
+        :return: list of dict
         """
 
-        all_towns = None
         town_data = []
 
-        page = None
-        per_page = None
+        after_id = data.get('after_id', 0)
+        limit = get_page_limit(data.get('limit'))
 
-        all_towns = session.query(MunicipioModel).all()
+        # One row more than the page to know if there is a next page
+        all_rows = session.query(MunicipioModel).filter(MunicipioModel.id_municipio > after_id). \
+            order_by(MunicipioModel.id_municipio).limit(limit + 1).all()
 
-        if 'offset' in data.keys() and 'limit' in data.keys():
-            page = data.get('offset')
-            per_page = data('limit')
+        data['next_cursor'] = None
 
-            all_towns = session.query(MunicipioModel).paginate(page=page, per_page=per_page, error_out=False).all()
+        if len(all_rows) > limit:
+            all_rows = all_rows[:limit]
 
-        for town in all_towns:
-            town_id = town.estado_id
-            town_name = town.nombre_municipio
-            town_key = town.clave_municipio
-            town_id_state = town.ciudad_id_estado
+            data['next_cursor'] = encode_page_cursor(all_rows[-1].id_municipio)
 
+        for row in all_rows:
             town_data += [{
-                "Town": {
-                    "id_municipio": str(town_id),
-                    "nombre_municipio": town_name,
-                    "clave_municipio": town_key,
-                    "clave_estado": town_id_state
-                }
+                "Town": row.to_dict()
             }]
 
-        return json.dumps(town_data)
+        return town_data
 
     @staticmethod
     def get_towns_by_filters(session, data, filter_spec):
@@ -292,46 +192,42 @@ class MunicipioModel(Base):
         :param session: Database session
         :param data: Dictionary contains relevant data to filter Query on resultSet DB
         :param filter_spec: List of options defined by user request
-        :return: json.dumps dict
+        :return: list of dict
         """
 
-        page = 1
-        per_page = 10
-
-        query_result = None
         town_data = []
 
-        if 'offset' in data.keys() and 'limit' in data.keys():
-            page = data.get('offset')
-            per_page = data('limit')
-
-        query_result = session.query(MunicipioModel).all()
+        page = get_page_number(data.get('offset'))
+        per_page = get_page_limit(data.get('limit'))
 
-        query = session.query(MunicipioModel)
+        query = session.query(MunicipioModel).order_by(MunicipioModel.id_municipio)
 
         filtered_query = apply_filters(query, filter_spec)
 
-        if filter_spec is not None and filtered_query is not None:
-            query_result = filtered_query.paginate(page=page, per_page=per_page, error_out=False).all()
+        query_result = filtered_query.offset((page - 1) * per_page).limit(per_page).all()
 
         logger.info('Query filtered resultSet: %s', str(query_result))
 
-        for town in query_result:
-            town_id = town.estado_id
-            town_name = town.nombre_municipio
-            town_key = town.clave_municipio
-            town_id_state = town.ciudad_id_estado
-
+        for row in query_result:
             town_data += [{
-                "Town": {
-                    "id_municipio": str(town_id),
-                    "nombre_municipio": town_name,
-                    "clave_municipio": town_key,
-                    "clave_estado": town_id_state
-                }
+                "Town": row.to_dict()
             }]
 
-        return json.dumps(town_data)
+        return town_data
+
+    def to_dict(self):
+        """
+        Get the data of the Town as dictionary to serialize on the responses.
+
+        :return: dict
+        """
+
+        return {
+            "id_municipio": str(self.id_municipio),
+            "nombre_municipio": self.nombre_municipio,
+            "clave_municipio": self.clave_municipio,
+            "clave_estado": self.ciudad_id_estado
+        }
 
     def __repr__(self):
         return "<MunicipioModel(id_municipio='%s', " \
@@ -14,7 +14,10 @@ from flask import Blueprint, json, request
 from flask_jwt_extended import jwt_required
 from db_controller.database_backend import *
 from .MunicipioModel import MunicipioModel
+from cache_controller.filter_cache import get_filtered_rows
+from cache_controller.pinned_tables import pinned_towns
 from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from handler_controller.conditional_requests import catalog_conditional
 from handler_controller.messages import SuccessMsg, ErrorMsg
 from logger_controller.logger_control import *
 from utilities.Utility import *
@@ -28,8 +31,8 @@ logger = configure_logger('ws')
 
 @town_api.route('/', methods=['POST', 'GET'])
 @jwt_required
+@catalog_conditional
 def endpoint_manage_town_data():
-    conn_db, session_db = init_db_connection()
 
     headers = request.headers
     auth = headers.get('Authorization')
@@ -39,6 +42,7 @@ def endpoint_manage_town_data():
     else:
 
         if request.method == 'POST':
+            conn_db, session_db = init_db_connection()
 
             data = request.get_json(force=True)
 
@@ -63,17 +67,35 @@ def endpoint_manage_town_data():
             data = dict()
             towns_on_db = None
 
-            data['offset'] = request.args.get('offset', 1)
-            data['limit'] = request.args.get('limit', 10)
+            # All the catalog as NDJSON, from memory or read from a server-side cursor
+            if 'ndjson' == request.args.get('stream'):
+                if cfg_app.pinned_tables_enabled:
+                    return HandlerResponse.response_stream(pinned_towns.get_all())
 
-            town_model = MunicipioModel(data)
+                conn_db, session_db = init_db_connection()
+
+                return HandlerResponse.response_stream(MunicipioModel.stream_all_towns(session_db))
 
-            towns_on_db = town_model.get_all_towns(session_db, data)
+            # Keyset pagination, the cursor is the one returned on the previous page
+            try:
+                data['after_id'] = decode_page_cursor(request.args.get('cursor'))
+            except ValueError:
+                return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-            if not bool(towns_on_db) or not towns_on_db or "[]" == towns_on_db:
+            data['limit'] = request.args.get('limit', DEFAULT_PAGE_LIMIT)
+
+            # The table is pinned on memory, the database is read only if it is disabled
+            if cfg_app.pinned_tables_enabled:
+                towns_on_db = pinned_towns.get_page(data)
+            else:
+                conn_db, session_db = init_db_connection()
+
+                towns_on_db = MunicipioModel.get_all_towns(session_db, data)
+
+            if not towns_on_db:
                 return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, towns_on_db)
 
-            return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, towns_on_db)
+            return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, towns_on_db, data.get('next_cursor'))
 
         else:
             return HandlerResponse.request_not_found(ErrorMsg.ERROR_METHOD_NOT_ALLOWED)
@@ -81,8 +103,8 @@ def endpoint_manage_town_data():
 
 @town_api.route('/filter', methods=['GET'])
 @jwt_required
+@catalog_conditional
 def get_looking_for_towns():
-    conn_db, session_db = init_db_connection()
 
     headers = request.headers
     auth = headers.get('Authorization')
@@ -118,11 +140,18 @@ def get_looking_for_towns():
 
                 filter_spec.append({'field': 'clave_municipio', 'op': '==', 'value': town_key})
 
-            town_model = MunicipioModel(data)
+            def load_towns(session_db):
+                return MunicipioModel.get_towns_by_filters(session_db, data, filter_spec)
 
-            town_on_db = town_model.get_towns_by_filters(session_db, data, filter_spec)
+            # The table is pinned on memory, otherwise the same filters and page are answered from the cache
+            # until the TTL or a write of the catalog
+            if cfg_app.pinned_tables_enabled:
+                town_on_db = pinned_towns.get_by_filters(data, filter_spec)
+            else:
+                town_on_db = get_filtered_rows(MunicipioModel.__tablename__, filter_spec, data['offset'], data['limit'],
+                                               load_towns)
 
-            if not bool(town_on_db) or not town_on_db or "[]" == town_on_db:
+            if not town_on_db:
                 return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, town_on_db)
 
             return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, town_on_db)
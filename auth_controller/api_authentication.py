@@ -56,15 +56,15 @@ def user_registration(session, data):
             log.info('User inserted/updated in database: %s',
                      ' User_Name: "{}", Password_Hash: "{}" '.format(data.get('username'),
                                                                      password_hash))
-            response_login = json.dumps({
+            response_login = {
                 'message_login': 'Logged in as {}'.format(data.get('username')),
                 'access_token': access_token,
                 'refresh_token': refresh_token,
                 'data': user_process_reponse
-            })
+            }
 
         else:
-            response_login = json.dumps({'message_login': 'Wrong credentials'})
+            response_login = {'message_login': 'Wrong credentials'}
 
     except SQLAlchemyError as error:
         raise mvc_exc.ConnectionError(
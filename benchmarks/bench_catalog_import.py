@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Benchmark of the parse of the SEPOMEX catalog file split on ranges of bytes.
+
+Parses the same file with 1 to max_workers processes and verifies the rows are the same for every
+number of processes. Only the parse and the merge of the ranges are measured, the load on the
+database is the same for all of them. Without a path a file like the official one is generated,
+with 32 estados and ~147k colonias.
+
+The wall time only shows the scaling on the CPUs of this box, so the phases of the parse are measured
+apart too: the work of the pool (parse and pickle of the rows) and the work of the parent (unpickle and
+merge), which bound the time on a box with one CPU by process.
+
+Usage:
+    python -m benchmarks.bench_catalog_import [path] [max_workers] [repeat]
+
+    An empty path generates the file, e.g. python -m benchmarks.bench_catalog_import "" 8
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+from db_controller.catalog_import import parse_sepomex_file, find_sepomex_header, split_sepomex_file, \
+    parse_partition, CatalogRows, SEPOMEX_ENCODING, SEPOMEX_CHUNKS_BY_WORKER
+
+SEPOMEX_NOTICE = 'El Catálogo Nacional de Códigos Postales, es elaborado por Correos de México.'
+
+SEPOMEX_HEADER = 'd_codigo|d_asenta|d_tipo_asenta|D_mnpio|d_estado|d_ciudad|d_CP|c_estado|c_oficina|c_CP|' \
+                 'c_tipo_asenta|c_mnpio|id_asenta_cpcons|d_zona|c_cve_ciudad'
+
+
+def write_sepomex_file(path, states=32, towns=60, cities=3, suburbs=26):
+    r"""
+    Write a file with the format of the official SEPOMEX file, the records are ordered by estado.
+
+    :param path: Path of the file to write.
+    :return records: Number of records written.
+    """
+
+    records = 0
+
+    with open(path, 'w', encoding=SEPOMEX_ENCODING, newline='') as sepomex_file:
+        sepomex_file.write(SEPOMEX_NOTICE + '\r\n' + SEPOMEX_HEADER + '\r\n')
+
+        for state in range(1, states + 1):
+            for town in range(1, towns + 1):
+                for city in range(cities):
+                    postal_code = '{:02d}{:03d}'.format(state, (town * cities + city) % 1000)
+
+                    for suburb in range(suburbs):
+                        sepomex_file.write('|'.join([
+                            postal_code, 'Colonia Núñez {}'.format(suburb), 'Colonia', 'Municipio {}'.format(town),
+                            'Estado {}'.format(state), 'Ciudad {}'.format(city) if city else '', postal_code,
+                            '{:02d}'.format(state), postal_code, '', '09', '{:03d}'.format(town),
+                            '{:04d}'.format(suburb), 'Urbano' if city else 'Rural', '{:02d}'.format(city) if city else ''
+                        ]) + '\r\n')
+
+                        records += 1
+
+    return records
+
+
+def measure_phases(path, chunks):
+    r"""
+    Time of the phases of the parse run one after the other on this process: the parse of the ranges and the
+    pickle of his rows run on the processes of the pool, the unpickle and the merge on the parent.
+
+    :param path: Path of the SEPOMEX file.
+    :param chunks: Number of ranges the file is split on.
+    :return phases: dict phase: seconds
+    """
+
+    phases = dict.fromkeys(('parse', 'pickle', 'unpickle', 'merge'), 0.0)
+
+    with open(path, 'rb') as sepomex_file:
+        header, data_start, newline = find_sepomex_header(sepomex_file)
+
+        ranges = split_sepomex_file(sepomex_file, data_start, os.path.getsize(path), chunks)
+
+    catalog_rows = CatalogRows()
+
+    for start, end in ranges:
+        started = time.perf_counter()
+        partition = parse_partition(path, header, newline, start, end)
+        parsed = time.perf_counter()
+        data = pickle.dumps(partition, protocol=pickle.HIGHEST_PROTOCOL)
+        pickled = time.perf_counter()
+        partition = pickle.loads(data)
+        unpickled = time.perf_counter()
+        catalog_rows.merge(partition)
+
+        phases['parse'] += parsed - started
+        phases['pickle'] += pickled - parsed
+        phases['unpickle'] += unpickled - pickled
+        phases['merge'] += time.perf_counter() - unpickled
+
+    return phases
+
+
+def main(path=None, max_workers=8, repeat=3):
+    generated = None
+
+    if not path:
+        generated = tempfile.NamedTemporaryFile(suffix='.txt', delete=False)
+        generated.close()
+
+        path = generated.name
+
+        print('SEPOMEX file generated with {} records'.format(write_sepomex_file(path)))
+
+    try:
+        cpus = os.cpu_count()
+
+        print('Parse of {} on {} CPUs, best of {}'.format(path, cpus, repeat))
+
+        baseline = None
+        expected_rows = None
+
+        for workers in range(1, max_workers + 1):
+            elapsed = []
+
+            for number in range(repeat):
+                started = time.perf_counter()
+
+                catalog_rows = parse_sepomex_file(path, workers)
+
+                elapsed.append(time.perf_counter() - started)
+
+            table_rows = [rows for model, sequence, columns, rows in catalog_rows.get_table_rows()]
+
+            if expected_rows is None:
+                expected_rows = table_rows
+                baseline = min(elapsed)
+
+            print('{:>2} workers {:>10.3f} s {:>8.2f}x   rows: {}   same ids: {}{}'.format(
+                workers, min(elapsed), baseline / min(elapsed), catalog_rows.get_stats(), table_rows == expected_rows,
+                '   (more processes than CPUs)' if workers > cpus else ''))
+
+        # The wall time above is only the scaling of this box, the phases bound the scaling on more CPUs
+        phases = min((measure_phases(path, max_workers * SEPOMEX_CHUNKS_BY_WORKER) for number in range(repeat)),
+                     key=lambda phases: sum(phases.values()))
+
+        parallel = phases['parse'] + phases['pickle']
+        serial = phases['unpickle'] + phases['merge']
+
+        print('Phases on {} ranges: parse {:.3f} s + pickle {:.3f} s on the pool, unpickle {:.3f} s + merge {:.3f} s '
+              'on the parent'.format(max_workers * SEPOMEX_CHUNKS_BY_WORKER, phases['parse'], phases['pickle'],
+                                     phases['unpickle'], phases['merge']))
+
+        for workers in range(2, max_workers + 1):
+            # The parent merges while the pool parses, the slowest of both bounds the parse
+            bound = max(serial, parallel / workers)
+
+            print('{:>2} workers bound by the phases {:>10.3f} s {:>8.2f}x   (a CPU by worker and the parent)'.format(
+                workers, bound, baseline / bound))
+
+    finally:
+        if generated is not None:
+            os.remove(generated.name)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None, *[int(arg) for arg in sys.argv[2:4]])
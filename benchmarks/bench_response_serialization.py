@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Benchmark of the serialization of a listing response.
+
+Compares the previous path of the API (the model json.dumps the rows, ResponsesHandler json.loads them
+back and jsonify encodes them again) against the response serialized only once.
+
+Usage:
+    python -m benchmarks.bench_response_serialization [rows] [repeat]
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+import sys
+import timeit
+from flask import Flask, jsonify
+from handler_controller.ResponsesHandler import ResponsesHandler
+
+MESSAGE = "Registro obtenido correctamente"
+
+
+def build_rows(rows_number):
+    r"""
+    Build the rows of a listing of Colonias like the one returned by ColoniaModel.get_all_suburbs.
+
+    :param rows_number: Number of rows of the listing.
+    :return rows: list of dict
+    """
+
+    return [{
+        "Suburb": {
+            "id_colonia": str(row_id),
+            "nombre_colonia": "Colonia {}".format(row_id),
+            "tipo_colonia": "Colonia",
+            "zona_colonia": "Urbano",
+            "codigo_postal": "{:05d}".format(row_id % 99999),
+            "id_ciudad": str(row_id % 700)
+        }
+    } for row_id in range(1, rows_number + 1)]
+
+
+def serialize_three_passes(rows):
+    data = json.dumps(rows)
+
+    data_msg = json.loads(data)
+
+    return jsonify({'message': MESSAGE, 'data': data_msg}).get_data()
+
+
+def serialize_once(rows):
+    resp, status_code = ResponsesHandler.response_success(MESSAGE, rows)
+
+    return resp.get_data()
+
+
+def serialize_pre_encoded(encoded_rows):
+    resp, status_code = ResponsesHandler.response_success(MESSAGE, encoded_rows)
+
+    return resp.get_data()
+
+
+def main(rows_number=10000, repeat=20):
+    app = Flask(__name__)
+
+    rows = build_rows(rows_number)
+    encoded_rows = json.dumps(rows).encode('utf-8')
+
+    with app.app_context():
+
+        results = [
+            ('json.dumps + json.loads + jsonify', timeit.timeit(lambda: serialize_three_passes(rows), number=repeat)),
+            ('jsonify once', timeit.timeit(lambda: serialize_once(rows), number=repeat)),
+            ('pre-encoded bytes', timeit.timeit(lambda: serialize_pre_encoded(encoded_rows), number=repeat)),
+        ]
+
+    print('Response of {} rows, {} repetitions'.format(rows_number, repeat))
+
+    baseline = results[0][1]
+
+    for name, elapsed in results:
+        print('{:<40} {:>10.2f} ms/response {:>8.2f}x'.format(name, elapsed * 1000 / repeat, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
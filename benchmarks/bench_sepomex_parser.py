@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Benchmark of the reader of the SEPOMEX catalog file.
+
+Compares the first reader of the importer (the file opened as latin-1 text, iterated by lines, every field
+stripped) against the block reader of the importer (blocks of SEPOMEX_READ_BLOCK bytes decoded at once and
+split on lines). Every reader runs on his own process so the peak RSS is measured alone:
+ - records: only the records are read.
+ - rows: the records are normalized to the rows of the catalog (CatalogRows).
+
+Usage:
+    python -m benchmarks.bench_sepomex_parser [path] [repeat]
+
+    An empty path generates the file, e.g. python -m benchmarks.bench_sepomex_parser "" 3
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from db_controller.catalog_import import find_sepomex_header, read_sepomex_records, build_catalog_rows, \
+    SEPOMEX_ENCODING, SEPOMEX_DELIMITER, SEPOMEX_HEADER_START, SEPOMEX_COLUMNS
+from benchmarks.bench_catalog_import import write_sepomex_file
+
+READERS = ('text', 'block')
+MODES = ('records', 'rows')
+
+
+def read_text_records(path):
+    r"""
+    First reader of the importer, every line is decoded and split on str.
+
+    :param path: Path of the SEPOMEX file.
+    :return: generator of tuple with the values of SEPOMEX_COLUMNS.
+    """
+
+    positions = None
+
+    with open(path, 'r', encoding=SEPOMEX_ENCODING, newline='') as sepomex_file:
+        for line in sepomex_file:
+            values = line.rstrip('\r\n').split(SEPOMEX_DELIMITER)
+
+            if positions is None:
+                if values[0] == SEPOMEX_HEADER_START:
+                    positions = [values.index(column) for column in SEPOMEX_COLUMNS]
+
+                continue
+
+            if len(values) < len(positions):
+                continue
+
+            yield tuple(values[position].strip() for position in positions)
+
+
+def read_block_records(path):
+    r"""
+    Block reader of the importer over the whole file.
+
+    :param path: Path of the SEPOMEX file.
+    :return: generator of tuple with the values of SEPOMEX_COLUMNS.
+    """
+
+    with open(path, 'rb') as sepomex_file:
+        header, data_start, newline = find_sepomex_header(sepomex_file)
+
+        yield from read_sepomex_records(sepomex_file, header, newline, data_start, os.path.getsize(path))
+
+
+def get_peak_rss():
+    r"""
+    Peak RSS of this process in KB.
+    """
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_reader(reader, mode, path):
+    r"""
+    Run one reader on this process and print his time and peak RSS as JSON.
+    """
+
+    read_records = read_text_records if 'text' == reader else read_block_records
+
+    rss_before = get_peak_rss()
+    started = time.perf_counter()
+
+    if 'rows' == mode:
+        records = build_catalog_rows(read_records(path)).records
+    else:
+        records = sum(1 for record in read_records(path))
+
+    print(json.dumps({
+        "seconds": time.perf_counter() - started,
+        "records": records,
+        "peak_rss_kb": get_peak_rss(),
+        "parse_rss_kb": get_peak_rss() - rss_before
+    }))
+
+
+def measure_reader(reader, mode, path, repeat):
+    results = []
+
+    for number in range(repeat):
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_sepomex_parser', '--run', reader, mode, path],
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    return min(results, key=lambda result: result['seconds'])
+
+
+def main(path=None, repeat=3):
+    generated = None
+
+    if not path:
+        generated = tempfile.NamedTemporaryFile(suffix='.txt', delete=False)
+        generated.close()
+
+        path = generated.name
+
+        print('SEPOMEX file generated with {} records'.format(write_sepomex_file(path)))
+
+    try:
+        print('Reader of {} ({:.1f} MB), best of {}'.format(path, os.path.getsize(path) / 1024 / 1024, repeat))
+
+        for mode in MODES:
+            baseline = None
+
+            for reader in READERS:
+                result = measure_reader(reader, mode, path, repeat)
+
+                if baseline is None:
+                    baseline = result['seconds']
+
+                print('{:<8} {:<5} {:>8.3f} s {:>6.2f}x   peak RSS {:>8.1f} MB   RSS of the parse {:>8.1f} MB'.format(
+                    mode, reader, result['seconds'], baseline / result['seconds'], result['peak_rss_kb'] / 1024,
+                    result['parse_rss_kb'] / 1024))
+
+    finally:
+        if generated is not None:
+            os.remove(generated.name)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and '--run' == sys.argv[1]:
+        run_reader(*sys.argv[2:5])
+    else:
+        main(sys.argv[1] if len(sys.argv) > 1 else None, *[int(arg) for arg in sys.argv[2:3]])
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Backends of the cache of the catalog lookups.
+
+Documentation:
+    - InProcessCacheBackend: LRU + TTL on the memory of the worker, bounded by bytes (CACHE_BACKEND=memory).
+    - RedisCacheBackend: shared by all the workers and nodes on a server speaking the Redis protocol
+      (CACHE_BACKEND=redis, REDIS_URL), requires the package redis.
+    - The values are serialized with CACHE_SERIALIZER (json or pickle), bytes are stored untouched. A value
+      of other format read from the server is a miss.
+    - Every namespace (entity of the catalog) has his own TTL and is invalidated apart, or only some of his keys
+      are evicted.
+    - After the TTL a value is still kept FILTER_CACHE_STALE_SECONDS as stale, to be responded while it is
+      refreshed on background (see background_refresher).
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import abc
+import hashlib
+import json
+import pickle
+import struct
+import threading
+import time
+from collections import OrderedDict
+from db_controller.database_backend import *
+from db_controller.catalog_events import get_current_catalog_version
+
+cfg_app = get_config_settings_app()
+
+# Keys by MGET on the pipeline of the multi-get
+REDIS_MGET_CHUNK = 500
+
+# Header of the values on Redis with the time until they are fresh
+FRESH_UNTIL_HEADER = struct.Struct('!d')
+
+
+class CacheSerializer:
+    r"""
+    Class to instance the serialization of the values of the cache, the first byte tags the format.
+    Only the values of the format configured and the raw bytes are loaded, a value of other format (e.g.
+    pickle on a server shared with a worker configured with json) is rejected and is a miss.
+    """
+
+    RAW = b'B'
+
+    formats = {
+        'json': (b'J', lambda value: json.dumps(value).encode('utf-8'), lambda data: json.loads(data.decode('utf-8'))),
+        'pickle': (b'P', lambda value: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads)
+    }
+
+    def __init__(self, format_name):
+        if format_name not in self.formats:
+            raise ValueError('Cache serializer not supported: {}'.format(format_name))
+
+        self.tag, self._dumps, self._loads = self.formats[format_name]
+
+    def dumps(self, value):
+        if isinstance(value, bytes):
+            return self.RAW + value
+
+        return self.tag + self._dumps(value)
+
+    def loads(self, data):
+        tag, payload = data[:1], data[1:]
+
+        if tag == self.RAW:
+            return payload
+
+        if tag == self.tag:
+            return self._loads(payload)
+
+        raise ValueError('Cache value with a format not configured: {}'.format(tag))
+
+
+class CacheBackend(abc.ABC):
+    r"""
+    Interface of the backends of the cache, the keys are tuples inside of a namespace.
+    The counters are shared by the threads of the worker, they are updated under _stats_lock.
+    """
+
+    def __init__(self, ttl_by_namespace, stale_seconds=0):
+        self.ttl_by_namespace = ttl_by_namespace
+        self.stale_seconds = stale_seconds
+
+        self._stats_lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @abc.abstractmethod
+    def generation(self, namespace):
+        r"""
+        Generation of the namespace, a value read before an invalidation is not saved after it.
+        """
+
+        raise NotImplementedError
+
+    def get(self, namespace, key):
+        r"""
+        Get a value, None if it is not on the cache.
+        """
+
+        return self.get_many(namespace, [key])[0]
+
+    def get_entry(self, namespace, key):
+        r"""
+        Get a value and if it is still fresh, (None, False) if it is not on the cache.
+        """
+
+        return self.get_entries(namespace, [key])[0]
+
+    def get_many(self, namespace, keys):
+        r"""
+        Get the values of many keys at once, None on the keys that are not on the cache.
+        """
+
+        return [value for value, is_fresh in self.get_entries(namespace, keys)]
+
+    @abc.abstractmethod
+    def get_entries(self, namespace, keys):
+        r"""
+        Get the values of many keys at once with a flag if they are fresh, stale values are still returned.
+        """
+
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def put(self, namespace, key, value, generation):
+        r"""
+        Save a value with the TTL of the namespace, if the namespace is still on the generation given.
+        """
+
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def invalidate(self, namespace):
+        r"""
+        Remove all the values of the namespace.
+        """
+
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def evict(self, namespace, keys):
+        r"""
+        Remove only the values of some keys of the namespace, a value read before it is not saved after it.
+        """
+
+        raise NotImplementedError
+
+    def count(self, entries):
+        hits = sum(1 for value, is_fresh in entries if value is not None)
+        stale_hits = sum(1 for value, is_fresh in entries if value is not None and not is_fresh)
+
+        with self._stats_lock:
+            self.hits += hits
+            self.stale_hits += stale_hits
+            self.misses += len(entries) - hits
+
+    def get_stats(self):
+
+        with self._stats_lock:
+            requests = self.hits + self.misses
+
+            return {
+                "backend": self.__class__.__name__,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+                "ttl_by_namespace": dict(self.ttl_by_namespace),
+                "stale_seconds": self.stale_seconds
+            }
+
+
+class InProcessCacheBackend(CacheBackend):
+    r"""
+    Class to instance a cache on the memory of the worker bounded by bytes, with LRU eviction and a TTL by namespace.
+    """
+
+    def __init__(self, ttl_by_namespace, max_bytes, stale_seconds=0):
+        super().__init__(ttl_by_namespace, stale_seconds)
+
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+        self.current_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def get_entries(self, namespace, keys):
+
+        entries = []
+        now = time.monotonic()
+
+        with self._lock:
+            for key in keys:
+                entry_key = (namespace, key)
+                entry = self._entries.get(entry_key)
+
+                if entry is not None and entry[0] <= now:
+                    self._remove(entry_key)
+                    self.expirations += 1
+                    entry = None
+
+                if entry is not None:
+                    self._entries.move_to_end(entry_key)
+
+                    entries.append((entry[3], now < entry[1]))
+                else:
+                    entries.append((None, False))
+
+            self.count(entries)
+
+        return entries
+
+    def put(self, namespace, key, value, generation):
+
+        # Bytes of the value as it is responded
+        size = len(value) if isinstance(value, bytes) else len(json.dumps(value, default=str))
+
+        if size > self.max_bytes:
+            return
+
+        entry_key = (namespace, key)
+
+        with self._lock:
+
+            if generation != self.generation(namespace):
+                return
+
+            if entry_key in self._entries:
+                self._remove(entry_key)
+
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            fresh_until = time.monotonic() + self.ttl_by_namespace.get(namespace, 0)
+
+            # (expires_at, fresh_until, size, value)
+            self._entries[entry_key] = (fresh_until + self.stale_seconds, fresh_until, size, value)
+            self.current_bytes += size
+
+    def invalidate(self, namespace):
+
+        with self._lock:
+            self._generations[namespace] = self.generation(namespace) + 1
+
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == namespace]:
+                self._remove(entry_key)
+
+            self.invalidations += 1
+
+    def evict(self, namespace, keys):
+
+        with self._lock:
+            self._generations[namespace] = self.generation(namespace) + 1
+
+            for key in keys:
+                if (namespace, key) in self._entries:
+                    self._remove((namespace, key))
+
+            self.invalidations += 1
+
+    def export_entries(self):
+        r"""
+        Entries not expired to dump them on a snapshot, the least recently used first.
+
+        :return entries: list of (namespace, key, value)
+        """
+
+        now = time.monotonic()
+
+        with self._lock:
+            return [(namespace, key, entry[3]) for (namespace, key), entry in self._entries.items() if entry[0] > now]
+
+    def import_entries(self, entries):
+        r"""
+        Save the entries of a snapshot, fresh as if they were read now.
+
+        :param entries: list of (namespace, key, value)
+        """
+
+        for namespace, key, value in entries:
+            self.put(namespace, key, value, self.generation(namespace))
+
+    def _remove(self, entry_key):
+        expires_at, fresh_until, size, value = self._entries.pop(entry_key)
+        self.current_bytes -= size
+
+    def get_stats(self):
+
+        with self._lock:
+            stats = super().get_stats()
+
+            stats.update({
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            })
+
+        return stats
+
+
+class RedisCacheBackend(CacheBackend):
+    r"""
+    Class to instance a cache shared by the workers on a server speaking the Redis protocol.
+
+    The keys carry the catalog version, so a write of the catalog leaves the values of the previous version
+    unreachable until his TTL, and a value read while the catalog changed is saved under the old version.
+    That is why invalidate and evict don't delete keys on the server.
+    The errors of the server are logged and answered as misses, the API keeps working with the database.
+    """
+
+    def __init__(self, ttl_by_namespace, redis_url, serializer, key_prefix='sepomex', stale_seconds=0):
+        super().__init__(ttl_by_namespace, stale_seconds)
+
+        # Optional dependency, only required when this backend is configured
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self.serializer = serializer
+        self.key_prefix = key_prefix
+        self.errors = 0
+
+    def generation(self, namespace):
+        version, updated_date = get_current_catalog_version(cfg_app.catalog_version_max_age)
+
+        return version
+
+    def make_key(self, namespace, key, generation):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+        return '{}:{}:v{}:{}'.format(self.key_prefix, namespace, generation, digest)
+
+    def get_entries(self, namespace, keys):
+
+        generation = self.generation(namespace)
+
+        if generation is None:
+            return [(None, False)] * len(keys)
+
+        redis_keys = [self.make_key(namespace, key, generation) for key in keys]
+
+        try:
+            # One round-trip for all the chunks of MGET
+            pipeline = self.client.pipeline(transaction=False)
+
+            for start in range(0, len(redis_keys), REDIS_MGET_CHUNK):
+                pipeline.mget(redis_keys[start:start + REDIS_MGET_CHUNK])
+
+            data = [item for chunk in pipeline.execute() for item in chunk]
+
+            now = time.time()
+            entries = []
+
+            for item in data:
+                entries.append(self.load_entry(item, now))
+
+        except Exception as exc:
+            self.count_error()
+            logger.warning('Cache server not available on get: %s', str(exc))
+
+            entries = [(None, False)] * len(keys)
+
+        self.count(entries)
+
+        return entries
+
+    def load_entry(self, item, now):
+        r"""
+        Value and freshness of an item read from the server, an item that can't be loaded is a miss.
+        """
+
+        if item is None:
+            return None, False
+
+        try:
+            fresh_until, = FRESH_UNTIL_HEADER.unpack_from(item)
+
+            return self.serializer.loads(item[FRESH_UNTIL_HEADER.size:]), now < fresh_until
+
+        except (ValueError, struct.error) as exc:
+            logger.warning('Cache value rejected, read as a miss: %s', str(exc))
+
+            return None, False
+
+    def put(self, namespace, key, value, generation):
+
+        if generation is None:
+            return
+
+        ttl = self.ttl_by_namespace.get(namespace, 0)
+
+        data = FRESH_UNTIL_HEADER.pack(time.time() + ttl) + self.serializer.dumps(value)
+
+        try:
+            self.client.set(self.make_key(namespace, key, generation), data, ex=(ttl + self.stale_seconds) or None)
+
+        except Exception as exc:
+            self.count_error()
+            logger.warning('Cache server not available on put: %s', str(exc))
+
+    def invalidate(self, namespace):
+        r"""
+        Nothing to remove: the listeners run after the commit of the write, when the catalog version read by
+        generation is already the new one, so all the keys of the previous version are never read again and
+        they expire by his TTL. A worker that didn't read the new version yet keeps reading the previous one
+        at most CATALOG_VERSION_MAX_AGE seconds.
+        """
+
+    def evict(self, namespace, keys):
+        r"""
+        As invalidate, the keys of the previous version are already unreachable.
+        """
+
+    def count_error(self):
+        with self._stats_lock:
+            self.errors += 1
+
+    def get_stats(self):
+        stats = super().get_stats()
+
+        with self._stats_lock:
+            stats['errors'] = self.errors
+
+        return stats
+
+
+def create_cache_backend(settings_app):
+    r"""
+    Create the backend of the cache configured on CACHE_BACKEND.
+
+    :param settings_app: AppConstants object.
+    :return backend: CacheBackend
+    """
+
+    if 'redis' == settings_app.cache_backend:
+        return RedisCacheBackend(settings_app.filter_cache_ttl, settings_app.redis_url,
+                                 CacheSerializer(settings_app.cache_serializer), settings_app.cache_key_prefix,
+                                 settings_app.filter_cache_stale_seconds)
+
+    return InProcessCacheBackend(settings_app.filter_cache_ttl, settings_app.filter_cache_max_bytes,
+                                 settings_app.filter_cache_stale_seconds)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Background refresher of the cache, stale-while-revalidate.
+
+A value requested after his soft TTL is still responded, and his key is queued to be read again from the
+database by a pool of threads of the worker, out of the requests. The users of the popular keys never wait
+for a miss.
+
+Documentation:
+    - The pool has REFRESHER_WORKERS threads and at most REFRESHER_MAX_PENDING keys queued, the keys
+      that don't fit are refreshed by the first request after the hard TTL.
+    - A key already queued or in progress is not queued again.
+    - The threads are started by the first key queued on every process, a worker forked from a master that
+      already imported the app (gunicorn --preload) starts his own threads and queue.
+    - The pool is stopped on the exit of the worker, the refresh in progress is finished first.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import os
+import queue
+import threading
+from db_controller.database_backend import *
+
+
+class BackgroundRefresher:
+    r"""
+    Class to instance the pool of threads that refresh the keys of the cache.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+        self._reset()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+
+        # The threads, the queue and the lock of the parent are not usable on a child process
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._pid = None
+
+    def start(self):
+        r"""
+        Start the threads of the pool, only once by process.
+        """
+
+        with self._lock:
+            if self._pid == os.getpid() or self._stopping.is_set():
+                return
+
+            self._pid = os.getpid()
+
+            for number in range(self.max_workers):
+                thread = threading.Thread(target=self._run, name='cache-refresher-{}'.format(number), daemon=True)
+                thread.start()
+
+                self._threads.append(thread)
+
+        logger.info('Cache refresher started with %s threads', str(self.max_workers))
+
+    def submit(self, key, job):
+        r"""
+        Queue the refresh of a key.
+
+        :param key: Hashable key refreshed.
+        :param job: Function without arguments that refresh the key.
+        :return bool: True if it was queued, False if it is already queued or the queue is full.
+        """
+
+        if self._pid != os.getpid():
+            self.start()
+
+        with self._lock:
+            if self._stopping.is_set() or key in self._pending:
+                return False
+
+            try:
+                self._queue.put_nowait((key, job))
+            except queue.Full:
+                self.dropped += 1
+                return False
+
+            self._pending.add(key)
+            self.submitted += 1
+
+        return True
+
+    def _run(self):
+
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                break
+
+            key, job = item
+
+            try:
+                job()
+                completed = True
+
+            except Exception as exc:
+                completed = False
+                logger.warning('Cache key %s not refreshed: %s', str(key), str(exc))
+
+            with self._lock:
+                self._pending.discard(key)
+
+                if completed:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def shutdown(self, timeout=10):
+        r"""
+        Stop the threads after the refresh in progress, the keys queued are discarded.
+
+        :param timeout: Seconds waiting for every thread.
+        """
+
+        # Under the lock of submit, no key is queued after the drain
+        with self._lock:
+            self._stopping.set()
+
+            # The keys queued are discarded, so the stop signals fit on the queue
+            while True:
+                try:
+                    key, job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                self._pending.discard(key)
+
+            threads = list(self._threads)
+
+        for thread in threads:
+            self._queue.put(None)
+
+        for thread in threads:
+            thread.join(timeout)
+
+        logger.info('Cache refresher stopped')
+
+    def get_stats(self):
+        r"""
+        Counters of the refreshes to size the pool.
+
+        :return stats: dict
+        """
+
+        with self._lock:
+            return {
+                "workers": len(self._threads),
+                "pending": len(self._pending),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped
+            }
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Snapshot of the warm cache on disk.
+
+The entries of the in-process cache are dumped periodically to CACHE_SNAPSHOT_PATH, tagged with the catalog
+version, and loaded when the worker starts if the version is still the one on the database. Every process
+runs his own dump thread, a worker forked from a master that already loaded it (gunicorn --preload) keeps
+the entries loaded. The restarts come back with the cache warm instead of hammer the database.
+
+Documentation:
+    File format, version SNAPSHOT_FORMAT:
+    - Header: one line of JSON with the format, catalog version, Python version and number of entries.
+    - Body: zlib of the marshal of the list of (namespace, key, value), the least recently used first.
+    The file is written on a temporary file and renamed, the readers never see a partial snapshot.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+import marshal
+import os
+import platform
+import tempfile
+import threading
+import zlib
+from datetime import datetime
+from db_controller.database_backend import *
+from db_controller.catalog_events import get_current_catalog_version, get_known_catalog_version
+
+SNAPSHOT_FORMAT = 1
+
+
+class CacheSnapshot:
+    r"""
+    Class to instance the dump and load of the entries of an in-process cache backend.
+    """
+
+    def __init__(self, backend, path, interval_seconds):
+        self.backend = backend
+        self.path = path
+        self.interval_seconds = interval_seconds
+
+        self._loaded = False
+
+        self._reset()
+
+        # The dump thread of the parent is not copied to a child process
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def dump(self):
+        r"""
+        Write the entries of the cache on the snapshot file.
+
+        :return entries: Number of entries written, None if the catalog version is unknown.
+        """
+
+        version = get_known_catalog_version()
+
+        if version is None:
+            return None
+
+        entries = self.backend.export_entries()
+
+        header = {
+            'format': SNAPSHOT_FORMAT,
+            'catalog_version': version,
+            'python': platform.python_version(),
+            'created_date': datetime.utcnow().isoformat(),
+            'entries': len(entries)
+        }
+
+        body = zlib.compress(marshal.dumps(entries))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.cache_snapshot_')
+
+        try:
+            with os.fdopen(file_descriptor, 'wb') as snapshot_file:
+                snapshot_file.write(json.dumps(header).encode('utf-8') + b'\n')
+                snapshot_file.write(body)
+
+            os.replace(temporary_path, self.path)
+
+        except Exception:
+            os.unlink(temporary_path)
+            raise
+
+        logger.info('Cache snapshot written: %s entries, %s bytes, catalog version %s', str(len(entries)),
+                    str(len(body)), str(version))
+
+        return len(entries)
+
+    def load(self):
+        r"""
+        Load the entries of the snapshot file on the cache, only if it was written by a compatible version of
+        the API and Python, and his catalog version is the one on the database.
+
+        :return entries: Number of entries loaded.
+        """
+
+        if not os.path.exists(self.path):
+            return 0
+
+        with open(self.path, 'rb') as snapshot_file:
+            header = json.loads(snapshot_file.readline().decode('utf-8'))
+
+            if header.get('format') != SNAPSHOT_FORMAT or header.get('python') != platform.python_version():
+                logger.info('Cache snapshot ignored, format %s of Python %s', str(header.get('format')),
+                            str(header.get('python')))
+                return 0
+
+            version, updated_date = get_current_catalog_version(0)
+
+            if version is None or header.get('catalog_version') != version:
+                logger.info('Cache snapshot ignored, catalog version %s, current version %s',
+                            str(header.get('catalog_version')), str(version))
+                return 0
+
+            entries = marshal.loads(zlib.decompress(snapshot_file.read()))
+
+        self.backend.import_entries(entries)
+
+        logger.info('Cache snapshot loaded: %s entries, catalog version %s', str(len(entries)), str(version))
+
+        return len(entries)
+
+    def start(self):
+        r"""
+        Start the thread that load the snapshot and dump it every interval_seconds, once by process.
+        A child process forked after the load keeps the entries of his parent and doesn't load it again.
+        """
+
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+
+        self._thread = threading.Thread(target=self._run, name='cache-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        r"""
+        Stop the thread and dump the snapshot a last time, only on the process that started it.
+        """
+
+        if self._pid != os.getpid():
+            return
+
+        self._stop.set()
+
+        try:
+            self.dump()
+        except Exception as exc:
+            logger.warning('Cache snapshot not written on stop: %s', str(exc))
+
+    def _run(self):
+
+        if not self._loaded:
+            self._loaded = True
+
+            try:
+                self.load()
+            except Exception as exc:
+                logger.warning('Cache snapshot not loaded, the cache starts cold: %s', str(exc))
+
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.dump()
+            except Exception as exc:
+                logger.warning('Cache snapshot not written: %s', str(exc))
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Cache of the results of the /filter endpoints and the lookups of the catalog.
+
+The same query strings are requested thousands of times a minute, the result of a filter is saved already
+encoded as JSON, keyed by the entity, the normalized filter spec and the page requested.
+
+Documentation:
+    - The backend is configured on CACHE_BACKEND, see cache_controller.backends.
+    - Every entity has his own TTL (FILTER_CACHE_TTL_<ENTITY> seconds).
+    - The results of an entity are invalidated when a write of the entity is committed. When only colonias
+      were written only the lookups of their postal codes are evicted, a write of any other entity
+      invalidates all the lookups by postal code.
+    - The counters of hits and misses are exposed by get_stats of the backend.
+    - A value past his TTL is responded while it is refreshed by the background_refresher, the request
+      only waits for the database on a miss.
+    - The loaders receive the session to read the database, the one of the request or his own on background.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+from db_controller.database_backend import *
+from db_controller.catalog_events import register_catalog_listener, get_changed_postal_codes
+from cache_controller.backends import create_cache_backend
+from cache_controller.background_refresher import BackgroundRefresher
+from cache_controller.single_flight import catalog_flights
+
+cfg_app = get_config_settings_app()
+
+# Namespace of the lookups by postal code, they contain all the entities of the catalog
+POSTAL_CODE_NAMESPACE = 'codigo_postal'
+
+# Encoded result of a filter without rows
+EMPTY_ROWS = b'[]'
+
+cache_backend = create_cache_backend(cfg_app)
+
+background_refresher = BackgroundRefresher(cfg_app.refresher_workers, cfg_app.refresher_max_pending)
+
+
+def on_catalog_change(changes, version):
+    r"""
+    Listener of the writes of the catalog committed, invalidate the entities written and evict the lookups
+    of the postal codes changed.
+    """
+
+    for entity in set(entity for entity, key in changes):
+        cache_backend.invalidate(entity)
+
+    postal_codes = get_changed_postal_codes(changes)
+
+    if postal_codes is None:
+        cache_backend.invalidate(POSTAL_CODE_NAMESPACE)
+    else:
+        cache_backend.evict(POSTAL_CODE_NAMESPACE, postal_codes)
+
+
+register_catalog_listener(on_catalog_change)
+
+
+def make_filter_key(filter_spec, offset, limit):
+    r"""
+    Key of a result, the filters are sorted so the order of the query string doesn't matter.
+
+    :param filter_spec: List of the filters of the request.
+    :param offset: Number of the page requested.
+    :param limit: Rows by page.
+    :return key: tuple
+    """
+
+    filters = tuple(sorted((spec.get('field'), spec.get('op'), str(spec.get('value'))) for spec in filter_spec))
+
+    return filters, get_page_number(offset), get_page_limit(limit)
+
+
+def run_loader(loader, *args):
+    r"""
+    Run a loader with the session of the request.
+    """
+
+    conn_db, session_db = init_db_connection()
+
+    return loader(session_db, *args)
+
+
+def run_loader_on_background(loader, *args):
+    r"""
+    Run a loader out of the request, with his own session and transaction.
+    """
+
+    with session_scope() as session:
+        return loader(session, *args)
+
+
+def get_filtered_rows(entity, filter_spec, offset, limit, loader):
+    r"""
+    Get the result of a filter from the cache, or from the loader saving it on the cache. The concurrent
+    misses of the same key wait for the one that runs the loader.
+
+    :param entity: Table name of the catalog filtered.
+    :param filter_spec: List of the filters of the request.
+    :param offset: Number of the page requested.
+    :param limit: Rows by page.
+    :param loader: Function that read the result from the database, called as loader(session).
+    :return rows: Bytes with the JSON of the result, or an empty list if there are no rows.
+    """
+
+    key = make_filter_key(filter_spec, offset, limit)
+
+    if not cfg_app.filter_cache_enabled:
+        return catalog_flights.do((entity, key), lambda: run_loader(loader))
+
+    rows, is_fresh = cache_backend.get_entry(entity, key)
+
+    if rows is None:
+        rows = catalog_flights.do((entity, key), lambda: load_encoded(entity, key, loader, run_loader))
+
+    elif not is_fresh:
+        background_refresher.submit((entity, key),
+                                    lambda: load_encoded(entity, key, loader, run_loader_on_background))
+
+    return rows if rows != EMPTY_ROWS else []
+
+
+def get_postal_codes(postal_codes, loader):
+    r"""
+    Get the hierarchy of many postal codes from the cache with one multi-get, the missing ones are read
+    by the loader and saved on the cache.
+
+    :param postal_codes: List of postal codes.
+    :param loader: Function that read the postal codes missing, called as loader(session, postal_codes),
+                   returns a dict postal code: rows.
+    :return hierarchies: dict postal code: list of dict
+    """
+
+    if not cfg_app.filter_cache_enabled:
+        return run_loader(loader, postal_codes)
+
+    entries = cache_backend.get_entries(POSTAL_CODE_NAMESPACE, postal_codes)
+
+    hierarchies = {postal_code: value for postal_code, (value, is_fresh) in zip(postal_codes, entries)
+                   if value is not None}
+
+    missing = [postal_code for postal_code in postal_codes if postal_code not in hierarchies]
+
+    stale = tuple(postal_code for postal_code, (value, is_fresh) in zip(postal_codes, entries)
+                  if value is not None and not is_fresh)
+
+    if missing:
+        hierarchies.update(load_postal_codes(missing, loader, run_loader))
+
+    if stale:
+        background_refresher.submit((POSTAL_CODE_NAMESPACE, stale),
+                                    lambda: load_postal_codes(stale, loader, run_loader_on_background))
+
+    return hierarchies
+
+
+def load_postal_codes(postal_codes, loader, run):
+    r"""
+    Run the loader of the postal codes and save them on the cache, the ones without rows too.
+
+    :param postal_codes: List of postal codes.
+    :param loader: Function called as loader(session, postal_codes), returns a dict postal code: rows.
+    :param run: run_loader on the requests, run_loader_on_background out of them.
+    :return hierarchies: dict postal code: list of dict
+    """
+
+    generation = cache_backend.generation(POSTAL_CODE_NAMESPACE)
+
+    loaded = run(loader, list(postal_codes))
+
+    hierarchies = {}
+
+    for postal_code in postal_codes:
+        hierarchies[postal_code] = loaded.get(postal_code, [])
+
+        cache_backend.put(POSTAL_CODE_NAMESPACE, postal_code, hierarchies[postal_code], generation)
+
+    return hierarchies
+
+
+def load_encoded(entity, key, loader, run):
+    r"""
+    Run the loader of a filter and save his result encoded on the cache.
+
+    :param entity: Table name of the catalog filtered.
+    :param key: Key built by make_filter_key.
+    :param loader: Function that read the result from the database, called as loader(session).
+    :param run: run_loader on the requests, run_loader_on_background out of them.
+    :return rows: Bytes with the JSON of the result.
+    """
+
+    generation = cache_backend.generation(entity)
+
+    result = run(loader)
+
+    # Encoded once, the hits are responded without serialize again
+    rows = json.dumps(result).encode('utf-8') if result else EMPTY_ROWS
+
+    cache_backend.put(entity, key, rows, generation)
+
+    return rows
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Small dimension tables of the catalog pinned on memory.
+
+Estado (32 rows) and Municipio (about 2.5k rows) are loaded complete on immutable structures indexed by id,
+clave and normalized name, so the listings and filters of them are answered without the database.
+
+Documentation:
+    - Read-through: the table is loaded on the first lookup and loaded again when the catalog version changes.
+    - The new snapshot is built apart and swapped atomically, the readers never see a partial table.
+    - If the database is not available the last snapshot loaded keeps answering.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import bisect
+import re
+from collections import namedtuple
+from types import MappingProxyType
+from apps.estado.EstadoModel import EstadoModel
+from apps.municipio.MunicipioModel import MunicipioModel
+from db_controller.database_backend import *
+from db_controller.catalog_events import get_catalog_version, get_current_catalog_version
+from cache_controller.single_flight import catalog_flights
+from handler_controller.conditional_requests import note_served_catalog_version
+
+cfg_app = get_config_settings_app()
+
+# Immutable snapshot of a table: rows ordered by id, the indexes map to positions on rows
+PinnedSnapshot = namedtuple('PinnedSnapshot', ['version', 'ids', 'values', 'items', 'by_id', 'by_key', 'by_name'])
+
+
+def normalize_name(name):
+    r"""
+    Normalized name as it is compared by ilike, case insensitive.
+    """
+
+    return str(name).strip().lower()
+
+
+def like_to_regex(pattern):
+    r"""
+    Regular expression of a pattern of LIKE/ILIKE, with the wildcards % and _.
+    """
+
+    expression = ''.join('.*' if char == '%' else '.' if char == '_' else re.escape(char) for char in str(pattern))
+
+    return re.compile('^{}$'.format(expression), re.IGNORECASE | re.DOTALL)
+
+
+class PinnedTable:
+    r"""
+    Class to instance a table of the catalog loaded complete on memory.
+    """
+
+    def __init__(self, model, id_field, key_field, name_field, wrapper):
+        self.model = model
+        self.id_field = id_field
+        self.key_field = key_field
+        self.name_field = name_field
+        self.wrapper = wrapper
+
+        self._snapshot = None
+
+    def load(self):
+        r"""
+        Read all the rows of the table and swap the snapshot for the new one.
+
+        :return snapshot: PinnedSnapshot loaded.
+        """
+
+        with session_scope() as session:
+            version, updated_date = get_catalog_version(session)
+
+            rows = session.query(self.model).order_by(getattr(self.model, self.id_field)).all()
+
+        ids, values, items = [], [], []
+        by_id, by_key, by_name = {}, {}, {}
+
+        # The deferred columns (row_hash) are not loaded and the session is closed already
+        columns = [column.key for column in self.model.__mapper__.column_attrs if not column.deferred]
+
+        for position, row in enumerate(rows):
+            row_values = {key: getattr(row, key) for key in columns}
+
+            ids.append(row_values[self.id_field])
+            values.append(MappingProxyType(row_values))
+            items.append({self.wrapper: row.to_dict()})
+
+            by_id[row_values[self.id_field]] = position
+            by_key.setdefault(row_values[self.key_field], []).append(position)
+            by_name.setdefault(normalize_name(row_values[self.name_field]), []).append(position)
+
+        snapshot = PinnedSnapshot(version=version,
+                                  ids=tuple(ids),
+                                  values=tuple(values),
+                                  items=tuple(items),
+                                  by_id=MappingProxyType(by_id),
+                                  by_key=MappingProxyType({key: tuple(pos) for key, pos in by_key.items()}),
+                                  by_name=MappingProxyType({name: tuple(pos) for name, pos in by_name.items()}))
+
+        self._snapshot = snapshot
+
+        logger.info('Table %s pinned on memory: %s rows, catalog version %s', self.model.__tablename__,
+                    str(len(ids)), str(version))
+
+        return snapshot
+
+    def get_stats(self):
+        r"""
+        State of the table on memory to expose it with the counters of the caches.
+
+        :return stats: dict
+        """
+
+        snapshot = self._snapshot
+
+        return {
+            "loaded": snapshot is not None,
+            "catalog_version": snapshot.version if snapshot is not None else None,
+            "rows": len(snapshot.ids) if snapshot is not None else 0
+        }
+
+    def get_snapshot(self):
+        r"""
+        Get the snapshot of the current catalog version, loaded through if it is missing or outdated.
+
+        :return snapshot: PinnedSnapshot
+        """
+
+        snapshot = self._snapshot
+
+        version, updated_date = get_current_catalog_version(cfg_app.catalog_version_max_age)
+
+        if snapshot is not None and (version is None or version == snapshot.version):
+            return snapshot
+
+        try:
+            return catalog_flights.do(('pinned', self.model.__tablename__), self.load)
+
+        except SQLAlchemyError as exc:
+            if snapshot is None:
+                raise
+
+            logger.warning('Table %s not loaded, catalog version %s kept: %s', self.model.__tablename__,
+                           str(snapshot.version), str(exc))
+
+            note_served_catalog_version(snapshot.version)
+
+            return snapshot
+
+    def get_page(self, data):
+        r"""
+        Page of the rows after data['after_id'] ordered by id, as the keyset pagination of the models.
+        The cursor of the next page is set on data['next_cursor'].
+
+        :param data: Dictionary with after_id and limit of the request.
+        :return: list of dict
+        """
+
+        snapshot = self.get_snapshot()
+
+        limit = get_page_limit(data.get('limit'))
+        start = bisect.bisect_right(snapshot.ids, data.get('after_id', 0))
+
+        page = list(snapshot.items[start:start + limit])
+
+        data['next_cursor'] = None
+
+        if start + limit < len(snapshot.ids):
+            data['next_cursor'] = encode_page_cursor(snapshot.ids[start + limit - 1])
+
+        return page
+
+    def get_all(self):
+        r"""
+        All the rows ordered by id, as the streaming of the models.
+
+        :return: tuple of dict
+        """
+
+        return self.get_snapshot().items
+
+    def get_by_filters(self, data, filter_spec):
+        r"""
+        Page of the rows that match all the filters ordered by id, as the get_*_by_filters of the models.
+
+        :param data: Dictionary with offset and limit of the request.
+        :param filter_spec: List of the filters of the request (ops '==' and 'ilike').
+        :return: list of dict
+        """
+
+        snapshot = self.get_snapshot()
+
+        page = get_page_number(data.get('offset'))
+        per_page = get_page_limit(data.get('limit'))
+
+        positions = range(len(snapshot.ids))
+        predicates = []
+
+        for spec in filter_spec:
+            field, op, value = spec.get('field'), spec.get('op'), spec.get('value')
+
+            if '==' == op:
+                value = self.cast_value(field, value)
+
+                if field == self.key_field:
+                    positions = snapshot.by_key.get(value, ())
+
+                predicates.append(lambda values, field=field, value=value: values[field] == value)
+
+            elif 'ilike' == op:
+                if field == self.name_field and not re.search(r'[%_]', str(value)):
+                    positions = snapshot.by_name.get(normalize_name(value), ())
+
+                regex = like_to_regex(value)
+
+                predicates.append(lambda values, field=field, regex=regex: regex.match(str(values[field])) is not None)
+
+            else:
+                raise ValueError('Filter operator not supported on memory: {}'.format(op))
+
+        matches = [snapshot.items[position] for position in positions
+                   if all(predicate(snapshot.values[position]) for predicate in predicates)]
+
+        return matches[(page - 1) * per_page:page * per_page]
+
+    def cast_value(self, field, value):
+        r"""
+        Value of the request as the type of the column, as it is bound on the query.
+        """
+
+        column_type = self.model.__table__.c[field].type
+
+        try:
+            return column_type.python_type(value)
+        except (TypeError, ValueError, NotImplementedError):
+            return value
+
+
+pinned_states = PinnedTable(EstadoModel, 'id_estado', 'clave_estado', 'nombre_estado', 'State')
+pinned_towns = PinnedTable(MunicipioModel, 'id_municipio', 'clave_municipio', 'nombre_municipio', 'Town')
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Bloom filter of the postal codes of the catalog.
+
+A large share of the lookups are validations of postal codes typed by the users, many of them don't exist.
+The filter answers if a postal code is definitely not on the catalog without query the database, the
+postal codes that may exist continue to the lookup.
+
+Documentation:
+    - The filter is sized for the postal codes of the catalog with the false-positive rate
+      POSTAL_CODE_BLOOM_FP_RATE, bounded by POSTAL_CODE_BLOOM_MAX_BYTES (the rate grows if it doesn't fit).
+    - It is rebuilt on background after a write of the catalog, meanwhile every postal code may exist.
+      A build that fails (e.g. the database is down on the start of the worker) is tried again on the next
+      lookups, waiting between the tries from REBUILD_BACKOFF_SECONDS up to REBUILD_BACKOFF_MAX_SECONDS.
+    - A worker forked from a master that already built the filter (gunicorn --preload) keeps it, the state
+      of the builds of the parent is reset so the child builds it again when it is stale.
+    - The version built is compared with the catalog version, so the writes not notified to this process
+      (import commands, LISTEN disabled) make it stale too and it is rebuilt.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import hashlib
+import math
+import os
+import threading
+import time
+from apps.colonia.ColoniaModel import ColoniaModel
+from db_controller.database_backend import *
+from db_controller.catalog_events import get_catalog_version, get_current_catalog_version, register_catalog_listener
+
+cfg_app = get_config_settings_app()
+
+# Seconds waiting before try again a build that failed, doubled on every failure up to the max
+REBUILD_BACKOFF_SECONDS = 1
+REBUILD_BACKOFF_MAX_SECONDS = 60
+
+
+class BloomFilter:
+    r"""
+    Class to instance a Bloom filter of strings on a bit array, with k hashes by double hashing.
+    """
+
+    def __init__(self, capacity, fp_rate, max_bytes):
+        capacity = max(capacity, 1)
+
+        bits = int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        bits = max(8, min(bits, max_bytes * 8))
+
+        self.size_bits = bits
+        self.hash_count = max(1, int(round(bits / capacity * math.log(2))))
+        self.capacity = capacity
+        self.count = 0
+
+        self._bits = bytearray((bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:], 'big') | 1
+
+        return ((first + number * second) % self.size_bits for number in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def size_bytes(self):
+        return len(self._bits)
+
+    @property
+    def fp_rate(self):
+        r"""
+        Expected false-positive rate with the items added.
+        """
+
+        return (1 - math.exp(-self.hash_count * self.count / self.size_bits)) ** self.hash_count
+
+
+class PostalCodeBloom:
+    r"""
+    Class to instance the Bloom filter of the postal codes, rebuilt after the writes of the catalog.
+
+    Every write of the catalog increments the generation of the filter, a filter built on a previous
+    generation or a previous catalog version is stale and every postal code may exist until it is rebuilt.
+    """
+
+    def __init__(self, fp_rate, max_bytes):
+        self.fp_rate = fp_rate
+        self.max_bytes = max_bytes
+
+        self._filter = None
+        self._version = None
+        self._generation = 0
+        self._built_generation = None
+
+        self._reset()
+
+        self.rejected = 0
+
+        # The build thread of the parent is not copied to a child process, his flag and locks are reset
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._rebuilding = False
+        self._retry_at = 0.0
+        self._backoff = REBUILD_BACKOFF_SECONDS
+        self._build_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        r"""
+        Build the filter on background if it is not built or stale, only once by process.
+        """
+
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+
+        if self.is_stale():
+            self.rebuild_on_background()
+
+    def build(self):
+        r"""
+        Read the postal codes of the catalog and swap the filter for the new one.
+        """
+
+        with self._build_lock:
+
+            # A write committed after this point is not on the filter, it stays stale
+            generation = self._generation
+
+            with session_scope() as session:
+                version, updated_date = get_catalog_version(session)
+
+                postal_codes = ColoniaModel.get_all_postal_codes(session)
+
+            bloom_filter = BloomFilter(len(postal_codes), self.fp_rate, self.max_bytes)
+
+            for postal_code in postal_codes:
+                bloom_filter.add(postal_code)
+
+            with self._state_lock:
+                self._filter = bloom_filter
+                self._version = version
+                self._built_generation = generation
+
+        logger.info('Postal code Bloom filter built: %s postal codes, %s bytes, %s hashes, false-positive rate %s',
+                    str(bloom_filter.count), str(bloom_filter.size_bytes), str(bloom_filter.hash_count),
+                    str(round(bloom_filter.fp_rate, 6)))
+
+    def rebuild_on_background(self):
+        r"""
+        Build the filter on a thread, only one build runs at a time. After a build failed no other one
+        is started until his backoff is over.
+        """
+
+        with self._state_lock:
+            if self._rebuilding or time.monotonic() < self._retry_at:
+                return
+
+            self._rebuilding = True
+
+        def run_build():
+            while True:
+                try:
+                    self.build()
+                except Exception as exc:
+                    with self._state_lock:
+                        self._retry_at = time.monotonic() + self._backoff
+                        self._backoff = min(self._backoff * 2, REBUILD_BACKOFF_MAX_SECONDS)
+                        self._rebuilding = False
+
+                    logger.warning('Postal code Bloom filter not rebuilt, tried again in %s seconds: %s',
+                                   str(round(self._retry_at - time.monotonic())), str(exc))
+
+                    return
+
+                # A write committed while the filter was built is not on it, it is built again
+                with self._state_lock:
+                    self._retry_at = 0.0
+                    self._backoff = REBUILD_BACKOFF_SECONDS
+
+                    if self._built_generation == self._generation:
+                        self._rebuilding = False
+
+                        return
+
+        threading.Thread(target=run_build, name='postal-code-bloom', daemon=True).start()
+
+    def on_catalog_change(self, changes, version):
+        r"""
+        Listener of the writes of the catalog, the filter is stale until it is rebuilt.
+        """
+
+        with self._state_lock:
+            self._generation += 1
+
+        self.rebuild_on_background()
+
+    def is_stale(self):
+        r"""
+        Validate if the filter may miss postal codes of the catalog: it is not built, a write of this process
+        was committed after his build, or the catalog version is newer than the one built (a write of the
+        import commands, other worker or node not notified).
+
+        :return bool: True if the filter can't be used.
+        """
+
+        if self._filter is None or self._built_generation != self._generation:
+            return True
+
+        version, updated_date = get_current_catalog_version(cfg_app.catalog_version_max_age)
+
+        return version is not None and self._version is not None and version > self._version
+
+    def might_contain(self, postal_code):
+        r"""
+        Validate if a postal code may be on the catalog.
+
+        :param postal_code: The postal code to looking for.
+        :return bool: False only if the postal code is definitely not on the catalog.
+        """
+
+        bloom_filter = self._filter
+
+        # Not built yet (or the build failed) or stale, rebuilt on background
+        if self.is_stale():
+            self.rebuild_on_background()
+
+            return True
+
+        if postal_code in bloom_filter:
+            return True
+
+        self.rejected += 1
+
+        return False
+
+    def get_stats(self):
+        bloom_filter = self._filter
+
+        return {
+            "ready": bloom_filter is not None and self._built_generation == self._generation,
+            "catalog_version": self._version,
+            "postal_codes": bloom_filter.count if bloom_filter is not None else 0,
+            "bytes": bloom_filter.size_bytes if bloom_filter is not None else 0,
+            "hashes": bloom_filter.hash_count if bloom_filter is not None else 0,
+            "fp_rate": round(bloom_filter.fp_rate, 6) if bloom_filter is not None else None,
+            "rejected": self.rejected
+        }
+
+
+postal_code_bloom = PostalCodeBloom(cfg_app.postal_code_bloom_fp_rate, cfg_app.postal_code_bloom_max_bytes)
+
+register_catalog_listener(postal_code_bloom.on_catalog_change)
+
+
+def postal_code_may_exist(postal_code):
+    r"""
+    Validate if a postal code may be on the catalog, always True if the filter is disabled or there is no
+    postal code to looking for (None or empty), the lookup validates it.
+
+    :param postal_code: The postal code to looking for.
+    :return bool: False only if the postal code is definitely not on the catalog.
+    """
+
+    if not cfg_app.postal_code_bloom_enabled or not postal_code:
+        return True
+
+    return postal_code_bloom.might_contain(postal_code)
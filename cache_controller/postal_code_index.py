@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+In-memory index of the postal codes.
+
+The SEPOMEX catalog changes a few times a year, so the Colonias of every postal code with his Ciudad,
+Municipio and Estado are loaded once on the start of the API and the lookups by exact postal code are
+answered from memory, without round-trips to the database.
+
+Documentation:
+    - The index is built from one streamed query and swapped atomically, the readers never see a partial index.
+    - It is reloaded when the catalog version on the database changes, checked every
+      POSTAL_CODE_INDEX_REFRESH_SECONDS, or right away after a write of the catalog is notified.
+    - A write of only colonias reloads only his postal codes, if the index is on the version before it and
+      no other write was committed meanwhile; otherwise all the index is built again.
+    - If the database is not available the last index built keeps answering the lookups.
+    - The refresher thread is started once by process, a worker forked from a master that already built the
+      index (gunicorn --preload) keeps the index and starts his own thread.
+    - The lookups record the version of the index on the request, while it is behind the catalog version
+      the responses are tagged with the version of the index (see conditional_requests).
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import os
+import threading
+from apps.colonia.ColoniaModel import ColoniaModel
+from db_controller.database_backend import *
+from db_controller.catalog_events import get_catalog_version, get_known_catalog_version, register_catalog_listener, \
+    get_changed_postal_codes
+from handler_controller.conditional_requests import note_served_catalog_version
+
+# Postal codes by query of the reload of the postal codes written
+POSTAL_CODES_BY_QUERY = 500
+
+
+class PostalCodeIndex:
+    r"""
+    Class to instance the index of the postal codes on memory.
+
+    Every postal code is a tuple of dictionaries {"Suburb", "City", "Town", "State"} ordered by id_colonia,
+    the dictionaries of a same City, Town or State are shared by all his Suburbs.
+    """
+
+    def __init__(self):
+        self._entries = None
+        self._version = None
+
+        # Postal codes to reload by catalog version notified, None when all the index must be built again
+        self._pending = {}
+
+        self._reset()
+
+        # The thread and the locks of the parent are not usable on a child process, the index is kept
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._build_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._refresher = None
+        self._pid = None
+
+    @property
+    def is_ready(self):
+        return self._entries is not None
+
+    @property
+    def version(self):
+        return self._version
+
+    def get_stats(self):
+        r"""
+        State of the index to expose it with the counters of the caches.
+
+        :return stats: dict
+        """
+
+        entries = self._entries
+
+        return {
+            "ready": entries is not None,
+            "catalog_version": self._version,
+            "postal_codes": len(entries) if entries is not None else 0
+        }
+
+    def lookup(self, postal_code):
+        r"""
+        Get the Suburbs with his hierarchy of a postal code.
+
+        :param postal_code: The postal code to looking for.
+        :return entries: Tuple of dict, empty if the postal code doesn't exist, None if the index is not built.
+        """
+
+        entries = self._entries
+
+        if entries is None:
+            return None
+
+        # A write of other process or node is known before the refresher check
+        known_version = get_known_catalog_version()
+
+        if known_version is not None and known_version != self._version:
+            self._wake.set()
+
+        note_served_catalog_version(self._version)
+
+        return entries.get(postal_code, ())
+
+    def build(self):
+        r"""
+        Load all the catalog from the database and swap the index for the new one.
+
+        :return version: The catalog version loaded.
+        """
+
+        with self._build_lock:
+
+            with session_scope() as session:
+
+                version, updated_date = get_catalog_version(session)
+
+                entries = {}
+                shared = {}
+
+                for suburb, city, town, state in ColoniaModel.stream_hierarchy(session):
+                    entries.setdefault(suburb.codigo_postal, []).append(self._build_entry(shared, suburb, city, town,
+                                                                                          state))
+
+            self._entries = {postal_code: tuple(rows) for postal_code, rows in entries.items()}
+            self._version = version
+
+        logger.info('Postal code index built: %s postal codes, catalog version %s', str(len(entries)), str(version))
+
+        return version
+
+    @classmethod
+    def _build_entry(cls, shared, suburb, city, town, state):
+        return {
+            "Suburb": suburb.to_dict(),
+            "City": cls._shared_dict(shared, city, 'id_ciudad'),
+            "Town": cls._shared_dict(shared, town, 'id_municipio'),
+            "State": cls._shared_dict(shared, state, 'id_estado')
+        }
+
+    @staticmethod
+    def _shared_dict(shared, row, id_name):
+        if row is None:
+            return None
+
+        key = (id_name, getattr(row, id_name))
+
+        if key not in shared:
+            shared[key] = row.to_dict()
+
+        return shared[key]
+
+    def reload_postal_codes(self, pending):
+        r"""
+        Reload only the postal codes written since the version of the index.
+
+        :param pending: dict catalog version: set of postal codes written by it, None if unknown.
+        :return reloaded: True if the index is on the last version pending, False if it must be built again.
+        """
+
+        with self._build_lock:
+
+            if self._entries is None or self._version is None:
+                return False
+
+            if max(pending) <= self._version:
+                return True
+
+            versions = range(self._version + 1, max(pending) + 1)
+
+            # A version missed or written on estado, municipio or ciudad
+            if any(pending.get(pending_version) is None for pending_version in versions):
+                return False
+
+            postal_codes = sorted(set().union(*(pending[pending_version] for pending_version in versions)))
+
+            with session_scope() as session:
+
+                version, updated_date = get_catalog_version(session)
+
+                # Other write was committed and is not notified yet
+                if version != max(pending):
+                    return False
+
+                loaded = {postal_code: [] for postal_code in postal_codes}
+                shared = {}
+
+                for start in range(0, len(postal_codes), POSTAL_CODES_BY_QUERY):
+                    query = ColoniaModel.query_hierarchy(session). \
+                        filter(ColoniaModel.codigo_postal.in_(postal_codes[start:start + POSTAL_CODES_BY_QUERY])). \
+                        order_by(ColoniaModel.codigo_postal, ColoniaModel.id_colonia)
+
+                    for suburb, city, town, state in query:
+                        loaded[suburb.codigo_postal].append(self._build_entry(shared, suburb, city, town, state))
+
+            entries = dict(self._entries)
+
+            for postal_code, rows in loaded.items():
+                if rows:
+                    entries[postal_code] = tuple(rows)
+                else:
+                    entries.pop(postal_code, None)
+
+            self._entries = entries
+            self._version = version
+
+        logger.info('Postal code index reloaded: %s postal codes, catalog version %s', str(len(postal_codes)),
+                    str(version))
+
+        return True
+
+    def refresh(self):
+        r"""
+        Reload the postal codes written if they are known, rebuild the index if the catalog version on the
+        database is still not the version loaded.
+        """
+
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+
+        if pending and not self.reload_postal_codes(pending):
+            logger.info('Postal codes written not reloaded apart, the index is built again')
+
+        with session_scope() as session:
+            version, updated_date = get_catalog_version(session)
+
+        if version != self._version:
+            logger.info('Catalog version changed from %s to %s', str(self._version), str(version))
+
+            self.build()
+
+    def on_catalog_change(self, changes, version):
+        r"""
+        Listener of the writes of the catalog committed, record the postal codes written and wake up the refresher.
+        """
+
+        if version is not None:
+            with self._pending_lock:
+                self._pending[version] = get_changed_postal_codes(changes)
+
+        self._wake.set()
+
+    def start(self, refresh_seconds):
+        r"""
+        Start the thread that build the index and reload it when the catalog version changes, only once by
+        process. The lookups go to the database until it is built, an index inherited from the parent process
+        is not built again, only reloaded.
+
+        :param refresh_seconds: Seconds between the checks of the catalog version.
+        """
+
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+
+        register_catalog_listener(self.on_catalog_change)
+
+        self._refresher = threading.Thread(target=self._run_refresher, args=(refresh_seconds,),
+                                           name='postal-code-index', daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run_refresher(self, refresh_seconds):
+
+        if self._entries is None:
+            try:
+                self.build()
+            except Exception as exc:
+                logger.exception('Postal code index not built, the lookups go to the database: %s', str(exc))
+        else:
+            # Inherited from the parent process, the writes notified before the start are not on it
+            self._wake.set()
+
+        while not self._stop.is_set():
+            self._wake.wait(refresh_seconds)
+            self._wake.clear()
+
+            if self._stop.is_set():
+                break
+
+            try:
+                self.refresh()
+            except Exception as exc:
+                # The database is not available, the last index keeps answering
+                logger.warning('Postal code index not refreshed, version %s kept: %s', str(self._version), str(exc))
+
+
+postal_code_index = PostalCodeIndex()
+
+
+def lookup_postal_code(postal_code):
+    r"""
+    Get the Suburbs with his hierarchy of a postal code from the in-memory index.
+
+    :param postal_code: The postal code to looking for.
+    :return entries: Tuple of dict, None if the index is not enabled or not built yet.
+    """
+
+    return postal_code_index.lookup(postal_code)
+
+
+def lookup_suburbs_page(postal_code, offset, limit):
+    r"""
+    Get a page of the Suburbs of a postal code from the in-memory index, as get_suburbs_by_filters.
+
+    :param postal_code: The postal code to looking for.
+    :param offset: Number of the page requested.
+    :param limit: Rows by page.
+    :return suburbs: list of dict, None if the index is not enabled or not built yet.
+    """
+
+    entries = postal_code_index.lookup(postal_code)
+
+    if entries is None:
+        return None
+
+    page = get_page_number(offset)
+    per_page = get_page_limit(limit)
+
+    return [{"Suburb": entry["Suburb"]} for entry in entries[(page - 1) * per_page:page * per_page]]
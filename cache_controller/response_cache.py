@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Cache of the responses already encoded of the hot lookups.
+
+Even on a hit of the lookup cache the response is built and encoded again, this cache keeps the final body of
+the response (and his gzip) by path and query string, so a hit is a copy of bytes to the socket without
+Python objects or serialization.
+
+Documentation:
+    - Only the successful JSON responses of the views decorated with cached_response are saved.
+    - The entries carry the catalog version, an entry of a previous version is never responded. When a write
+      of only colonias is committed the responses of their postal codes are removed and the other responses
+      by postal code are kept on the new version, any other write removes all of them.
+    - A response built from data of a previous version (the postal code index still reloading after a
+      write) is not saved, it would be responded under the new version until the next write.
+    - The bodies of RESPONSE_CACHE_GZIP_MIN_BYTES or more are saved gzipped too, responded to the clients
+      that accept it, with his own strong ETag.
+    - The size is bounded by RESPONSE_CACHE_MAX_BYTES, the least recently used responses are evicted first.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import gzip
+import threading
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import Response, request, make_response
+from db_controller.database_backend import *
+from db_controller.catalog_events import get_current_catalog_version, register_catalog_listener, \
+    get_changed_postal_codes
+from handler_controller.conditional_requests import make_catalog_etag, get_served_catalog_version, GZIP_ETAG_SUFFIX
+
+cfg_app = get_config_settings_app()
+
+EncodedResponse = namedtuple('EncodedResponse', ['version', 'etag', 'body', 'gzip_body', 'postal_code'])
+
+
+class ResponseCache:
+    r"""
+    Class to instance the cache of the encoded responses, LRU bounded by bytes.
+    """
+
+    def __init__(self, max_bytes, gzip_min_bytes):
+        self.max_bytes = max_bytes
+        self.gzip_min_bytes = gzip_min_bytes
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        r"""
+        Get the encoded response of a key on the catalog version.
+
+        :return entry: EncodedResponse, None if it is not on the cache.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry
+
+    def put(self, key, version, body, postal_code=None):
+        r"""
+        Save the body of a response, gzipped too if it is big enough.
+
+        :param postal_code: The postal code of the response, None if it is not a lookup by postal code.
+        :return entry: EncodedResponse saved.
+        """
+
+        gzip_body = gzip.compress(body, compresslevel=6) if 0 < self.gzip_min_bytes <= len(body) else None
+
+        entry = EncodedResponse(version=version, etag=make_catalog_etag(version), body=body, gzip_body=gzip_body,
+                                postal_code=postal_code)
+
+        size = len(body) + (len(gzip_body) if gzip_body is not None else 0)
+
+        if size > self.max_bytes:
+            return entry
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            self._entries[key] = entry
+            self.current_bytes += size
+
+        return entry
+
+    def clear(self, *args):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def on_catalog_change(self, changes, version):
+        r"""
+        Listener of the writes of the catalog committed, remove the responses of the postal codes written and
+        move the other responses by postal code of the previous version to the new one.
+        """
+
+        postal_codes = get_changed_postal_codes(changes)
+
+        if postal_codes is None or version is None:
+            self.clear()
+            return
+
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+
+                if entry.version == version:
+                    continue
+
+                # An entry of an older version missed other writes
+                if entry.postal_code is None or entry.postal_code in postal_codes or entry.version != version - 1:
+                    self._remove(key)
+                else:
+                    self._entries[key] = entry._replace(version=version, etag=make_catalog_etag(version))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+
+        self.current_bytes -= len(entry.body) + (len(entry.gzip_body) if entry.gzip_body is not None else 0)
+
+    def get_stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+                "evictions": self.evictions
+            }
+
+
+response_cache = ResponseCache(cfg_app.response_cache_max_bytes,
+                               cfg_app.response_cache_gzip_min_bytes if cfg_app.response_cache_gzip else 0)
+
+register_catalog_listener(response_cache.on_catalog_change)
+
+
+def encoded_response(entry, accepts_gzip):
+    r"""
+    Response of an entry of the cache, the gzip body if the client accepts it.
+
+    :param entry: EncodedResponse
+    :param accepts_gzip: True if the request has Accept-Encoding gzip.
+    :return resp: Response object
+    """
+
+    if accepts_gzip and entry.gzip_body is not None:
+        resp = Response(entry.gzip_body, mimetype='application/json')
+        resp.headers['Content-Encoding'] = 'gzip'
+        resp.set_etag(entry.etag + GZIP_ETAG_SUFFIX)
+    else:
+        resp = Response(entry.body, mimetype='application/json')
+        resp.set_etag(entry.etag)
+
+    resp.vary.add('Accept-Encoding')
+
+    return resp
+
+
+def cached_response(view):
+    r"""
+    Decorator of the GET views of the hot lookups, respond the body encoded on a previous request.
+    """
+
+    @wraps(view)
+    def cached_view(*args, **kwargs):
+
+        if not cfg_app.response_cache_enabled or 'GET' != request.method:
+            return view(*args, **kwargs)
+
+        version, updated_date = get_current_catalog_version(cfg_app.catalog_version_max_age)
+
+        if version is None:
+            return view(*args, **kwargs)
+
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        accepts_gzip = request.accept_encodings['gzip'] > 0
+
+        entry = response_cache.get(key, version)
+
+        if entry is None:
+            resp = make_response(view(*args, **kwargs))
+
+            if 200 != resp.status_code or 'application/json' != resp.mimetype or resp.is_streamed:
+                return resp
+
+            if get_served_catalog_version(version) != version:
+                return resp
+
+            entry = response_cache.put(key, version, resp.get_data(), (request.view_args or {}).get('codigo_postal'))
+
+        return encoded_response(entry, accepts_gzip)
+
+    return cached_view
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Single-flight of the lookups of the catalog.
+
+When a popular filter expires from the cache, many threads of the worker request it at the same moment.
+Only the first caller of a key executes the query, the concurrent callers of the same key wait for his
+result, or his exception, instead of run the same query on the database.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import threading
+
+
+class _Flight:
+    r"""
+    Call in progress of a key, with his result or exception once it is done.
+    """
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    r"""
+    Class to instance the coalescing of the concurrent calls by key.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        r"""
+        Execute the function once for all the concurrent callers of the key.
+
+        :param key: Hashable key of the lookup.
+        :param function: Function without arguments that executes the lookup.
+        :return result: The result of the function, the exception raised is raised to every caller.
+        """
+
+        with self._lock:
+            flight = self._flights.get(key)
+
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+                is_leader = True
+            else:
+                self.coalesced += 1
+                is_leader = False
+
+        if not is_leader:
+            flight.done.wait()
+
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.result
+
+        try:
+            flight.result = function()
+
+        except Exception as exc:
+            flight.error = exc
+            raise
+
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+            flight.done.set()
+
+        return flight.result
+
+    def get_stats(self):
+        r"""
+        Counters of the lookups executed and the ones that waited for a call in progress.
+
+        :return stats: dict
+        """
+
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights)
+            }
+
+
+catalog_flights = SingleFlight()
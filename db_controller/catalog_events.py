@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+PostgreSQL DB catalog version.
+
+Every transaction that writes on the SEPOMEX catalog (estado, municipio, ciudad, colonia) increments
+the version of the catalog on the same transaction, after the commit the listeners registered on this
+process are notified with the changes, so the in-memory structures can be invalidated or reloaded.
+
+Documentation:
+    - mark_catalog_write: Record a write of the catalog on the session.
+    - register_catalog_listener: Callback to be notified after the commit of the writes.
+    - get_catalog_version: Read the version of the catalog from the database.
+    - get_current_catalog_version: Version known by this process, read again after max_age seconds.
+    - get_changed_postal_codes: Postal codes of the changes when only colonias were written, so the caches
+      by postal code evict only them.
+    - The changes are published with NOTIFY on CATALOG_CHANNEL on the same transaction, so the other
+      workers receive them only if it is committed (see catalog_notifications). The postal codes written are
+      listed once by entity, when they don't fit on the payload they are saved on catalog_change by the
+      version and only the version is notified.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+import os
+import socket
+import threading
+import time
+from sqlalchemy import event, select, Column, Integer, BigInteger, DateTime, Text, func
+from db_controller.database_backend import *
+from db_controller import mvc_exceptions as mvc_exc
+
+CATALOG_WRITES_KEY = 'catalog_writes'
+CATALOG_VERSION_KEY = 'catalog_version'
+
+# Tables of the catalog, versioned together
+CATALOG_ENTITIES = ('estado', 'municipio', 'ciudad', 'colonia')
+
+# Channel of the notifications of the writes of the catalog between the workers
+CATALOG_CHANNEL = 'sepomex_catalog'
+
+# The payload of NOTIFY is limited to 8000 bytes, bigger sets of changes are saved on catalog_change
+MAX_NOTIFY_PAYLOAD = 7900
+
+# Versions of the catalog with his changes kept on catalog_change, the older ones are deleted
+CATALOG_CHANGES_KEPT = 100
+
+# Key of the changes by postal code, the only one used by the listeners of the other workers
+POSTAL_CODE_KEY = 'codigo_postal'
+
+_catalog_listeners = []
+
+# (version, updated_date, monotonic time of the read) of the catalog known by this process
+_known_version = (None, None, 0.0)
+_known_version_lock = threading.Lock()
+
+
+class CatalogVersionModel(Base):
+    r"""
+    Class to instance the version of the SEPOMEX catalog, one row incremented on every write committed.
+    """
+
+    __tablename__ = 'catalog_version'
+
+    id_catalog = Column('id_catalog', Integer, primary_key=True, autoincrement=False)
+    version = Column('version', BigInteger, nullable=False)
+    updated_date = Column('updated_date', DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return "<CatalogVersionModel(version='%s', updated_date='%s')>" % (self.version, self.updated_date)
+
+
+class CatalogChangeModel(Base):
+    r"""
+    Class to instance the changes of a version of the catalog too big for the payload of NOTIFY.
+    """
+
+    __tablename__ = 'catalog_change'
+
+    version = Column('version', BigInteger, primary_key=True, autoincrement=False)
+    changes = Column('changes', Text, nullable=False)
+    created_date = Column('created_date', DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return "<CatalogChangeModel(version='%s', created_date='%s')>" % (self.version, self.created_date)
+
+
+def mark_catalog_write(session, entity, key=None):
+    r"""
+    Record a write of the catalog on the transaction of the session.
+
+    :param session: Session object of the transaction with the write.
+    :param entity: Table name of the catalog written (estado, municipio, ciudad, colonia).
+    :param key: Dictionary with the key of the row written, e.g. {'codigo_postal': '01000'}.
+    """
+
+    session.info.setdefault(CATALOG_WRITES_KEY, []).append((entity, key or {}))
+
+
+def register_catalog_listener(listener):
+    r"""
+    Register a callback notified after the commit of every write of the catalog on this process.
+
+    :param listener: Function called as listener(changes, version) where changes is a list of (entity, key).
+    """
+
+    if listener not in _catalog_listeners:
+        _catalog_listeners.append(listener)
+
+
+def notify_catalog_listeners(changes, version):
+    r"""
+    Notify the listeners registered with the changes of the catalog, the errors of a listener are logged.
+
+    :param changes: List of (entity, key) written.
+    :param version: The catalog version after the changes.
+    """
+
+    for listener in list(_catalog_listeners):
+        try:
+            listener(changes, version)
+        except Exception as exc:
+            logger.exception('An exception was occurred on the catalog listener %s: %s', str(listener), str(exc))
+
+
+def get_changed_postal_codes(changes):
+    r"""
+    Postal codes written by the changes of the catalog, when all of them are colonias with his postal code.
+    A write of estado, municipio or ciudad changes the hierarchy of all his postal codes.
+
+    :param changes: List of (entity, key) written.
+    :return postal_codes: set of str, None if the changes are not only colonias with his postal code.
+    """
+
+    postal_codes = set()
+
+    for entity, key in changes:
+        if 'colonia' != entity or not key or not key.get('codigo_postal'):
+            return None
+
+        postal_codes.add(key['codigo_postal'])
+
+    return postal_codes
+
+
+def get_catalog_version(session):
+    r"""
+    Read the version of the catalog from the database.
+
+    :param session: Session object of the database.
+    :return version, updated_date: The version of the catalog and the date of his last write.
+    """
+
+    row = session.query(CatalogVersionModel.version, CatalogVersionModel.updated_date). \
+        filter(CatalogVersionModel.id_catalog == 1).first()
+
+    if row is None:
+        return 0, None
+
+    return row.version, row.updated_date
+
+
+def set_known_catalog_version(version, updated_date):
+    r"""
+    Save the version of the catalog known by this process, an older version never replaces a newer one.
+
+    :param version: The version of the catalog.
+    :param updated_date: The date of the last write of the catalog.
+    """
+
+    global _known_version
+
+    with _known_version_lock:
+        known_version = _known_version[0]
+
+        if known_version is None or version is None or version >= known_version:
+            _known_version = (version, updated_date, time.monotonic())
+
+
+def get_known_catalog_version():
+    r"""
+    Get the version of the catalog known by this process, without read the database.
+
+    :return version: The version of the catalog, None if it was never read.
+    """
+
+    return _known_version[0]
+
+
+def get_current_catalog_version(max_age):
+    r"""
+    Get the version of the catalog known by this process, it is read again from the database when it is
+    older than max_age seconds. If the database is not available the last version known is returned.
+
+    :param max_age: Seconds the version read is valid.
+    :return version, updated_date: The version of the catalog and the date of his last write, None if unknown.
+    """
+
+    version, updated_date, read_at = _known_version
+
+    if version is not None and time.monotonic() - read_at < max_age:
+        return version, updated_date
+
+    try:
+        with session_scope() as session:
+            version, updated_date = get_catalog_version(session)
+
+        set_known_catalog_version(version, updated_date)
+
+    except SQLAlchemyError as exc:
+        logger.warning('Catalog version not read, version %s kept: %s', str(_known_version[0]), str(exc))
+
+    return _known_version[0], _known_version[1]
+
+
+def get_process_token():
+    r"""
+    Identifier of this worker on the notifications, so it doesn't process the changes it already processed.
+    """
+
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def compact_catalog_changes(changes):
+    r"""
+    Changes of the catalog by entity, with the postal codes written listed once, e.g.
+    {"colonia": {"codigo_postal": ["01000", "01010"]}, "estado": {}}. An entity with a change without
+    postal code has no keys, all of it is invalidated.
+
+    :param changes: List of (entity, key) written.
+    :return compact: Dictionary by entity.
+    """
+
+    postal_codes_by_entity = {}
+
+    for entity, key in changes:
+        postal_codes = postal_codes_by_entity.setdefault(entity, set())
+
+        if postal_codes is None:
+            continue
+
+        if key and key.get(POSTAL_CODE_KEY):
+            postal_codes.add(key[POSTAL_CODE_KEY])
+        else:
+            postal_codes_by_entity[entity] = None
+
+    return {entity: {POSTAL_CODE_KEY: sorted(postal_codes)} if postal_codes else {}
+            for entity, postal_codes in postal_codes_by_entity.items()}
+
+
+def expand_catalog_changes(compact):
+    r"""
+    List of (entity, key) of the changes compacted by compact_catalog_changes.
+
+    :param compact: Dictionary by entity.
+    :return changes: List of (entity, key).
+    """
+
+    changes = []
+
+    for entity, keys in compact.items():
+        postal_codes = keys.get(POSTAL_CODE_KEY)
+
+        if postal_codes:
+            changes.extend((entity, {POSTAL_CODE_KEY: postal_code}) for postal_code in postal_codes)
+        else:
+            changes.append((entity, {}))
+
+    return changes
+
+
+def build_catalog_payload(changes, version, updated_date):
+    r"""
+    Payload of the notification of the changes of the catalog.
+
+    :param changes: List of (entity, key) written, None if they are saved on catalog_change.
+    :param version: The catalog version after the changes.
+    :param updated_date: The date of the write.
+    :return payload: JSON str, None if the changes don't fit on the payload of NOTIFY.
+    """
+
+    message = {
+        'origin': get_process_token(),
+        'version': version,
+        'updated_date': updated_date.isoformat() if updated_date is not None else None,
+        'changes': compact_catalog_changes(changes) if changes is not None else None
+    }
+
+    payload = json.dumps(message, default=str, separators=(',', ':'))
+
+    if len(payload.encode('utf-8')) > MAX_NOTIFY_PAYLOAD:
+        return None
+
+    return payload
+
+
+def save_catalog_changes(session, changes, version):
+    r"""
+    Save the changes of a version of the catalog on catalog_change, on the transaction of the session.
+    The changes of the versions older than CATALOG_CHANGES_KEPT are deleted.
+
+    :param session: Session object of the transaction with the writes.
+    :param changes: List of (entity, key) written.
+    :param version: The catalog version after the changes.
+    """
+
+    change_table = CatalogChangeModel.__table__
+
+    session.execute(change_table.delete().where(change_table.c.version <= version - CATALOG_CHANGES_KEPT))
+    session.execute(change_table.insert().values(version=version,
+                                                 changes=json.dumps(compact_catalog_changes(changes), default=str)))
+
+
+def get_saved_catalog_changes(session, version):
+    r"""
+    Read the changes of a version of the catalog saved on catalog_change.
+
+    :param session: Session object of the database.
+    :param version: The catalog version notified.
+    :return changes: List of (entity, key), None if they are not saved (or they were already deleted).
+    """
+
+    row = session.query(CatalogChangeModel.changes).filter(CatalogChangeModel.version == version).first()
+
+    if row is None:
+        return None
+
+    return expand_catalog_changes(json.loads(row.changes))
+
+
+def publish_catalog_changes(session, changes, version, updated_date):
+    r"""
+    Publish the changes of the catalog on the transaction of the session, PostgreSQL delivers the
+    notification to the listeners only after the commit.
+
+    :param session: Session object of the transaction with the writes.
+    :param changes: List of (entity, key) written.
+    :param version: The catalog version after the changes.
+    :param updated_date: The date of the write.
+    """
+
+    if 'postgresql' != session.get_bind().dialect.name:
+        return
+
+    payload = build_catalog_payload(changes, version, updated_date)
+
+    # Too many changes, the receivers read them from catalog_change by the version
+    if payload is None:
+        save_catalog_changes(session, changes, version)
+
+        payload = build_catalog_payload(None, version, updated_date)
+
+    session.execute(select([func.pg_notify(CATALOG_CHANNEL, payload)]))
+
+
+def increment_catalog_version(session):
+    r"""
+    Increment the version of the catalog on the transaction of the session.
+
+    The transactions that write the catalog run on WRITE_ISOLATION_LEVEL, so the UPDATE of a concurrent
+    writer waits for the commit of this one and increments the version committed.
+
+    :param session: Session object of the transaction with the writes.
+    :return version, updated_date: The new version of the catalog and the date of the write.
+    """
+
+    catalog_table = CatalogVersionModel.__table__
+
+    statement = catalog_table.update().where(catalog_table.c.id_catalog == 1). \
+        values(version=catalog_table.c.version + 1, updated_date=func.now()). \
+        returning(catalog_table.c.version, catalog_table.c.updated_date)
+
+    row = session.execute(statement).first()
+
+    if row is None:
+        raise mvc_exc.DatabaseError('The row of the catalog version doesn\'t exist, the schema must be '
+                                    'bootstrapped before write the catalog (see schema_bootstrap)')
+
+    return row.version, row.updated_date
+
+
+@event.listens_for(SessionDb, 'before_commit')
+def before_commit_catalog_writes(session):
+
+    changes = session.info.get(CATALOG_WRITES_KEY)
+
+    if changes:
+        version, updated_date = session.info[CATALOG_VERSION_KEY] = increment_catalog_version(session)
+
+        publish_catalog_changes(session, changes, version, updated_date)
+
+
+@event.listens_for(SessionDb, 'after_commit')
+def after_commit_catalog_writes(session):
+
+    changes = session.info.pop(CATALOG_WRITES_KEY, None)
+    version, updated_date = session.info.pop(CATALOG_VERSION_KEY, (None, None))
+
+    if changes:
+        set_known_catalog_version(version, updated_date)
+
+        logger.info('Catalog version %s committed with %s changes', str(version), str(len(changes)))
+
+        notify_catalog_listeners(changes, version)
+
+
+@event.listens_for(SessionDb, 'after_rollback')
+def after_rollback_catalog_writes(session):
+
+    session.info.pop(CATALOG_WRITES_KEY, None)
+    session.info.pop(CATALOG_VERSION_KEY, None)
@@ -0,0 +1,738 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Bulk import of the official SEPOMEX catalog file.
+
+The file published by SEPOMEX (CPdescarga.txt) is pipe-delimited and encoded as latin-1, the first line
+is a notice and the second one the header with the names of the columns. Every line is a colonia with
+the names and keys of his estado, municipio and ciudad.
+
+Documentation:
+    The import is a full refresh of the catalog:
+    - Read the file by blocks, every block is decoded at once and split on lines, only the fields used are kept
+    - Split the file on ranges of bytes ended on a complete line, every range is parsed on a process of a pool
+    - Merge the ranges on the order of the file, the ids are resolved on memory
+    - On PostgreSQL load each table with COPY on an unlogged table of the catalog_staging schema, build his
+      indexes and run ANALYZE without lock the tables the API reads
+    - Swap the tables on one transaction, the live ones are moved to the catalog_previous schema and
+      the staging ones to public, `flask rollback-catalog` moves the previous ones back
+    - With --in-place truncate the tables of the catalog and load them with COPY on one transaction
+    - Move the sequences after the ids loaded and increment the catalog version
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import io
+import os
+import operator
+import time
+import hashlib
+import click
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from flask.cli import with_appcontext
+from apps.estado.EstadoModel import EstadoModel, ESTADO_ID_SEQ
+from apps.municipio.MunicipioModel import MunicipioModel, MUNICIPIO_ID_SEQ
+from apps.ciudad.CiudadModel import CiudadModel, CITY_ID_SEQ
+from apps.colonia.ColoniaModel import ColoniaModel, SUBURB_ID_SEQ
+from db_controller.database_backend import *
+from db_controller.catalog_events import mark_catalog_write, CATALOG_ENTITIES
+from db_controller import mvc_exceptions as mvc_exc
+
+SEPOMEX_ENCODING = 'latin-1'
+SEPOMEX_DELIMITER = '|'
+
+# Bytes of the file decoded and split on lines at once
+SEPOMEX_READ_BLOCK = 64 * 1024
+
+# First column of the header line, the lines before it are the notice of the file
+SEPOMEX_HEADER_START = 'd_codigo'
+
+# Ranges of the file by process of the pool, the ranges parsed are merged while the next ones are parsed
+SEPOMEX_CHUNKS_BY_WORKER = 4
+
+# Columns of the file used by the import
+SEPOMEX_COLUMNS = ('d_codigo', 'd_asenta', 'd_tipo_asenta', 'D_mnpio', 'd_estado', 'd_ciudad', 'c_estado',
+                   'c_mnpio', 'd_zona', 'c_cve_ciudad')
+
+# Schemas of the blue/green swap of the tables of the catalog
+LIVE_SCHEMA = 'public'
+STAGING_SCHEMA = 'catalog_staging'
+PREVIOUS_SCHEMA = 'catalog_previous'
+
+# The swap doesn't wait more than this for the reads in progress on the live tables
+SWAP_LOCK_TIMEOUT = '5s'
+
+# (model, sequence, columns) of the tables of the catalog, in the order they are loaded
+CATALOG_TABLES = (
+    (EstadoModel, ESTADO_ID_SEQ, ('id_estado', 'nombre_estado', 'clave_estado', 'row_hash')),
+    (MunicipioModel, MUNICIPIO_ID_SEQ, ('id_municipio', 'nombre_municipio', 'clave_municipio', 'id_estado',
+                                        'row_hash')),
+    (CiudadModel, CITY_ID_SEQ, ('id_ciudad', 'nombre_ciudad', 'clave_ciudad', 'id_municipio', 'row_hash')),
+    (ColoniaModel, SUBURB_ID_SEQ, ('id_colonia', 'nombre_colonia', 'tipo_asentamiento', 'zona_asentamiento',
+                                   'codigo_postal', 'id_ciudad', 'row_hash')),
+)
+
+
+def hash_row(*values):
+    r"""
+    Hash of the content of a row that is not on his natural key, compared by the catalog sync.
+
+    :param values: Values of the content of the row, the parents by his natural key.
+    :return: str with 32 hexadecimal digits.
+    """
+
+    return hashlib.md5(SEPOMEX_DELIMITER.join(str(value) for value in values).encode('utf-8')).hexdigest()
+
+
+def find_sepomex_header(sepomex_file):
+    r"""
+    Locate the header line of the SEPOMEX file, the lines before it are the notice of the file.
+
+    :param sepomex_file: File object of the SEPOMEX file opened as binary.
+    :return header, data_start, newline: List of the names of the columns, the offset of the first record and
+                                         the line terminator of the file (the official file uses CRLF).
+    """
+
+    for line in sepomex_file:
+        values = line.rstrip(b'\r\n').decode(SEPOMEX_ENCODING).split(SEPOMEX_DELIMITER)
+
+        if values[0] == SEPOMEX_HEADER_START:
+            newline = '\r\n' if line.endswith(b'\r\n') else '\n'
+
+            return values, sepomex_file.tell(), newline
+
+    raise mvc_exc.ItemNotStored('The file is not a SEPOMEX catalog, header "{}" not found'.format(
+        SEPOMEX_HEADER_START))
+
+
+def iter_sepomex_lines(sepomex_file, newline, start, end):
+    r"""
+    Iterate over the lines between two offsets of the SEPOMEX file. The bytes are read by blocks of
+    SEPOMEX_READ_BLOCK and every block is decoded at once, the line cut by the end of a block is completed
+    with the next one.
+
+    :param sepomex_file: File object of the SEPOMEX file opened as binary.
+    :param newline: Line terminator of the file.
+    :param start: Offset of the first line.
+    :param end: Offset after the last line.
+    :return: generator of list of str, the lines of every block without the line terminator.
+    """
+
+    sepomex_file.seek(start)
+
+    remaining = end - start
+    pending = ''
+
+    while True:
+        data = sepomex_file.read(min(SEPOMEX_READ_BLOCK, remaining)) if remaining > 0 else b''
+        remaining -= len(data)
+
+        text = pending + data.decode(SEPOMEX_ENCODING)
+
+        if data:
+            cut = text.rfind('\n') + 1
+            text, pending = text[:cut], text[cut:]
+
+        if text:
+            lines = text.split(newline)
+
+            # The block ends on a line terminator, the last item is empty
+            if text.endswith(newline):
+                lines.pop()
+
+            yield lines
+
+        if not data:
+            return
+
+
+def read_sepomex_records(sepomex_file, header, newline, start, end):
+    r"""
+    Read the records between two offsets of the SEPOMEX file, only the fields of SEPOMEX_COLUMNS are kept.
+    The fields of the official file are not padded, they are not stripped.
+
+    :param sepomex_file: File object of the SEPOMEX file opened as binary.
+    :param header: List of the names of the columns of the file.
+    :param newline: Line terminator of the file.
+    :param start: Offset of the first line.
+    :param end: Offset after the last line.
+    :return: generator of tuple with the values of SEPOMEX_COLUMNS.
+    """
+
+    positions = [header.index(column) for column in SEPOMEX_COLUMNS]
+    width = max(positions) + 1
+
+    get_fields = operator.itemgetter(*positions)
+
+    for lines in iter_sepomex_lines(sepomex_file, newline, start, end):
+        for line in lines:
+            values = line.split(SEPOMEX_DELIMITER)
+
+            if len(values) >= width:
+                yield get_fields(values)
+
+
+class CatalogRows:
+    r"""
+    Class to instance the rows of the catalog derived from the SEPOMEX records, the ids of every table are
+    assigned on memory by his natural key:
+     - estado: clave_estado
+     - municipio: clave_estado, clave_municipio
+     - ciudad: clave_estado, clave_municipio, clave_ciudad
+     - colonia: codigo_postal, nombre_colonia, tipo_asentamiento
+
+    The rows are tuples with the values of the columns of CATALOG_TABLES, row_hash the last one.
+    """
+
+    def __init__(self):
+        self.states = {}
+        self.towns = {}
+        self.cities = {}
+        self.suburbs = {}
+
+        self.records = 0
+
+    def add(self, record):
+        r"""
+        Add the rows of one SEPOMEX record, the rows already added are not repeated.
+
+        :param record: Sequence with the values of SEPOMEX_COLUMNS.
+        """
+
+        (postal_code, suburb_name, suburb_type, town_name, state_name, city_name, state_key, town_key,
+         suburb_zone, city_key) = record
+
+        self.records += 1
+
+        state_key = int(state_key)
+        town_key = int(town_key)
+
+        state = self.states.get(state_key)
+
+        if state is None:
+            state = self.states[state_key] = (len(self.states) + 1, state_name, state_key, hash_row(state_name))
+
+        town = self.towns.get((state_key, town_key))
+
+        if town is None:
+            town = self.towns[(state_key, town_key)] = (len(self.towns) + 1, town_name, town_key, state[0],
+                                                        hash_row(town_name))
+
+        # The rural colonias don't belong to a ciudad
+        id_ciudad = None
+        city_natural_key = None
+
+        if city_key:
+            city_natural_key = (state_key, town_key, int(city_key))
+
+            city = self.cities.get(city_natural_key)
+
+            if city is None:
+                city = self.cities[city_natural_key] = (len(self.cities) + 1, city_name, city_natural_key[2], town[0],
+                                                        hash_row(city_name))
+
+            id_ciudad = city[0]
+
+        suburb_key = (postal_code, suburb_name, suburb_type)
+
+        if suburb_key not in self.suburbs:
+            self.suburbs[suburb_key] = (len(self.suburbs) + 1, suburb_name, suburb_type, suburb_zone, postal_code,
+                                        id_ciudad, hash_row(suburb_zone, city_natural_key))
+
+    def merge(self, partition):
+        r"""
+        Add the rows of a partition parsed on his own, his ids are resolved again on the ids of this catalog.
+
+        :param partition: CatalogRows object of the partition.
+        """
+
+        self.records += partition.records
+
+        state_ids = {}
+        town_ids = {}
+        city_ids = {None: None}
+
+        for state_key, (state_id, state_name, clave_estado, row_hash) in partition.states.items():
+            state = self.states.get(state_key)
+
+            if state is None:
+                state = self.states[state_key] = (len(self.states) + 1, state_name, clave_estado, row_hash)
+
+            state_ids[state_id] = state[0]
+
+        for town_key, (town_id, town_name, clave_municipio, id_estado, row_hash) in partition.towns.items():
+            town = self.towns.get(town_key)
+
+            if town is None:
+                town = self.towns[town_key] = (len(self.towns) + 1, town_name, clave_municipio, state_ids[id_estado],
+                                               row_hash)
+
+            town_ids[town_id] = town[0]
+
+        for city_key, (city_id, city_name, clave_ciudad, id_municipio, row_hash) in partition.cities.items():
+            city = self.cities.get(city_key)
+
+            if city is None:
+                city = self.cities[city_key] = (len(self.cities) + 1, city_name, clave_ciudad, town_ids[id_municipio],
+                                                row_hash)
+
+            city_ids[city_id] = city[0]
+
+        for suburb_key, (suburb_id, suburb_name, suburb_type, suburb_zone, postal_code,
+                         id_ciudad, row_hash) in partition.suburbs.items():
+
+            if suburb_key not in self.suburbs:
+                self.suburbs[suburb_key] = (len(self.suburbs) + 1, suburb_name, suburb_type, suburb_zone, postal_code,
+                                            city_ids[id_ciudad], row_hash)
+
+    def get_table_rows(self):
+        r"""
+        Rows of every table of the catalog, in the order of CATALOG_TABLES.
+
+        :return: list of (model, sequence, columns, rows)
+        """
+
+        table_rows = (self.states, self.towns, self.cities, self.suburbs)
+
+        return [(model, sequence, columns, list(rows.values()))
+                for (model, sequence, columns), rows in zip(CATALOG_TABLES, table_rows)]
+
+    def get_stats(self):
+        return {
+            "records": self.records,
+            "estado": len(self.states),
+            "municipio": len(self.towns),
+            "ciudad": len(self.cities),
+            "colonia": len(self.suburbs)
+        }
+
+
+def build_catalog_rows(records):
+    r"""
+    Derive the rows of the catalog from the SEPOMEX records.
+
+    :param records: Iterable of sequences with the values of SEPOMEX_COLUMNS.
+    :return catalog_rows: CatalogRows object.
+    """
+
+    catalog_rows = CatalogRows()
+
+    for record in records:
+        catalog_rows.add(record)
+
+    return catalog_rows
+
+
+def split_sepomex_file(sepomex_file, data_start, end, chunks):
+    r"""
+    Split the records of the SEPOMEX file on ranges of bytes of about the same size, every range ends on a
+    complete line. The records are not read, only one line by range to find his end.
+
+    :param sepomex_file: File object of the SEPOMEX file opened as binary.
+    :param data_start: Offset of the first record.
+    :param end: Size of the file.
+    :param chunks: Number of ranges requested.
+    :return ranges: list of (start, end) offsets, on the order of the file.
+    """
+
+    bounds = [data_start]
+
+    for number in range(1, chunks):
+        offset = data_start + (end - data_start) * number // chunks
+
+        if offset <= bounds[-1]:
+            continue
+
+        sepomex_file.seek(offset - 1)
+        sepomex_file.readline()
+
+        bounds.append(min(sepomex_file.tell(), end))
+
+    bounds.append(end)
+
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if start < stop]
+
+
+def parse_partition(path, header, newline, start, end):
+    r"""
+    Parse and normalize a range of the SEPOMEX file, it runs on a process of the pool that opens the file
+    again, only the offsets of the range are sent to it.
+
+    :param path: Path of the SEPOMEX file.
+    :param header: List of the names of the columns of the file.
+    :param newline: Line terminator of the file.
+    :param start: Offset of the first line of the range.
+    :param end: Offset after the last line of the range.
+    :return catalog_rows: CatalogRows object with the ids of the range.
+    """
+
+    with open(path, 'rb') as sepomex_file:
+        return build_catalog_rows(read_sepomex_records(sepomex_file, header, newline, start, end))
+
+
+def parse_sepomex_file(path, workers=1):
+    r"""
+    Parse the SEPOMEX file split on ranges of bytes on a pool of processes. The ranges are merged on the
+    order of the file while the next ones are parsed, so the ids are the same for any number of processes.
+
+    :param path: Path of the SEPOMEX file.
+    :param workers: Number of processes that parse the ranges, 1 parses the file on this process.
+    :return catalog_rows: CatalogRows object.
+    """
+
+    with open(path, 'rb') as sepomex_file:
+        header, data_start, newline = find_sepomex_header(sepomex_file)
+
+        end = os.fstat(sepomex_file.fileno()).st_size
+
+        if workers <= 1:
+            return build_catalog_rows(read_sepomex_records(sepomex_file, header, newline, data_start, end))
+
+        ranges = split_sepomex_file(sepomex_file, data_start, end, workers * SEPOMEX_CHUNKS_BY_WORKER)
+
+    catalog_rows = CatalogRows()
+
+    if not ranges:
+        return catalog_rows
+
+    starts, ends = zip(*ranges)
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        for partition in executor.map(parse_partition, repeat(path), repeat(header), repeat(newline), starts, ends):
+            catalog_rows.merge(partition)
+
+    return catalog_rows
+
+
+def encode_copy_value(value):
+    r"""
+    Encode a value on the text format of COPY.
+    """
+
+    if value is None:
+        return '\\N'
+
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(connection, table_name, columns, rows):
+    r"""
+    Load the rows on a table with COPY FROM STDIN of PostgreSQL.
+
+    :param connection: Connection object of the transaction of the import.
+    :param table_name: Name of the table to load.
+    :param columns: Names of the columns of the rows.
+    :param rows: List of tuple with the values of the columns.
+    """
+
+    buffer = io.StringIO()
+
+    for row in rows:
+        buffer.write('\t'.join(encode_copy_value(value) for value in row))
+        buffer.write('\n')
+
+    buffer.seek(0)
+
+    cursor = connection.connection.cursor()
+
+    try:
+        cursor.copy_expert('COPY {} ({}) FROM STDIN'.format(table_name, ', '.join(columns)), buffer)
+    finally:
+        cursor.close()
+
+
+def delete_catalog(connection):
+    r"""
+    Delete the rows of all the tables of the catalog, the children first.
+
+    :param connection: Connection object of the transaction of the import.
+    """
+
+    table_names = [model.__tablename__ for model, sequence, columns in reversed(CATALOG_TABLES)]
+
+    connection.execute('TRUNCATE TABLE {}'.format(', '.join(table_names)))
+
+
+def reset_catalog_sequences(connection):
+    r"""
+    Move the sequences of the catalog after the max id of his table, the next rows inserted by the API
+    continue after the ids loaded.
+
+    :param connection: Connection object of the transaction of the import.
+    """
+
+    for model, sequence, columns in CATALOG_TABLES:
+        id_column = columns[0]
+
+        connection.execute('SELECT setval(\'{0}\', COALESCE((SELECT max({1}) FROM {2}), 1), '
+                           '(SELECT max({1}) FROM {2}) IS NOT NULL)'.format(sequence.name, id_column,
+                                                                             model.__tablename__))
+
+
+def create_staging_tables(connection):
+    r"""
+    Create the tables of the catalog on STAGING_SCHEMA as unlogged tables like the live ones, without
+    indexes, so COPY doesn't write the WAL nor update indexes. A staging left by a failed import is dropped.
+
+    :param connection: Connection object of the transaction of the staging.
+    """
+
+    connection.execute('CREATE SCHEMA IF NOT EXISTS {}'.format(STAGING_SCHEMA))
+
+    for model, sequence, columns in reversed(CATALOG_TABLES):
+        connection.execute('DROP TABLE IF EXISTS {}.{} CASCADE'.format(STAGING_SCHEMA, model.__tablename__))
+
+    for model, sequence, columns in CATALOG_TABLES:
+        connection.execute('CREATE UNLOGGED TABLE {0}.{1} (LIKE {2}.{1} INCLUDING DEFAULTS)'.format(
+            STAGING_SCHEMA, model.__tablename__, LIVE_SCHEMA))
+
+
+def build_staging_indexes(connection):
+    r"""
+    Build the primary keys, indexes and FKs declared on the models on the staging tables, then make them
+    logged so they survive a crash once they are live, and analyze them.
+
+    :param connection: Connection object of the transaction of the staging.
+    """
+
+    for model, sequence, columns in CATALOG_TABLES:
+        table_name = '{}.{}'.format(STAGING_SCHEMA, model.__tablename__)
+
+        connection.execute('ALTER TABLE {} ADD PRIMARY KEY ({})'.format(table_name, columns[0]))
+
+        for index in model.__table__.indexes:
+            index_columns = ', '.join(column.name for column in index.columns)
+
+            connection.execute('CREATE {}INDEX {} ON {} ({})'.format('UNIQUE ' if index.unique else '', index.name,
+                                                                     table_name, index_columns))
+
+        for foreign_key in model.__table__.foreign_keys:
+            connection.execute('ALTER TABLE {0} ADD CONSTRAINT {1}_{2}_fkey FOREIGN KEY ({2}) '
+                               'REFERENCES {3}.{4} ({5}) ON UPDATE {6} ON DELETE {7}'.format(
+                                   table_name, model.__tablename__, foreign_key.parent.name, STAGING_SCHEMA,
+                                   foreign_key.column.table.name, foreign_key.column.name,
+                                   foreign_key.onupdate or 'NO ACTION', foreign_key.ondelete or 'NO ACTION'))
+
+    # The parents are logged first, a logged table can't reference an unlogged one
+    for model, sequence, columns in CATALOG_TABLES:
+        connection.execute('ALTER TABLE {}.{} SET LOGGED'.format(STAGING_SCHEMA, model.__tablename__))
+
+    for model, sequence, columns in CATALOG_TABLES:
+        connection.execute('ANALYZE {}.{}'.format(STAGING_SCHEMA, model.__tablename__))
+
+
+def load_staging_catalog(catalog_rows):
+    r"""
+    Load the rows derived from the SEPOMEX file on the staging tables, the live tables are not locked.
+
+    :param catalog_rows: CatalogRows object.
+    """
+
+    with session_scope() as session:
+        connection = session.connection()
+
+        create_staging_tables(connection)
+
+        for model, sequence, columns, rows in catalog_rows.get_table_rows():
+            copy_rows(connection, '{}.{}'.format(STAGING_SCHEMA, model.__tablename__), columns, rows)
+
+            logger.info('Rows loaded on %s.%s: %s', STAGING_SCHEMA, model.__tablename__, str(len(rows)))
+
+        build_staging_indexes(connection)
+
+
+def get_schema_tables(connection, schema):
+    r"""
+    Names of the tables of the catalog on a schema.
+    """
+
+    rows = connection.execute('SELECT tablename FROM pg_tables WHERE schemaname = %s', (schema,))
+
+    catalog_names = set(model.__tablename__ for model, sequence, columns in CATALOG_TABLES)
+
+    return set(row.tablename for row in rows) & catalog_names
+
+
+def rotate_catalog_tables(session, moves):
+    r"""
+    Move the tables of the catalog between schemas on the transaction of the session, the readers of the API
+    wait only for the rename. The sequences are moved after the ids of the new live tables and the writes of
+    all the catalog are recorded, so the caches of the workers are invalidated after the commit.
+
+    :param session: Session object of the transaction of the swap.
+    :param moves: List of (from schema, to schema) in the order to apply.
+    """
+
+    connection = session.connection()
+
+    table_names = [model.__tablename__ for model, sequence, columns in CATALOG_TABLES]
+
+    connection.execute('SET LOCAL lock_timeout = \'{}\''.format(SWAP_LOCK_TIMEOUT))
+    connection.execute('LOCK TABLE {} IN ACCESS EXCLUSIVE MODE'.format(
+        ', '.join('{}.{}'.format(LIVE_SCHEMA, table_name) for table_name in table_names)))
+
+    for from_schema, to_schema in moves:
+        connection.execute('CREATE SCHEMA IF NOT EXISTS {}'.format(to_schema))
+
+        for table_name in table_names:
+            connection.execute('ALTER TABLE {}.{} SET SCHEMA {}'.format(from_schema, table_name, to_schema))
+
+    reset_catalog_sequences(connection)
+
+    for entity in CATALOG_ENTITIES:
+        mark_catalog_write(session, entity)
+
+
+def swap_catalog():
+    r"""
+    Make live the tables loaded on the staging schema, the live ones are kept on the previous schema
+    until the next swap.
+    """
+
+    with session_scope(WRITE_ISOLATION_LEVEL) as session:
+        connection = session.connection()
+
+        for model, sequence, columns in reversed(CATALOG_TABLES):
+            connection.execute('DROP TABLE IF EXISTS {}.{} CASCADE'.format(PREVIOUS_SCHEMA, model.__tablename__))
+
+        rotate_catalog_tables(session, [(LIVE_SCHEMA, PREVIOUS_SCHEMA), (STAGING_SCHEMA, LIVE_SCHEMA)])
+
+    logger.info('Catalog tables swapped, previous tables kept on %s', PREVIOUS_SCHEMA)
+
+
+def rollback_catalog():
+    r"""
+    Make live again the tables of the previous import, the tables replaced are kept on the previous schema
+    so the rollback can be reverted with other rollback.
+    """
+
+    try:
+        with session_scope(WRITE_ISOLATION_LEVEL) as session:
+            connection = session.connection()
+
+            if len(get_schema_tables(connection, PREVIOUS_SCHEMA)) < len(CATALOG_TABLES):
+                raise mvc_exc.ItemNotStored('There are no previous catalog tables on "{}"'.format(PREVIOUS_SCHEMA))
+
+            for model, sequence, columns in reversed(CATALOG_TABLES):
+                connection.execute('DROP TABLE IF EXISTS {}.{} CASCADE'.format(STAGING_SCHEMA, model.__tablename__))
+
+            rotate_catalog_tables(session, [(LIVE_SCHEMA, STAGING_SCHEMA), (PREVIOUS_SCHEMA, LIVE_SCHEMA),
+                                            (STAGING_SCHEMA, PREVIOUS_SCHEMA)])
+
+    except SQLAlchemyError as exc:
+        logger.exception('An exception was occurred while rollback the catalog: %s', str(exc))
+        raise mvc_exc.DatabaseError(
+            'Can\'t rollback the SEPOMEX catalog.\nOriginal Exception raised: {}'.format(exc)
+        )
+
+    logger.info('Catalog tables rolled back from %s', PREVIOUS_SCHEMA)
+
+
+def load_catalog(session, catalog_rows):
+    r"""
+    Replace the rows of the catalog with the rows derived from the SEPOMEX file, on the transaction of the
+    session. The caches of the workers are invalidated after the commit by the catalog version.
+
+    :param session: Session object of the transaction of the import.
+    :param catalog_rows: CatalogRows object.
+    """
+
+    connection = session.connection()
+
+    delete_catalog(connection)
+
+    for model, sequence, columns, rows in catalog_rows.get_table_rows():
+        copy_rows(connection, model.__tablename__, columns, rows)
+
+        logger.info('Rows loaded on %s: %s', model.__tablename__, str(len(rows)))
+
+    reset_catalog_sequences(connection)
+
+    for model, sequence, columns in CATALOG_TABLES:
+        connection.execute('ANALYZE {}'.format(model.__tablename__))
+
+    for entity in CATALOG_ENTITIES:
+        mark_catalog_write(session, entity)
+
+
+def import_catalog(path, workers=None, in_place=False):
+    r"""
+    Import the SEPOMEX file as a full refresh of the catalog, on PostgreSQL the tables loaded are swapped
+    with the live ones.
+
+    :param path: Path of the SEPOMEX file.
+    :param workers: Number of processes that parse the file, CATALOG_IMPORT_WORKERS by default.
+    :param in_place: Replace the rows of the live tables on one transaction instead of the swap.
+    :return stats: Dictionary with the rows by table and the seconds of the parse and the load.
+    """
+
+    if workers is None:
+        workers = cfg_app.catalog_import_workers
+
+    # COPY, the sequences and the swap of schemas are of PostgreSQL
+    if 'postgresql' != get_engine_db().dialect.name:
+        raise mvc_exc.DatabaseError('The SEPOMEX catalog can be imported only on a PostgreSQL database')
+
+    started = time.perf_counter()
+
+    catalog_rows = parse_sepomex_file(path, workers)
+
+    parsed = time.perf_counter()
+
+    logger.info('SEPOMEX file parsed: %s', str(catalog_rows.get_stats()))
+
+    try:
+        if not in_place:
+            load_staging_catalog(catalog_rows)
+
+            swap_catalog()
+        else:
+            with session_scope(WRITE_ISOLATION_LEVEL) as session:
+                load_catalog(session, catalog_rows)
+
+    except SQLAlchemyError as exc:
+        logger.exception('An exception was occurred while import the catalog: %s', str(exc))
+        raise mvc_exc.DatabaseError(
+            'Can\'t import the SEPOMEX catalog "{}".\nOriginal Exception raised: {}'.format(path, exc)
+        )
+
+    stats = catalog_rows.get_stats()
+
+    stats['workers'] = workers
+    stats['parse_seconds'] = round(parsed - started, 3)
+    stats['load_seconds'] = round(time.perf_counter() - parsed, 3)
+
+    return stats
+
+
+@click.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help='Processes that parse the file, CATALOG_IMPORT_WORKERS by default.')
+@click.option('--in-place', is_flag=True, help='Replace the rows of the live tables instead of swap them.')
+@with_appcontext
+def import_catalog_command(path, workers, in_place):
+    """Replace the catalog with the rows of the official SEPOMEX file (CPdescarga.txt)."""
+
+    stats = import_catalog(path, workers, in_place)
+
+    click.echo('Catalog imported: {}'.format(stats))
+
+
+@click.command('rollback-catalog')
+@with_appcontext
+def rollback_catalog_command():
+    """Make live again the catalog tables replaced by the last import."""
+
+    rollback_catalog()
+
+    click.echo('Catalog tables rolled back from {}'.format(PREVIOUS_SCHEMA))
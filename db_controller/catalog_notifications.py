@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+PostgreSQL LISTEN of the writes of the catalog committed by the other workers.
+
+Every worker runs one thread with his own connection listening on CATALOG_CHANNEL, the changes received are
+dispatched to the catalog listeners of the process (caches and in-memory indexes), as the writes committed
+by the worker itself. The thread is started once by process, a worker forked from a master that already
+started it (gunicorn --preload) opens his own connection.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+import os
+import select
+import threading
+from datetime import datetime
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from db_controller.database_backend import *
+from db_controller.catalog_events import CATALOG_CHANNEL, CATALOG_ENTITIES, get_process_token, get_catalog_version, \
+    get_known_catalog_version, notify_catalog_listeners, set_known_catalog_version, expand_catalog_changes, \
+    get_saved_catalog_changes
+
+# Seconds waiting notifications between the checks of the stop, and before reconnect after an error
+LISTEN_POLL_SECONDS = 5
+RECONNECT_SECONDS = 5
+
+
+class CatalogNotificationListener:
+    r"""
+    Class to instance the thread that listen the notifications of the catalog.
+    """
+
+    def __init__(self, engine_db=None):
+        self.engine_db = engine_db
+        self.received = 0
+
+        self._reset()
+
+        # The thread of the parent is not copied to a child process, and his connection is not closed by the
+        # child (it would close the one of the parent)
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._connection = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._pid = None
+
+    def start(self):
+        r"""
+        Start the listener thread once by process, it is a daemon so it doesn't hold the exit of the worker.
+        """
+
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+
+        self._thread = threading.Thread(target=self._run, name='catalog-listener', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(LISTEN_POLL_SECONDS + 1)
+
+    def connect(self):
+        r"""
+        Open a connection out of the pool of the engine, in autocommit, listening on the channel.
+
+        :return connection: DBAPI connection object.
+        """
+
+        engine_db = self.engine_db or get_engine_db()
+
+        pool_connection = engine_db.raw_connection()
+        pool_connection.detach()
+
+        connection = pool_connection.connection
+        connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+
+        with connection.cursor() as cursor:
+            cursor.execute('LISTEN {}'.format(CATALOG_CHANNEL))
+
+        logger.info('Listening the catalog notifications on channel %s', CATALOG_CHANNEL)
+
+        return connection
+
+    def _run(self):
+
+        while not self._stop.is_set():
+
+            try:
+                if self._connection is None:
+                    self._connection = self.connect()
+
+                    self.resync()
+
+                if select.select([self._connection], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                    continue
+
+                self._connection.poll()
+
+                while self._connection.notifies:
+                    self.dispatch(self._connection.notifies.pop(0).payload)
+
+            except Exception as exc:
+                logger.warning('Catalog listener disconnected, reconnect in %s seconds: %s',
+                               str(RECONNECT_SECONDS), str(exc))
+
+                self.close()
+                self._stop.wait(RECONNECT_SECONDS)
+
+        self.close()
+
+    def close(self):
+        connection, self._connection = self._connection, None
+
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def resync(self):
+        r"""
+        Compare the catalog version after (re)connect, the notifications sent while the listener was
+        disconnected are lost, so all the entities are invalidated if the version changed.
+        """
+
+        known_version = get_known_catalog_version()
+
+        with session_scope() as session:
+            version, updated_date = get_catalog_version(session)
+
+        if known_version is not None and version != known_version:
+            logger.info('Catalog version changed from %s to %s while disconnected', str(known_version), str(version))
+
+            set_known_catalog_version(version, updated_date)
+
+            notify_catalog_listeners([(entity, {}) for entity in CATALOG_ENTITIES], version)
+
+    def read_saved_changes(self, version):
+        r"""
+        Read the changes of a notification too big for his payload, if they are not available all the
+        entities are invalidated.
+
+        :param version: The catalog version notified.
+        :return changes: List of (entity, key).
+        """
+
+        changes = None
+
+        try:
+            with session_scope() as session:
+                changes = get_saved_catalog_changes(session, version)
+
+        except SQLAlchemyError as exc:
+            logger.warning('Changes of the catalog version %s not read: %s', str(version), str(exc))
+
+        if changes is None:
+            changes = [(entity, {}) for entity in CATALOG_ENTITIES]
+
+        return changes
+
+    def dispatch(self, payload):
+        r"""
+        Dispatch the changes of a notification to the catalog listeners of this process.
+
+        :param payload: JSON str published by catalog_events.publish_catalog_changes.
+        """
+
+        message = json.loads(payload)
+
+        # The writes of this worker were dispatched after his commit
+        if message.get('origin') == get_process_token():
+            return
+
+        self.received += 1
+
+        version = message.get('version')
+        updated_date = message.get('updated_date')
+
+        if message.get('changes') is not None:
+            changes = expand_catalog_changes(message['changes'])
+        else:
+            changes = self.read_saved_changes(version)
+
+        set_known_catalog_version(version, datetime.fromisoformat(updated_date) if updated_date else None)
+
+        logger.info('Catalog version %s notified by %s with %s changes', str(version), message.get('origin'),
+                    str(len(changes)))
+
+        notify_catalog_listeners(changes, version)
+
+
+catalog_listener = CatalogNotificationListener()
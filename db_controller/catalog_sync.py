@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Incremental sync of the catalog with the official SEPOMEX file.
+
+The updates published by SEPOMEX touch a few hundred postal codes, the sync applies only the rows
+that changed instead of a full import.
+
+Documentation:
+    Every table of the catalog stores the hash of the content of his rows (row_hash), the sync:
+    - Parse the file as the import and hash every row by his natural key
+    - Read the natural keys and hashes of the rows on the database
+    - Insert the new rows, update the rows with a different hash and delete the rows not on the file,
+      with one statement by table and operation
+    - Record the writes only of the tables and postal codes changed, and report the changes
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+import time
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, bindparam
+from apps.estado.EstadoModel import EstadoModel
+from apps.municipio.MunicipioModel import MunicipioModel
+from apps.ciudad.CiudadModel import CiudadModel
+from apps.colonia.ColoniaModel import ColoniaModel
+from db_controller.database_backend import *
+from db_controller.catalog_events import mark_catalog_write
+from db_controller.catalog_import import parse_sepomex_file
+from db_controller import mvc_exceptions as mvc_exc
+
+# Ids by statement of the deletes
+DELETE_BATCH_SIZE = 1000
+
+estado_table = EstadoModel.__table__
+municipio_table = MunicipioModel.__table__
+ciudad_table = CiudadModel.__table__
+colonia_table = ColoniaModel.__table__
+
+
+def read_catalog_keys(connection, entity):
+    r"""
+    Read the rows of a table of the catalog by his natural key.
+
+    :param connection: Connection object of the transaction of the sync.
+    :param entity: Table name of the catalog (estado, municipio, ciudad, colonia).
+    :return keys: Dictionary natural key -> (id, row_hash)
+    """
+
+    if 'estado' == entity:
+        query = select([estado_table.c.id_estado, estado_table.c.clave_estado, estado_table.c.row_hash])
+
+    elif 'municipio' == entity:
+        query = select([municipio_table.c.id_municipio, estado_table.c.clave_estado, municipio_table.c.clave_municipio,
+                        municipio_table.c.row_hash]). \
+            select_from(municipio_table.join(estado_table, municipio_table.c.id_estado == estado_table.c.id_estado))
+
+    elif 'ciudad' == entity:
+        query = select([ciudad_table.c.id_ciudad, estado_table.c.clave_estado, municipio_table.c.clave_municipio,
+                        ciudad_table.c.clave_ciudad, ciudad_table.c.row_hash]). \
+            select_from(ciudad_table.
+                        join(municipio_table, ciudad_table.c.id_municipio == municipio_table.c.id_municipio).
+                        join(estado_table, municipio_table.c.id_estado == estado_table.c.id_estado))
+
+    else:
+        query = select([colonia_table.c.id_colonia, colonia_table.c.codigo_postal, colonia_table.c.nombre_colonia,
+                        colonia_table.c.tipo_asentamiento, colonia_table.c.row_hash])
+
+    keys = {}
+
+    for row in connection.execute(query):
+        natural_key = tuple(row[1:-1])
+
+        keys[natural_key[0] if len(natural_key) == 1 else natural_key] = (row[0], row[-1])
+
+    return keys
+
+
+def get_source_rows(catalog_rows):
+    r"""
+    Rows of every table of the SEPOMEX file by his natural key, with the natural key of his parent.
+
+    :param catalog_rows: CatalogRows object.
+    :return: list of (entity, table, id column, parent column, rows) where rows is a dictionary
+             natural key -> (values, parent natural key), in the order the tables are written.
+    """
+
+    city_keys = {city[0]: city_key for city_key, city in catalog_rows.cities.items()}
+
+    states = {state_key: ({'nombre_estado': name, 'clave_estado': clave, 'row_hash': row_hash}, None)
+              for state_key, (row_id, name, clave, row_hash) in catalog_rows.states.items()}
+
+    towns = {town_key: ({'nombre_municipio': name, 'clave_municipio': clave, 'row_hash': row_hash}, town_key[0])
+             for town_key, (row_id, name, clave, parent_id, row_hash) in catalog_rows.towns.items()}
+
+    cities = {city_key: ({'nombre_ciudad': name, 'clave_ciudad': clave, 'row_hash': row_hash}, city_key[:2])
+              for city_key, (row_id, name, clave, parent_id, row_hash) in catalog_rows.cities.items()}
+
+    suburbs = {suburb_key: ({'nombre_colonia': name, 'tipo_asentamiento': suburb_type, 'zona_asentamiento': zone,
+                             'codigo_postal': postal_code, 'row_hash': row_hash}, city_keys.get(parent_id))
+               for suburb_key, (row_id, name, suburb_type, zone, postal_code, parent_id, row_hash)
+               in catalog_rows.suburbs.items()}
+
+    return [
+        ('estado', estado_table, estado_table.c.id_estado, None, states),
+        ('municipio', municipio_table, municipio_table.c.id_municipio, 'id_estado', towns),
+        ('ciudad', ciudad_table, ciudad_table.c.id_ciudad, 'id_municipio', cities),
+        ('colonia', colonia_table, colonia_table.c.id_colonia, 'id_ciudad', suburbs),
+    ]
+
+
+def diff_rows(source_rows, target_keys):
+    r"""
+    Compare the rows of the file with the rows on the database by natural key and hash.
+
+    :param source_rows: Dictionary natural key -> (values, parent natural key) of the file.
+    :param target_keys: Dictionary natural key -> (id, row_hash) of the database.
+    :return inserted, updated, deleted: Lists of natural keys.
+    """
+
+    inserted = [key for key in source_rows if key not in target_keys]
+    updated = [key for key, (values, parent_key) in source_rows.items()
+               if key in target_keys and target_keys[key][1] != values['row_hash']]
+    deleted = [key for key in target_keys if key not in source_rows]
+
+    return inserted, updated, deleted
+
+
+def get_change_key(entity, natural_key):
+    r"""
+    Key of a change of the estado, municipio or ciudad tables recorded for the invalidation of the caches.
+    """
+
+    if 'estado' == entity:
+        return {'clave_estado': natural_key}
+
+    return dict(zip(('clave_estado', 'clave_municipio', 'clave_ciudad'), natural_key))
+
+
+def sync_catalog_rows(session, catalog_rows, dry_run=False):
+    r"""
+    Apply on the transaction of the session only the differences between the catalog and the SEPOMEX file.
+    The parents are written first so the new children find his id, the deletes are applied at the end with
+    the children first.
+
+    :param session: Session object of the transaction of the sync.
+    :param catalog_rows: CatalogRows object of the file.
+    :param dry_run: Only compare, nothing is written.
+    :return report: Dictionary with the rows inserted, updated, deleted and unchanged by table and the postal
+                    codes changed.
+    """
+
+    connection = session.connection()
+
+    report = {}
+    deletes = []
+    changed_postal_codes = set()
+
+    parent_ids = {}
+
+    for entity, table, id_column, parent_column, source_rows in get_source_rows(catalog_rows):
+
+        target_keys = read_catalog_keys(connection, entity)
+
+        inserted, updated, deleted = diff_rows(source_rows, target_keys)
+
+        report[entity] = {
+            "inserted": len(inserted),
+            "updated": len(updated),
+            "deleted": len(deleted),
+            "unchanged": len(source_rows) - len(inserted) - len(updated)
+        }
+
+        logger.info('Catalog sync of %s: %s', entity, str(report[entity]))
+
+        if 'colonia' == entity:
+            changed_postal_codes.update(key[0] for key in inserted + updated + deleted)
+
+        deletes.append((entity, table, id_column, [target_keys[key][0] for key in deleted]))
+
+        def get_values(key):
+            values, parent_key = source_rows[key]
+
+            if parent_column is not None:
+                values = dict(values)
+                values[parent_column] = parent_ids.get(parent_key)
+
+            return values
+
+        if not dry_run:
+            if inserted:
+                connection.execute(table.insert(), [get_values(key) for key in inserted])
+
+            if updated:
+                connection.execute(table.update().where(id_column == bindparam('row_id')),
+                                   [dict(get_values(key), row_id=target_keys[key][0]) for key in updated])
+
+            if 'colonia' != entity:
+                for key in inserted + updated + deleted:
+                    mark_catalog_write(session, entity, get_change_key(entity, key))
+
+            # The children of the new rows need his ids
+            if inserted and 'colonia' != entity:
+                target_keys = read_catalog_keys(connection, entity)
+
+        parent_ids = {key: row_id for key, (row_id, row_hash) in target_keys.items()}
+
+    if not dry_run:
+        for entity, table, id_column, row_ids in reversed(deletes):
+            for start in range(0, len(row_ids), DELETE_BATCH_SIZE):
+                connection.execute(table.delete().where(id_column.in_(row_ids[start:start + DELETE_BATCH_SIZE])))
+
+        # The colonias are recorded once by postal code
+        for postal_code in sorted(changed_postal_codes):
+            mark_catalog_write(session, ColoniaModel.__tablename__, {'codigo_postal': postal_code})
+
+    report['codigo_postal'] = sorted(changed_postal_codes)
+
+    return report
+
+
+def sync_catalog(path, workers=None, dry_run=False):
+    r"""
+    Sync the catalog with the SEPOMEX file, only the rows changed are written.
+
+    :param path: Path of the SEPOMEX file.
+    :param workers: Number of processes that parse the file, CATALOG_IMPORT_WORKERS by default.
+    :param dry_run: Only compare, nothing is written.
+    :return report: Dictionary with the changes by table, the postal codes changed and the seconds of the
+                    parse and the sync.
+    """
+
+    if workers is None:
+        workers = cfg_app.catalog_import_workers
+
+    started = time.perf_counter()
+
+    catalog_rows = parse_sepomex_file(path, workers)
+
+    parsed = time.perf_counter()
+
+    try:
+        with session_scope(WRITE_ISOLATION_LEVEL) as session:
+            report = sync_catalog_rows(session, catalog_rows, dry_run)
+
+    except SQLAlchemyError as exc:
+        logger.exception('An exception was occurred while sync the catalog: %s', str(exc))
+        raise mvc_exc.DatabaseError(
+            'Can\'t sync the SEPOMEX catalog "{}".\nOriginal Exception raised: {}'.format(path, exc)
+        )
+
+    report['dry_run'] = dry_run
+    report['parse_seconds'] = round(parsed - started, 3)
+    report['sync_seconds'] = round(time.perf_counter() - parsed, 3)
+
+    return report
+
+
+@click.command('sync-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help='Processes that parse the file, CATALOG_IMPORT_WORKERS by default.')
+@click.option('--dry-run', is_flag=True, help='Only report the changes, nothing is written.')
+@with_appcontext
+def sync_catalog_command(path, workers, dry_run):
+    """Apply only the changes of the official SEPOMEX file (CPdescarga.txt) on the catalog."""
+
+    report = sync_catalog(path, workers, dry_run)
+
+    click.echo(json.dumps(report, indent=2))
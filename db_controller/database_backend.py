@@ -12,10 +12,14 @@ __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
 import json
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 import psycopg2
+from flask import g, request
 from sqlalchemy import create_engine, ForeignKey
+from sqlalchemy.pool import QueuePool
 from sqlalchemy_utils import database_exists, create_database
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.exc import SQLAlchemyError
@@ -40,23 +44,68 @@ logging.getLogger('sqlalchemy.engine').setLevel(logging.DEBUG)
 
 
 def create_engine_db():
+    r"""
+    Create the database engine with a QueuePool sized by the settings of the API.
 
-    # For Test connection:
+    :return engine: Engine object to checkout connections from the pool.
+    """
 
-    engine = create_engine(cfg_db.Development.SQLALCHEMY_DATABASE_URI.__str__(),
-                           client_encoding="utf8",
-                           execution_options={"isolation_level": "REPEATABLE READ"})
+    database_uri = cfg_db.Development.SQLALCHEMY_DATABASE_URI.__str__()
 
     if not 'development' == cfg_app.flask_api_env:
-        engine = create_engine(cfg_db.Production.SQLALCHEMY_DATABASE_URI.__str__(),
-                               client_encoding="utf8",
-                               execution_options={"isolation_level": "REPEATABLE READ"})
+        database_uri = cfg_db.Production.SQLALCHEMY_DATABASE_URI.__str__()
 
-    logger.info("Engine Created by URL: {}".format(cfg_db.Development.SQLALCHEMY_DATABASE_URI.__str__()))
+    engine = create_engine(database_uri,
+                           client_encoding="utf8",
+                           poolclass=QueuePool,
+                           pool_size=cfg_db.pool_size,
+                           max_overflow=cfg_db.pool_max_overflow,
+                           pool_timeout=cfg_db.pool_timeout,
+                           pool_recycle=cfg_db.pool_recycle,
+                           pool_pre_ping=cfg_db.pool_pre_ping,
+                           execution_options={"isolation_level": "REPEATABLE READ"})
+
+    logger.info("Engine Created by URL: {}, Pool Size: {}, Max Overflow: {}".format(engine.url.__repr__(),
+                                                                                 cfg_db.pool_size,
+                                                                                 cfg_db.pool_max_overflow))
 
     return engine
 
 
+_engine_db = None
+_engine_lock = threading.Lock()
+
+
+def get_engine_db():
+    r"""
+    Get the engine shared by the whole process, it is created only the first time is requested.
+
+    :return engine: Engine object shared by all the requests of the API.
+    """
+
+    global _engine_db
+
+    if _engine_db is None:
+        with _engine_lock:
+            if _engine_db is None:
+                _engine_db = create_engine_db()
+
+    return _engine_db
+
+
+def dispose_engine_db():
+    r"""
+    Close all the connections of the pool, used when the worker process exits.
+    """
+
+    global _engine_db
+
+    with _engine_lock:
+        if _engine_db is not None:
+            _engine_db.dispose()
+            _engine_db = None
+
+
 def create_database_api(engine_session):
 
     if not database_exists(engine_session.url):
@@ -100,11 +149,28 @@ def create_bd_objects(engine_obj):
     logger.info("Database objects created...")
 
 
-def session_to_db(engine_se):
+# Rows fetched by round-trip from the server-side cursors of the streaming listings
+STREAM_BATCH_SIZE = 1000
+
+# Sessions with one explicit transaction, committed or rolled back at the end of the request
+SessionDb = sessionmaker(autocommit=False, expire_on_commit=False)
+
+# The reads run on REPEATABLE READ, the transactions that write the catalog on READ COMMITTED: the UPDATE of
+# the catalog version of a writer waits for the commit of the other writer and increments his version,
+# on REPEATABLE READ it fails with a serialization error (40001)
+WRITE_ISOLATION_LEVEL = 'READ COMMITTED'
+
+# Methods of the requests that only read
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def session_to_db(engine_se, isolation_level=None):
     r"""
     Get and manage the session connect to the database engine.
 
-    :return connection: Object to connect to the database and transact on it.
+    :param engine_se: Engine object to checkout the connection from his pool.
+    :param isolation_level: Isolation of the transactions of the connection, the one of the engine if None.
+    :return connection, session: Objects to connect to the database and transact on it.
     """
 
     session = None
@@ -115,18 +181,19 @@ def session_to_db(engine_se):
 
         if engine_se:
 
-            session_maker = sessionmaker(bind=engine_se, autocommit=True)
-
             connection = engine_se.connect()
 
-            session = session_maker(bind=connection)
+            if isolation_level is not None:
+                connection = connection.execution_options(isolation_level=isolation_level)
+
+            session = SessionDb(bind=connection)
 
             logger.info("Connection and Session objects created...")
 
         else:
             logger.error("Database not created or some parameters with the connection to the database can't be read")
 
-    except mvc_exc.DatabaseError as db_error:
+    except SQLAlchemyError as db_error:
         logger.exception("Can not connect to database, verify data connection", db_error, exc_info=True)
         raise mvc_exc.ConnectionError(
             'Can not connect to database, verify data connection.\nOriginal Exception raised: {}'.format(db_error)
@@ -136,15 +203,97 @@ def session_to_db(engine_se):
 
 
 def init_db_connection():
-    engine_db = create_engine_db()
+    r"""
+    Get the connection and session of the current request, checked out from the pool of the shared engine.
 
-    create_database_api(engine_db)
+    The objects are saved on the request context, the unit of work of the request is committed by
+    commit_db_session and the connection returned to the pool by close_db_connection on the teardown.
+    The schema is not verified here, see schema_bootstrap.bootstrap_database. The requests that can write
+    the catalog (POST, PUT, ...) run on WRITE_ISOLATION_LEVEL.
 
-    create_bd_objects(engine_db)
+    :return connection, session: Objects to connect to the database and transact on it.
+    """
 
-    connection, session = session_to_db(engine_db)
+    if 'db_session' not in g:
 
-    return connection, session
+        engine_db = get_engine_db()
+
+        isolation_level = None if request.method in READ_METHODS else WRITE_ISOLATION_LEVEL
+
+        g.db_connection, g.db_session = session_to_db(engine_db, isolation_level)
+
+    return g.db_connection, g.db_session
+
+
+def commit_db_session(response):
+    r"""
+    Commit the transaction of the request if the response is successful, otherwise it is rolled back.
+
+    Registered after every request of the API, so an error on commit is responded as an error to the client.
+
+    :param response: The response object of the request.
+    :return response: The same response object.
+    """
+
+    session = g.get('db_session')
+
+    if session is not None:
+        if response.status_code < 400:
+            session.commit()
+        else:
+            session.rollback()
+
+    return response
+
+
+def close_db_connection(exception=None):
+    r"""
+    Close the session of the request and return his connection to the pool.
+
+    Registered on the teardown of the app context of the API, the transaction not committed is rolled back.
+
+    :param exception: The exception raised by the request, if any.
+    """
+
+    session = g.pop('db_session', None)
+    connection = g.pop('db_connection', None)
+
+    if session is not None:
+        if exception is not None:
+            logger.error('Rollback the transaction of the request by exception: %s', str(exception))
+            session.rollback()
+
+        session.close()
+
+    disconnect_from_db(connection)
+
+
+@contextmanager
+def session_scope(isolation_level=None):
+    r"""
+    Get a session out of the requests of the API (startup, CLI commands, background jobs) with his own
+    transaction, committed if the block ends without errors, otherwise rolled back.
+
+    :param isolation_level: Isolation of the transaction, WRITE_ISOLATION_LEVEL for the writes of the catalog.
+    :return session: Session object checked out from the pool of the shared engine.
+    """
+
+    session = SessionDb(bind=get_engine_db())
+
+    try:
+        if isolation_level is not None:
+            session.connection(execution_options={'isolation_level': isolation_level})
+
+        yield session
+
+        session.commit()
+
+    except Exception:
+        session.rollback()
+        raise
+
+    finally:
+        session.close()
 
 
 def scrub(input_string):
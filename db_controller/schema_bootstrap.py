@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+PostgreSQL DB schema bootstrap.
+
+The database and his objects are verified only once, when the API starts or by the
+`flask init-db` command, never on the requests to the endpoints.
+
+Documentation:
+    Every change to the schema is a revision registered on SCHEMA_REVISIONS, applied in order
+    and recorded on the schema_version table:
+    - Create database
+    - Create tables
+    - Record the schema version verified
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import click
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import Column, Integer, String, DateTime, func
+from apps.api_authentication.UsersAuthModel import UsersAuthModel
+from apps.estado.EstadoModel import EstadoModel
+from apps.municipio.MunicipioModel import MunicipioModel
+from apps.ciudad.CiudadModel import CiudadModel
+from apps.colonia.ColoniaModel import ColoniaModel
+from db_controller.database_backend import *
+from db_controller.catalog_events import CatalogVersionModel, CatalogChangeModel
+from db_controller import mvc_exceptions as mvc_exc
+
+# Key of the advisory lock taken while the revisions are applied, so the workers don't migrate at the same time
+SCHEMA_LOCK_KEY = 7363726
+
+
+class SchemaVersionModel(Base):
+    r"""
+    Class to instance the schema revisions applied on the database.
+    """
+
+    __tablename__ = 'schema_version'
+
+    version = Column('version', Integer, primary_key=True, autoincrement=False)
+    description = Column('description', String, nullable=False)
+    applied_date = Column('applied_date', DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return "<SchemaVersionModel(version='%s', description='%s', applied_date='%s')>" % (self.version,
+                                                                                           self.description,
+                                                                                           self.applied_date)
+
+
+def revision_001_create_tables(connection):
+    r"""
+    Create the tables of the models of the API if not exists.
+
+    :param connection: Connection object with the transaction of the bootstrap.
+    """
+
+    create_bd_objects(connection)
+
+
+def create_index_if_not_exists(connection, index):
+    r"""
+    Create an index declared on a model if it is not already on the database.
+
+    :param connection: Connection object with the transaction of the bootstrap.
+    :param index: Index object declared on the __table_args__ of the model.
+    """
+
+    columns = ', '.join(column.name for column in index.columns)
+
+    connection.execute('CREATE {}INDEX IF NOT EXISTS {} ON {} ({})'.format('UNIQUE ' if index.unique else '',
+                                                                           index.name,
+                                                                           index.table.name,
+                                                                           columns))
+
+
+def revision_002_natural_keys(connection):
+    r"""
+    Create the unique indexes of the natural keys, conflict target of the insert_data of the models.
+
+    :param connection: Connection object with the transaction of the bootstrap.
+    """
+
+    for model in (EstadoModel, MunicipioModel, CiudadModel, ColoniaModel):
+        for index in model.__table__.indexes:
+            if index.unique:
+                create_index_if_not_exists(connection, index)
+
+
+def revision_003_catalog_indexes(connection):
+    r"""
+    Drop the unique constraints of the FKs, so a parent row can have many child rows, drop the indexes
+    covered by the natural keys and create the FK and covering indexes of the lookups.
+
+    :param connection: Connection object with the transaction of the bootstrap.
+    """
+
+    for table_name, column_name in (('municipio', 'id_estado'), ('ciudad', 'id_municipio'), ('colonia', 'id_ciudad')):
+        connection.execute('ALTER TABLE {0} DROP CONSTRAINT IF EXISTS {0}_{1}_key'.format(table_name, column_name))
+
+    for index_name in ('ix_estado_clave_estado', 'ix_colonia_codigo_postal'):
+        connection.execute('DROP INDEX IF EXISTS {}'.format(index_name))
+
+    for model in (EstadoModel, MunicipioModel, CiudadModel, ColoniaModel):
+        for index in model.__table__.indexes:
+            create_index_if_not_exists(connection, index)
+
+        connection.execute('ANALYZE {}'.format(model.__tablename__))
+
+
+def revision_004_catalog_version(connection):
+    r"""
+    Create the table with the version of the catalog, incremented by every transaction that writes on it.
+
+    :param connection: Connection object with the transaction of the bootstrap.
+    """
+
+    CatalogVersionModel.__table__.create(bind=connection, checkfirst=True)
+
+    connection.execute('INSERT INTO catalog_version (id_catalog, version, updated_date) VALUES (1, 1, now()) '
+                       'ON CONFLICT (id_catalog) DO NOTHING')
+
+
+def revision_005_row_hash(connection):
+    r"""
+    Add the column with the hash of the content of the rows of the catalog, compared by the catalog sync.
+    The rows without hash are updated by the first sync.
+
+    :param connection: Connection object with the transaction of the bootstrap.
+    """
+
+    for model in (EstadoModel, MunicipioModel, CiudadModel, ColoniaModel):
+        connection.execute('ALTER TABLE {} ADD COLUMN IF NOT EXISTS row_hash VARCHAR(32)'.format(model.__tablename__))
+
+
+def revision_006_catalog_change(connection):
+    r"""
+    Create the table with the changes of the versions of the catalog too big for the payload of NOTIFY.
+
+    :param connection: Connection object with the transaction of the bootstrap.
+    """
+
+    CatalogChangeModel.__table__.create(bind=connection, checkfirst=True)
+
+
+# (version, description, function) in the order to be applied
+SCHEMA_REVISIONS = [
+    (1, 'Create tables of the SEPOMEX catalog and users', revision_001_create_tables),
+    (2, 'Unique indexes on the natural keys of the SEPOMEX catalog', revision_002_natural_keys),
+    (3, 'FK and covering indexes of the SEPOMEX catalog lookups', revision_003_catalog_indexes),
+    (4, 'Version of the SEPOMEX catalog', revision_004_catalog_version),
+    (5, 'Hash of the content of the rows of the SEPOMEX catalog', revision_005_row_hash),
+    (6, 'Changes of the versions of the SEPOMEX catalog', revision_006_catalog_change),
+]
+
+SCHEMA_VERSION = SCHEMA_REVISIONS[-1][0]
+
+
+def get_schema_version(connection):
+    r"""
+    Get the last schema version recorded on the database.
+
+    :param connection: Connection object to the database.
+    :return version: The last version applied, 0 if none was applied.
+    """
+
+    version = connection.execute(func.max(SchemaVersionModel.__table__.c.version).select()).scalar()
+
+    return version or 0
+
+
+def bootstrap_database(engine_db=None):
+    r"""
+    Create the database if not exists and apply the schema revisions pending on one transaction.
+
+    :param engine_db: Engine object to the database, the shared engine is used by default.
+    :return version: The schema version verified on the database.
+    """
+
+    if engine_db is None:
+        engine_db = get_engine_db()
+
+    create_database_api(engine_db)
+
+    try:
+
+        with engine_db.begin() as connection:
+
+            if 'postgresql' == engine_db.dialect.name:
+                connection.execute('SELECT pg_advisory_xact_lock(%s)', (SCHEMA_LOCK_KEY,))
+
+            SchemaVersionModel.__table__.create(bind=connection, checkfirst=True)
+
+            version = get_schema_version(connection)
+
+            for revision, description, apply_revision in SCHEMA_REVISIONS:
+
+                if revision <= version:
+                    continue
+
+                logger.info('Apply schema revision %s: %s', str(revision), description)
+
+                apply_revision(connection)
+
+                connection.execute(SchemaVersionModel.__table__.insert().values(version=revision,
+                                                                                description=description,
+                                                                                applied_date=datetime.utcnow()))
+
+                version = revision
+
+    except SQLAlchemyError as exc:
+        logger.exception('An exception was occurred while bootstrap the schema: %s', str(exc))
+        raise mvc_exc.DatabaseError(
+            'Can\'t apply the schema revisions on the database.\nOriginal Exception raised: {}'.format(exc)
+        )
+
+    if version > SCHEMA_VERSION:
+        logger.warning('Schema version on database %s is newer than the API version %s',
+                       str(version), str(SCHEMA_VERSION))
+
+    logger.info('Schema version verified: %s', str(version))
+
+    return version
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the database and apply the schema revisions pending."""
+
+    version = bootstrap_database()
+
+    click.echo('Schema version verified: {}'.format(version))
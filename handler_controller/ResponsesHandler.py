@@ -11,7 +11,7 @@ __history__ = """ """
 __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
 import json
-from flask import Flask, jsonify, request, Blueprint
+from flask import Flask, Response, jsonify, request, Blueprint, stream_with_context
 from werkzeug import exceptions
 # import api_config
 
@@ -22,45 +22,134 @@ handler_error_api = Blueprint('handler_error_api', __name__)
 class ResponsesHandler(exceptions.HTTPException):
 
     @handler_error_api.errorhandler(200)
-    # @staticmethod
-    def response_success(self, data, msg):
+    @staticmethod
+    def response_success(msg, data, next_cursor=None):
+        r"""
+        Response the data of the request, serialized only once.
 
-        if bool(data):
-            data_msg = json.loads(data)
-        else:
-            data_msg = data
+        :param msg: Message of the response.
+        :param data: Python structures (list, dict) to serialize, or bytes with JSON already encoded.
+        :param next_cursor: Cursor of the next page of the listings, not set on the last page.
+        :return resp, status_code: Response object and his status code.
+        """
+
+        status_code = 200
+
+        if isinstance(data, bytes):
+            return ResponsesHandler.response_encoded(msg, data, status_code, next_cursor)
 
         message = {
             'message': msg,
-            'data': data_msg
+            'data': data
         }
 
+        if next_cursor is not None:
+            message['next_cursor'] = next_cursor
+
         resp = jsonify(message)
-        status_code = 200
 
         return resp, status_code
 
     @handler_error_api.errorhandler(201)
-    # @staticmethod
-    def response_resource_created(self, data, msg):
+    @staticmethod
+    def response_resource_created(msg, data):
+        r"""
+        Response the data of the resource created, serialized only once.
 
-        if bool(data):
-            data_msg = json.loads(data)
-        else:
-            data_msg = data
+        :param msg: Message of the response.
+        :param data: Python structures (list, dict) to serialize, or bytes with JSON already encoded.
+        :return resp, status_code: Response object and his status code.
+        """
+
+        status_code = 201
+
+        if isinstance(data, bytes):
+            return ResponsesHandler.response_encoded(msg, data, status_code)
 
         message = {
             'message': msg,
-            'data': data_msg
+            'data': data
         }
 
         resp = jsonify(message)
-        status_code = 201
+
+        return resp, status_code
+
+    @staticmethod
+    def encode_body(msg, data, next_cursor=None):
+        r"""
+        Build the JSON body of a response around the data already encoded, without decode it.
+
+        :param msg: Message of the response.
+        :param data: Bytes with the JSON of the data.
+        :param next_cursor: Cursor of the next page of the listings, not set on the last page.
+        :return body: Bytes with the JSON of the response.
+        """
+
+        body = b'{"message": ' + json.dumps(msg).encode('utf-8') + b', "data": ' + data
+
+        if next_cursor is not None:
+            body += b', "next_cursor": ' + json.dumps(next_cursor).encode('utf-8')
+
+        return body + b'}'
+
+    @staticmethod
+    def response_encoded(msg, data, status_code=200, next_cursor=None):
+        r"""
+        Response the data already encoded as JSON, it is passed through untouched.
+
+        :param msg: Message of the response.
+        :param data: Bytes with the JSON of the data.
+        :param status_code: Status code of the response.
+        :param next_cursor: Cursor of the next page of the listings, not set on the last page.
+        :return resp, status_code: Response object and his status code.
+        """
+
+        resp = Response(ResponsesHandler.encode_body(msg, data, next_cursor), mimetype='application/json')
+
+        return resp, status_code
+
+    @staticmethod
+    def response_stream(rows):
+        r"""
+        Stream the rows as NDJSON, one JSON object by line, written while they are read from the database.
+
+        :param rows: Iterable of dict to serialize.
+        :return resp, status_code: Streaming response object and his status code.
+        """
+
+        def generate_lines():
+            for row in rows:
+                yield json.dumps(row) + '\n'
+
+        resp = Response(stream_with_context(generate_lines()), mimetype='application/x-ndjson')
+        status_code = 200
+
+        return resp, status_code
+
+    @staticmethod
+    def response_not_modified(etag, last_modified=None):
+        r"""
+        Response without body, the client already has the representation of the resource.
+
+        :param etag: Strong ETag of the resource.
+        :param last_modified: Date of the last modification of the resource.
+        :return resp, status_code: Response object and his status code.
+        """
+
+        resp = Response(status=304)
+        resp.set_etag(etag)
+
+        if last_modified is not None:
+            resp.last_modified = last_modified
+
+        status_code = 304
 
         return resp, status_code
 
     @handler_error_api.errorhandler(400)
-    def bad_request(self, msg):
+    @staticmethod
+    def bad_request(msg, data=None):
         message = {
             'message': msg + request.url,
             'data': {}
@@ -72,7 +161,8 @@ class ResponsesHandler(exceptions.HTTPException):
         return resp, status_code
 
     @handler_error_api.errorhandler(401)
-    def request_unauthorized(self, msg):
+    @staticmethod
+    def request_unauthorized(msg, data=None):
         message = {
             'message': msg + request.url,
             'data': {}
@@ -84,7 +174,8 @@ class ResponsesHandler(exceptions.HTTPException):
         return resp, status_code
 
     @handler_error_api.errorhandler(404)
-    def request_not_found(self, msg):
+    @staticmethod
+    def request_not_found(msg, data=None):
         message = {
             'message': msg + request.url,
             'data': {}
@@ -96,7 +187,8 @@ class ResponsesHandler(exceptions.HTTPException):
         return resp, status_code
 
     @handler_error_api.errorhandler(405)
-    def request_method_not_allowed(self, msg):
+    @staticmethod
+    def request_method_not_allowed(msg, data=None):
         message = {
             'message': msg + request.url,
             'data': {}
@@ -108,7 +200,8 @@ class ResponsesHandler(exceptions.HTTPException):
         return resp, status_code
 
     @handler_error_api.errorhandler(409)
-    def request_conflict(self, msg):
+    @staticmethod
+    def request_conflict(msg, data=None):
         message = {
             'message': msg + request.url,
             'data': {}
@@ -120,7 +213,8 @@ class ResponsesHandler(exceptions.HTTPException):
         return resp, status_code
 
     @handler_error_api.errorhandler(500)
-    def internal_server_error(self, msg):
+    @staticmethod
+    def internal_server_error(msg, data=None):
         message = {
             'message': msg + request.url,
             'data': {}
@@ -132,7 +226,8 @@ class ResponsesHandler(exceptions.HTTPException):
         return resp, status_code
 
     @handler_error_api.errorhandler(503)
-    def service_unavailable(self, msg):
+    @staticmethod
+    def service_unavailable(msg, data=None):
         message = {
             'message': msg + request.url,
             'data': {}
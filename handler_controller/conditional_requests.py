@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Conditional requests of the catalog.
+
+The representation of every GET endpoint of the catalog changes only when the catalog version changes,
+so the version is the strong ETag of the responses and the date of his last write is the Last-Modified.
+A request with If-None-Match (or If-Modified-Since) matching is responded with 304 before run the view.
+
+Documentation:
+    - The structures on memory reloaded on background (postal code index, pinned tables) can answer with
+      the data of a previous version, they record it with note_served_catalog_version and the response is
+      tagged with the version of the data actually served, without Last-Modified.
+    - Last-Modified has a precision of seconds, two writes on the same second have the same date, so
+      If-Modified-Since only matches when the last write is on a previous second.
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+from datetime import timezone
+from functools import wraps
+from flask import request, make_response, g, has_request_context
+from db_controller.catalog_events import get_current_catalog_version
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from utilities.Utility import *
+
+cfg_app = get_config_settings_app()
+
+# Suffix of the ETag of the gzip representation, a strong ETag is unique by content encoding
+GZIP_ETAG_SUFFIX = '-gzip'
+
+
+def make_catalog_etag(version):
+    r"""
+    Strong ETag of the responses of a catalog version.
+
+    :param version: The version of the catalog.
+    :return etag: str
+    """
+
+    return 'catalog-{}'.format(version)
+
+
+def to_http_date(date_value):
+    r"""
+    Date as it is compared on the HTTP headers: naive UTC, without microseconds.
+    """
+
+    if date_value is None:
+        return None
+
+    if date_value.tzinfo is not None:
+        date_value = date_value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return date_value.replace(microsecond=0)
+
+
+def note_served_catalog_version(version):
+    r"""
+    Record on the request the catalog version of the data answered from a structure on memory, it can be
+    behind the current version while it is reloaded. The oldest version recorded is kept.
+
+    :param version: The catalog version of the data answered.
+    """
+
+    if version is None or not has_request_context():
+        return
+
+    served_version = g.get('catalog_served_version')
+
+    if served_version is None or version < served_version:
+        g.catalog_served_version = version
+
+
+def get_served_catalog_version(version):
+    r"""
+    Catalog version of the data responded on the request.
+
+    :param version: The current catalog version.
+    :return served_version: The oldest version recorded by note_served_catalog_version, the current version
+                            if all the data was read on it.
+    """
+
+    served_version = g.get('catalog_served_version')
+
+    if served_version is None or served_version > version:
+        return version
+
+    return served_version
+
+
+def is_not_modified(etag, last_modified):
+    r"""
+    Validate the conditional headers of the request, If-None-Match takes precedence over If-Modified-Since.
+
+    :param etag: Strong ETag of the current representation.
+    :param last_modified: Date of the last write of the catalog.
+    :return bool: True if the client has the current representation.
+    """
+
+    if request.if_none_match:
+        return request.if_none_match.contains(etag) or request.if_none_match.contains(etag + GZIP_ETAG_SUFFIX)
+
+    # A write on the same second of the date of the client can be newer than his representation
+    if request.if_modified_since and last_modified is not None:
+        return last_modified < to_http_date(request.if_modified_since)
+
+    return False
+
+
+def catalog_conditional(view):
+    r"""
+    Decorator of the GET views of the catalog, respond 304 if the client has the current version, otherwise
+    the ETag and Last-Modified of the data served are set on the successful responses of the view.
+    """
+
+    @wraps(view)
+    def conditional_view(*args, **kwargs):
+
+        if 'GET' != request.method:
+            return view(*args, **kwargs)
+
+        version, updated_date = get_current_catalog_version(cfg_app.catalog_version_max_age)
+
+        # The version is unknown if the database was never available, responded without validators
+        if version is None:
+            return view(*args, **kwargs)
+
+        etag = make_catalog_etag(version)
+        last_modified = to_http_date(updated_date)
+
+        if is_not_modified(etag, last_modified):
+            return HandlerResponse.response_not_modified(etag, last_modified)
+
+        resp = make_response(view(*args, **kwargs))
+
+        if 200 == resp.status_code:
+
+            served_version = get_served_catalog_version(version)
+
+            # The views of the encoded responses set the ETag of his content encoding
+            if resp.get_etag()[0] is None:
+                resp.set_etag(make_catalog_etag(served_version))
+
+            # The date of the write of a previous version is unknown
+            if last_modified is not None and served_version == version:
+                resp.last_modified = last_modified
+
+        return resp
+
+    return conditional_view
@@ -58,6 +58,31 @@ class AppConstants(Constants):
     jwt_error_message = str()           # JWT_ERROR_MESSAGE_KEY = 'message'
     jwt_access_token_expires = int()    # JWT_ACCESS_TOKEN_EXPIRES = 3600
     jwt_propagate_exceptions = bool()   # PROPAGATE_EXCEPTIONS = True
+    postal_code_index_enabled = bool()  # POSTAL_CODE_INDEX_ENABLED = False
+    postal_code_index_refresh = int()   # POSTAL_CODE_INDEX_REFRESH_SECONDS = 60
+    filter_cache_enabled = bool()       # FILTER_CACHE_ENABLED = True
+    filter_cache_max_bytes = int()      # FILTER_CACHE_MAX_BYTES = 67108864
+    filter_cache_ttl = {}               # FILTER_CACHE_TTL_<ENTITY> = seconds
+    catalog_version_max_age = int()     # CATALOG_VERSION_MAX_AGE = 2
+    pinned_tables_enabled = bool()      # PINNED_TABLES_ENABLED = True
+    catalog_listen_enabled = bool()     # CATALOG_LISTEN_ENABLED = True
+    filter_cache_stale_seconds = int()  # FILTER_CACHE_STALE_SECONDS = 300
+    refresher_workers = int()           # REFRESHER_WORKERS = 2
+    refresher_max_pending = int()       # REFRESHER_MAX_PENDING = 100
+    catalog_import_workers = int()      # CATALOG_IMPORT_WORKERS = os.cpu_count()
+    cache_snapshot_path = str()         # CACHE_SNAPSHOT_PATH = '/tmp/sepomex_cache.snapshot'
+    cache_snapshot_interval = int()     # CACHE_SNAPSHOT_INTERVAL_SECONDS = 300
+    response_cache_enabled = bool()     # RESPONSE_CACHE_ENABLED = True
+    response_cache_max_bytes = int()    # RESPONSE_CACHE_MAX_BYTES = 33554432
+    response_cache_gzip = bool()        # RESPONSE_CACHE_GZIP = True
+    response_cache_gzip_min_bytes = int()  # RESPONSE_CACHE_GZIP_MIN_BYTES = 1024
+    postal_code_bloom_enabled = bool()  # POSTAL_CODE_BLOOM_ENABLED = True
+    postal_code_bloom_fp_rate = float()  # POSTAL_CODE_BLOOM_FP_RATE = 0.001
+    postal_code_bloom_max_bytes = int()  # POSTAL_CODE_BLOOM_MAX_BYTES = 1048576
+    cache_backend = str()               # CACHE_BACKEND = 'memory' | 'redis'
+    cache_serializer = str()            # CACHE_SERIALIZER = 'json' | 'pickle'
+    cache_key_prefix = str()            # CACHE_KEY_PREFIX = 'sepomex'
+    redis_url = str()                   # REDIS_URL = 'redis://localhost:6379/0'
 
     def __init__(self):
         super().__init__()
@@ -85,22 +110,80 @@ class AppConstants(Constants):
         self.jwt_access_token_expires = os.getenv('JWT_ACCESS_TOKEN_EXPIRES')
         self.jwt_propagate_exceptions = os.getenv('PROPAGATE_EXCEPTIONS')
 
+        self.postal_code_index_enabled = os.getenv('POSTAL_CODE_INDEX_ENABLED', 'False').lower() in ('true', '1', 'yes')
+        self.postal_code_index_refresh = int(os.getenv('POSTAL_CODE_INDEX_REFRESH_SECONDS', 60))
+
+        self.filter_cache_enabled = os.getenv('FILTER_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+        self.filter_cache_max_bytes = int(os.getenv('FILTER_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        self.filter_cache_ttl = {
+            'estado': int(os.getenv('FILTER_CACHE_TTL_ESTADO', 3600)),
+            'municipio': int(os.getenv('FILTER_CACHE_TTL_MUNICIPIO', 3600)),
+            'ciudad': int(os.getenv('FILTER_CACHE_TTL_CIUDAD', 1800)),
+            'colonia': int(os.getenv('FILTER_CACHE_TTL_COLONIA', 600)),
+            'codigo_postal': int(os.getenv('FILTER_CACHE_TTL_CODIGO_POSTAL', 600)),
+        }
+        self.filter_cache_stale_seconds = int(os.getenv('FILTER_CACHE_STALE_SECONDS', 300))
+        self.refresher_workers = int(os.getenv('REFRESHER_WORKERS', 2))
+        self.refresher_max_pending = int(os.getenv('REFRESHER_MAX_PENDING', 100))
+        self.catalog_import_workers = int(os.getenv('CATALOG_IMPORT_WORKERS', os.cpu_count() or 1))
+
+        self.catalog_version_max_age = int(os.getenv('CATALOG_VERSION_MAX_AGE', 2))
+        self.pinned_tables_enabled = os.getenv('PINNED_TABLES_ENABLED', 'True').lower() in ('true', '1', 'yes')
+        self.catalog_listen_enabled = os.getenv('CATALOG_LISTEN_ENABLED', 'True').lower() in ('true', '1', 'yes')
+
+        self.cache_snapshot_path = os.getenv('CACHE_SNAPSHOT_PATH', '')
+        self.cache_snapshot_interval = int(os.getenv('CACHE_SNAPSHOT_INTERVAL_SECONDS', 300))
+
+        self.response_cache_enabled = os.getenv('RESPONSE_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+        self.response_cache_max_bytes = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        self.response_cache_gzip = os.getenv('RESPONSE_CACHE_GZIP', 'True').lower() in ('true', '1', 'yes')
+        self.response_cache_gzip_min_bytes = int(os.getenv('RESPONSE_CACHE_GZIP_MIN_BYTES', 1024))
+
+        self.postal_code_bloom_enabled = os.getenv('POSTAL_CODE_BLOOM_ENABLED', 'True').lower() in ('true', '1', 'yes')
+        self.postal_code_bloom_fp_rate = float(os.getenv('POSTAL_CODE_BLOOM_FP_RATE', 0.001))
+        self.postal_code_bloom_max_bytes = int(os.getenv('POSTAL_CODE_BLOOM_MAX_BYTES', 1024 * 1024))
+
+        self.cache_backend = os.getenv('CACHE_BACKEND', 'memory').lower()
+        self.cache_serializer = os.getenv('CACHE_SERIALIZER', 'json').lower()
+        self.cache_key_prefix = os.getenv('CACHE_KEY_PREFIX', 'sepomex')
+        self.redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
 
 class DbConstants(Constants):
     # Database tables names
+    user_auth_table = str()  # USERS_AUTH
     states_table = str()  # STATES
     town_table = str()    # TOWN
     city_table = str()    # CITY
     suburb_table = str()  # SUBURB
 
+    # Database connection pool
+    pool_size = int()          # DB_POOL_SIZE
+    pool_max_overflow = int()  # DB_POOL_MAX_OVERFLOW
+    pool_timeout = int()       # DB_POOL_TIMEOUT
+    pool_recycle = int()       # DB_POOL_RECYCLE
+    pool_pre_ping = bool()     # DB_POOL_PRE_PING
+
+    # Schema bootstrap
+    bootstrap_on_start = bool()  # DB_BOOTSTRAP_ON_START
+
     def __init__(self):
         super().__init__()
 
+        self.user_auth_table = os.getenv('USERS_AUTH').__str__()
         self.states_table = os.getenv('STATES').__str__()
         self.town_table = os.getenv('TOWN').__str__()
         self.city_table = os.getenv('CITY').__str__()
         self.suburb_table = os.getenv('SUBURB').__str__()
 
+        self.pool_size = int(os.getenv('DB_POOL_SIZE', 5))
+        self.pool_max_overflow = int(os.getenv('DB_POOL_MAX_OVERFLOW', 10))
+        self.pool_timeout = int(os.getenv('DB_POOL_TIMEOUT', 30))
+        self.pool_recycle = int(os.getenv('DB_POOL_RECYCLE', 1800))
+        self.pool_pre_ping = os.getenv('DB_POOL_PRE_PING', 'True').lower() in ('true', '1', 'yes')
+
+        self.bootstrap_on_start = os.getenv('DB_BOOTSTRAP_ON_START', 'True').lower() in ('true', '1', 'yes')
+
     class States:
 
         state_id = str()    # STATE_ID
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import os
+import threading
+import time
+import pytest
+from contextlib import contextmanager
+from cache_controller import filter_cache
+from cache_controller import postal_code_index as index_module
+from cache_controller.backends import InProcessCacheBackend
+from cache_controller.background_refresher import BackgroundRefresher
+from cache_controller.postal_code_bloom import PostalCodeBloom
+from cache_controller.postal_code_index import PostalCodeIndex
+from db_controller.catalog_notifications import CatalogNotificationListener
+
+TTL_BY_NAMESPACE = {'colonia': 60}
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+
+        time.sleep(0.01)
+
+    return True
+
+
+def run_on_child(check):
+    r"""
+    Run check on a forked process, his result is the exit code of the child.
+    """
+
+    pid = os.fork()
+
+    if pid == 0:
+        try:
+            code = 0 if check() else 1
+        except BaseException:
+            code = 2
+
+        os._exit(code)
+
+    pid, status = os.waitpid(pid, 0)
+
+    return os.WEXITSTATUS(status)
+
+
+@pytest.fixture
+def refresher():
+    background_refresher = BackgroundRefresher(2, 2)
+
+    yield background_refresher
+
+    background_refresher.shutdown(1)
+
+
+def test_refresher_runs_a_key_once_while_it_is_pending(refresher):
+    release = threading.Event()
+    runs = []
+
+    def job():
+        release.wait(5)
+        runs.append('01000')
+
+    assert refresher.submit('01000', job)
+    assert not refresher.submit('01000', job)
+
+    release.set()
+
+    assert wait_until(lambda: refresher.get_stats()['completed'] == 1)
+    assert runs == ['01000']
+    assert refresher.get_stats()['workers'] == 2
+
+
+def test_refresher_drops_the_keys_that_dont_fit(refresher):
+    release = threading.Event()
+    running = threading.Semaphore(0)
+
+    def job():
+        running.release()
+        release.wait(5)
+
+    # Two keys in progress and two queued
+    assert refresher.submit(0, job) and refresher.submit(1, job)
+    assert running.acquire(timeout=5) and running.acquire(timeout=5)
+    assert refresher.submit(2, job) and refresher.submit(3, job)
+
+    assert not refresher.submit(4, job)
+    assert refresher.get_stats()['dropped'] == 1
+
+    release.set()
+
+    assert wait_until(lambda: refresher.get_stats()['completed'] == 4)
+
+
+def test_refresher_counts_the_failed_refreshes(refresher):
+    def job():
+        raise ConnectionError('Database not available')
+
+    refresher.submit('01000', job)
+
+    assert wait_until(lambda: refresher.get_stats()['failed'] == 1)
+    assert refresher.get_stats()['pending'] == 0
+
+
+def test_refresher_is_not_started_after_shutdown():
+    background_refresher = BackgroundRefresher(1, 2)
+
+    background_refresher.shutdown(1)
+
+    assert not background_refresher.submit('01000', lambda: None)
+    assert background_refresher.get_stats()['workers'] == 0
+
+
+def test_refresher_starts_his_own_threads_on_a_forked_worker(refresher):
+    refresher.submit('parent', lambda: None)
+
+    assert wait_until(lambda: refresher.get_stats()['completed'] == 1)
+
+    def check():
+        done = threading.Event()
+
+        refresher.submit('child', done.set)
+
+        return done.wait(5) and refresher.get_stats()['workers'] == 2 and \
+            wait_until(lambda: refresher.get_stats()['completed'] == 2)
+
+    assert run_on_child(check) == 0
+
+
+def test_stale_value_is_responded_and_refreshed_on_background(monkeypatch, refresher):
+    now = [1000.0]
+    reads = []
+
+    @contextmanager
+    def session_scope():
+        yield None
+
+    def loader(session):
+        reads.append(session)
+        return [{'codigo_postal': '01000', 'version': len(reads)}]
+
+    backend = InProcessCacheBackend(TTL_BY_NAMESPACE, 1024 * 1024, stale_seconds=30)
+
+    monkeypatch.setattr('cache_controller.backends.time.monotonic', lambda: now[0])
+    monkeypatch.setattr(filter_cache, 'cache_backend', backend)
+    monkeypatch.setattr(filter_cache, 'background_refresher', refresher)
+    monkeypatch.setattr(filter_cache, 'session_scope', session_scope)
+    monkeypatch.setattr(filter_cache, 'init_db_connection', lambda: (None, 'request'))
+    monkeypatch.setattr(filter_cache.cfg_app, 'filter_cache_enabled', True)
+
+    filter_spec = [{'field': 'codigo_postal', 'op': '==', 'value': '01000'}]
+
+    first = filter_cache.get_filtered_rows('colonia', filter_spec, 1, 25, loader)
+
+    assert reads == ['request']
+
+    # Past the TTL, the stale value is responded and the database is read on background
+    now[0] += 61
+
+    assert filter_cache.get_filtered_rows('colonia', filter_spec, 1, 25, loader) == first
+    assert wait_until(lambda: refresher.get_stats()['completed'] == 1)
+    assert reads == ['request', None]
+
+    rows, is_fresh = backend.get_entry('colonia', filter_cache.make_filter_key(filter_spec, 1, 25))
+
+    assert is_fresh and b'"version": 2' in rows
+
+    # Past the stale time too, the request waits for the database
+    now[0] += 91
+
+    filter_cache.get_filtered_rows('colonia', filter_spec, 1, 25, loader)
+
+    assert reads == ['request', None, 'request']
+
+
+def test_in_process_backend_responds_stale_values_until_they_expire(monkeypatch):
+    now = [1000.0]
+
+    monkeypatch.setattr('cache_controller.backends.time.monotonic', lambda: now[0])
+
+    backend = InProcessCacheBackend(TTL_BY_NAMESPACE, 1024, stale_seconds=30)
+
+    backend.put('colonia', 'key', b'[1]', backend.generation('colonia'))
+
+    assert backend.get_entry('colonia', 'key') == (b'[1]', True)
+
+    now[0] += 61
+
+    assert backend.get_entry('colonia', 'key') == (b'[1]', False)
+
+    now[0] += 30
+
+    assert backend.get_entry('colonia', 'key') == (None, False)
+    assert backend.get_stats()['expirations'] == 1
+
+
+def test_bloom_build_of_the_parent_is_not_inherited_as_running():
+    postal_code_bloom = PostalCodeBloom(0.001, 1024)
+
+    # The master was building the filter when the worker was forked
+    postal_code_bloom._rebuilding = True
+    postal_code_bloom._pid = os.getpid()
+
+    def check():
+        return not postal_code_bloom._rebuilding and postal_code_bloom._pid is None and \
+            postal_code_bloom._filter is None
+
+    assert run_on_child(check) == 0
+
+
+def test_index_and_listener_start_again_on_a_forked_worker(monkeypatch):
+    postal_code_index = PostalCodeIndex()
+    postal_code_index._entries = {'01000': ({'Suburb': 'Centro'},)}
+
+    catalog_listener = CatalogNotificationListener()
+
+    started = []
+
+    monkeypatch.setattr(index_module, 'register_catalog_listener', lambda listener: None)
+    monkeypatch.setattr(PostalCodeIndex, '_run_refresher', lambda self, refresh_seconds: started.append('index'))
+    monkeypatch.setattr(CatalogNotificationListener, '_run', lambda self: started.append('listener'))
+
+    for _ in range(2):
+        postal_code_index.start(60)
+        catalog_listener.start()
+
+    assert wait_until(lambda: len(started) == 2)
+    assert sorted(started) == ['index', 'listener']
+
+    def check():
+        postal_code_index.start(60)
+        catalog_listener.start()
+
+        # The index of the parent is kept, the threads are the ones of the child
+        return wait_until(lambda: len(started) == 4) and postal_code_index.lookup('01000') is not None
+
+    assert run_on_child(check) == 0
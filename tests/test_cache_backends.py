@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import pickle
+import sys
+import types
+import pytest
+from cache_controller import backends
+from cache_controller.backends import CacheBackend, CacheSerializer, RedisCacheBackend, FRESH_UNTIL_HEADER, \
+    REDIS_MGET_CHUNK
+
+TTL_BY_NAMESPACE = {'estado': 60, 'colonia': 60}
+
+
+class FakePipeline:
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def mget(self, keys):
+        self.commands.append(list(keys))
+
+    def execute(self):
+        self.client.round_trips += 1
+
+        if self.client.error is not None:
+            raise self.client.error
+
+        return [[self.client.values.get(key) for key in keys] for keys in self.commands]
+
+
+class FakeRedis:
+    r"""
+    Client of a server speaking the Redis protocol, the values are kept on a dictionary.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+        self.pipelines = []
+        self.round_trips = 0
+        self.error = None
+
+    @classmethod
+    def from_url(cls, redis_url):
+        return cls()
+
+    def pipeline(self, transaction=True):
+        pipeline = FakePipeline(self)
+        self.pipelines.append(pipeline)
+
+        return pipeline
+
+    def set(self, key, data, ex=None):
+        if self.error is not None:
+            raise self.error
+
+        self.values[key] = data
+        self.expires[key] = ex
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    state = {'version': 5}
+
+    monkeypatch.setitem(sys.modules, 'redis', types.SimpleNamespace(Redis=FakeRedis))
+    monkeypatch.setattr(backends, 'get_current_catalog_version', lambda max_age: (state['version'], None))
+
+    return state
+
+
+def make_backend(format_name='json'):
+    return RedisCacheBackend(TTL_BY_NAMESPACE, 'redis://localhost:6379/0', CacheSerializer(format_name),
+                             stale_seconds=30)
+
+
+def test_cache_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend(TTL_BY_NAMESPACE)
+
+
+@pytest.mark.parametrize('format_name', ['json', 'pickle'])
+def test_cache_serializer_round_trip(format_name):
+    serializer = CacheSerializer(format_name)
+
+    value = [{'Suburb': {'codigo_postal': '01000'}}]
+
+    assert serializer.loads(serializer.dumps(value)) == value
+    assert serializer.loads(serializer.dumps(b'[1]')) == b'[1]'
+
+
+def test_cache_serializer_loads_only_the_format_configured():
+    with pytest.raises(ValueError):
+        CacheSerializer('json').loads(CacheSerializer('pickle').dumps({'codigo_postal': '01000'}))
+
+    with pytest.raises(ValueError):
+        CacheSerializer('pickle').loads(CacheSerializer('json').dumps({'codigo_postal': '01000'}))
+
+
+def test_redis_values_round_trip_with_the_fresh_header(catalog, monkeypatch):
+    backend = make_backend()
+
+    backend.put('colonia', 'key', [{'Suburb': 'Centro'}], backend.generation('colonia'))
+    backend.put('estado', 'key', b'[1]', backend.generation('estado'))
+
+    key = backend.make_key('colonia', 'key', 5)
+
+    assert key.startswith('sepomex:colonia:v5:')
+    assert backend.client.expires[key] == 60 + 30
+
+    assert backend.get_entry('colonia', 'key') == ([{'Suburb': 'Centro'}], True)
+    assert backend.get_entry('estado', 'key') == (b'[1]', True)
+
+    # After the TTL the value is still responded as stale, until the server expires it
+    now = backends.time.time()
+    monkeypatch.setattr('cache_controller.backends.time.time', lambda: now + 61)
+
+    assert backend.get_entry('colonia', 'key') == ([{'Suburb': 'Centro'}], False)
+    assert backend.get_stats()['stale_hits'] == 1
+
+
+def test_redis_keys_carry_the_catalog_version(catalog):
+    backend = make_backend()
+
+    backend.put('colonia', 'key', b'[1]', backend.generation('colonia'))
+
+    catalog['version'] = 6
+
+    assert backend.get('colonia', 'key') is None
+
+    # A value read while the catalog changed is saved under the previous version, never read again
+    backend.put('colonia', 'key', b'[old]', 5)
+
+    assert backend.get('colonia', 'key') is None
+
+
+def test_redis_get_many_is_one_round_trip_of_mget_chunks(catalog):
+    backend = make_backend()
+    keys = ['key-{}'.format(number) for number in range(REDIS_MGET_CHUNK * 2 + 1)]
+
+    for key in keys[::2]:
+        backend.put('colonia', key, key.encode('utf-8'), 5)
+
+    values = backend.get_many('colonia', keys)
+
+    assert values == [key.encode('utf-8') if number % 2 == 0 else None for number, key in enumerate(keys)]
+    assert backend.client.round_trips == 1
+    assert [len(keys) for keys in backend.client.pipelines[0].commands] == [REDIS_MGET_CHUNK, REDIS_MGET_CHUNK, 1]
+
+
+def test_redis_value_of_other_format_is_a_miss(catalog):
+    backend = make_backend('json')
+
+    data = FRESH_UNTIL_HEADER.pack(backends.time.time() + 60) + b'P' + pickle.dumps({'codigo_postal': '01000'})
+
+    backend.client.values[backend.make_key('colonia', 'key', 5)] = data
+    backend.put('colonia', 'other', b'[1]', 5)
+
+    assert backend.get_many('colonia', ['key', 'other']) == [None, b'[1]']
+
+
+def test_redis_error_is_a_miss(catalog):
+    backend = make_backend()
+
+    backend.put('colonia', 'key', b'[1]', 5)
+
+    backend.client.error = ConnectionError('Connection refused')
+
+    assert backend.get_entries('colonia', ['key', 'other']) == [(None, False), (None, False)]
+
+    backend.put('colonia', 'key', b'[2]', 5)
+
+    stats = backend.get_stats()
+
+    assert stats['errors'] == 2
+    assert stats['misses'] == 2
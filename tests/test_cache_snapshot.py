@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+import os
+import time
+import pytest
+from cache_controller import cache_snapshot
+from cache_controller.backends import InProcessCacheBackend
+from cache_controller.cache_snapshot import CacheSnapshot, SNAPSHOT_FORMAT
+
+TTL_BY_NAMESPACE = {'colonia': 60, 'estado': 60}
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+
+        time.sleep(0.01)
+
+    return True
+
+
+def make_backend():
+    return InProcessCacheBackend(TTL_BY_NAMESPACE, 1024 * 1024)
+
+
+def put(backend, namespace, key, value):
+    backend.put(namespace, key, value, backend.generation(namespace))
+
+
+@pytest.fixture
+def catalog_version(monkeypatch):
+    r"""
+    Catalog version known by the worker that dumps and the one on the database when it is loaded.
+    """
+
+    versions = {'known': 5, 'current': 5}
+
+    monkeypatch.setattr(cache_snapshot, 'get_known_catalog_version', lambda: versions['known'])
+    monkeypatch.setattr(cache_snapshot, 'get_current_catalog_version', lambda max_age: (versions['current'], None))
+
+    return versions
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return str(tmp_path / 'cache_snapshot.bin')
+
+
+def read_header(path):
+    with open(path, 'rb') as snapshot_file:
+        return json.loads(snapshot_file.readline().decode('utf-8'))
+
+
+def test_entries_are_loaded_as_they_were_dumped(catalog_version, snapshot_path):
+    backend = make_backend()
+
+    put(backend, 'colonia', 'cp:01000', b'[{"codigo_postal": "01000"}]')
+    put(backend, 'colonia', 'cp:01010', b'[{"codigo_postal": "01010"}]')
+    put(backend, 'estado', 'all', b'[{"nombre_estado": "Jalisco"}]')
+
+    # The entries are dumped the least recently used first, 01000 is the last one now
+    backend.get_entry('colonia', 'cp:01000')
+
+    assert CacheSnapshot(backend, snapshot_path, 60).dump() == 3
+    assert read_header(snapshot_path)['catalog_version'] == 5
+    assert read_header(snapshot_path)['format'] == SNAPSHOT_FORMAT
+
+    warm_backend = make_backend()
+
+    assert CacheSnapshot(warm_backend, snapshot_path, 60).load() == 3
+
+    assert warm_backend.export_entries() == backend.export_entries()
+    assert warm_backend.export_entries()[-1][1] == 'cp:01000'
+    assert warm_backend.get_entry('estado', 'all') == (b'[{"nombre_estado": "Jalisco"}]', True)
+
+
+def test_snapshot_is_not_dumped_without_catalog_version(catalog_version, snapshot_path):
+    catalog_version['known'] = None
+
+    assert CacheSnapshot(make_backend(), snapshot_path, 60).dump() is None
+    assert not os.path.exists(snapshot_path)
+
+
+def test_snapshot_of_other_catalog_version_is_ignored(catalog_version, snapshot_path):
+    backend = make_backend()
+    put(backend, 'colonia', 'cp:01000', b'[]')
+
+    CacheSnapshot(backend, snapshot_path, 60).dump()
+
+    catalog_version['current'] = 6
+    warm_backend = make_backend()
+
+    assert CacheSnapshot(warm_backend, snapshot_path, 60).load() == 0
+    assert warm_backend.export_entries() == []
+
+
+@pytest.mark.parametrize('field, value', [('format', SNAPSHOT_FORMAT + 1), ('python', '2.7.18')])
+def test_snapshot_of_other_format_is_ignored(catalog_version, snapshot_path, field, value):
+    backend = make_backend()
+    put(backend, 'colonia', 'cp:01000', b'[]')
+
+    CacheSnapshot(backend, snapshot_path, 60).dump()
+
+    with open(snapshot_path, 'rb') as snapshot_file:
+        header = json.loads(snapshot_file.readline().decode('utf-8'))
+        body = snapshot_file.read()
+
+    header[field] = value
+
+    with open(snapshot_path, 'wb') as snapshot_file:
+        snapshot_file.write(json.dumps(header).encode('utf-8') + b'\n' + body)
+
+    assert CacheSnapshot(make_backend(), snapshot_path, 60).load() == 0
+
+
+def test_missing_snapshot_starts_cold(catalog_version, snapshot_path):
+    assert CacheSnapshot(make_backend(), snapshot_path, 60).load() == 0
+
+
+def test_expired_entries_are_not_dumped(monkeypatch, catalog_version, snapshot_path):
+    now = [1000.0]
+
+    monkeypatch.setattr('cache_controller.backends.time.monotonic', lambda: now[0])
+
+    backend = make_backend()
+    put(backend, 'colonia', 'cp:01000', b'[]')
+
+    now[0] += 61
+
+    put(backend, 'colonia', 'cp:01010', b'[]')
+
+    assert CacheSnapshot(backend, snapshot_path, 60).dump() == 1
+    assert read_header(snapshot_path)['entries'] == 1
+
+
+def test_failed_dump_keeps_the_previous_snapshot(monkeypatch, catalog_version, snapshot_path):
+    backend = make_backend()
+    put(backend, 'colonia', 'cp:01000', b'[]')
+
+    snapshot = CacheSnapshot(backend, snapshot_path, 60)
+    snapshot.dump()
+
+    put(backend, 'colonia', 'cp:01010', b'[]')
+
+    def replace(source, destination):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(cache_snapshot.os, 'replace', replace)
+
+    with pytest.raises(OSError):
+        snapshot.dump()
+
+    assert os.listdir(os.path.dirname(snapshot_path)) == ['cache_snapshot.bin']
+    assert read_header(snapshot_path)['entries'] == 1
+
+
+def test_snapshot_is_loaded_on_start_and_dumped_on_stop(catalog_version, snapshot_path):
+    backend = make_backend()
+    put(backend, 'colonia', 'cp:01000', b'[]')
+
+    CacheSnapshot(backend, snapshot_path, 60).dump()
+
+    warm_backend = make_backend()
+    snapshot = CacheSnapshot(warm_backend, snapshot_path, 60)
+
+    snapshot.start()
+
+    assert wait_until(lambda: warm_backend.get_stats()['entries'] == 1)
+
+    put(warm_backend, 'estado', 'all', b'[]')
+    snapshot.stop()
+
+    assert read_header(snapshot_path)['entries'] == 2
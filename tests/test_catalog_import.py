@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import io
+import random
+import pytest
+from db_controller import catalog_import
+from db_controller import mvc_exceptions as mvc_exc
+from db_controller.catalog_import import find_sepomex_header, read_sepomex_records, split_sepomex_file, \
+    build_catalog_rows, parse_sepomex_file, CatalogRows, SEPOMEX_ENCODING
+
+SEPOMEX_NOTICE = 'El Catálogo Nacional de Códigos Postales, es elaborado por Correos de México'
+
+SEPOMEX_HEADER = ('d_codigo|d_asenta|d_tipo_asenta|D_mnpio|d_estado|d_ciudad|d_CP|c_estado|c_oficina|c_CP|'
+                  'c_tipo_asenta|c_mnpio|id_asenta_cpcons|d_zona|c_cve_ciudad')
+
+
+def make_sepomex_lines(states=4, towns=3, postal_codes=5, suburbs=3):
+    r"""
+    Records of a SEPOMEX file, the rural colonias don't have a ciudad.
+    """
+
+    lines = []
+
+    for state in range(1, states + 1):
+        for town in range(1, towns + 1):
+            for number in range(postal_codes):
+                postal_code = '{:02d}{:01d}{:02d}'.format(state, town, number)
+                city_key = '{:02d}'.format(town) if number % 2 == 0 else ''
+
+                for suburb in range(suburbs):
+                    lines.append('|'.join([
+                        postal_code, 'Colonia {} Peñón'.format(suburb), 'Colonia', 'Municipio {}'.format(town),
+                        'Estado {}'.format(state), 'Ciudad {}'.format(town) if city_key else '', postal_code,
+                        str(state), postal_code, '', '09', '{:03d}'.format(town), '{:04d}'.format(suburb),
+                        'Urbano' if city_key else 'Rural', city_key
+                    ]))
+
+    return lines
+
+
+def write_sepomex_file(path, lines, newline='\r\n', trailing_newline=True):
+    text = newline.join([SEPOMEX_NOTICE, SEPOMEX_HEADER] + lines) + (newline if trailing_newline else '')
+
+    path.write_bytes(text.encode(SEPOMEX_ENCODING))
+
+    return str(path)
+
+
+def make_record(line):
+    values = line.split('|')
+
+    return values[0], values[1], values[2], values[3], values[4], values[5], values[7], values[11], values[13], \
+        values[14]
+
+
+def get_catalog(catalog_rows):
+    return catalog_rows.get_stats(), catalog_rows.states, catalog_rows.towns, catalog_rows.cities, \
+        catalog_rows.suburbs
+
+
+@pytest.fixture
+def sepomex_lines():
+    return make_sepomex_lines()
+
+
+def test_header_and_newline_of_the_file(tmp_path, sepomex_lines):
+    path = write_sepomex_file(tmp_path / 'CPdescarga.txt', sepomex_lines)
+
+    with open(path, 'rb') as sepomex_file:
+        header, data_start, newline = find_sepomex_header(sepomex_file)
+
+    assert header[0] == 'd_codigo' and header[-1] == 'c_cve_ciudad'
+    assert newline == '\r\n'
+    assert data_start == len((SEPOMEX_NOTICE + '\r\n' + SEPOMEX_HEADER + '\r\n').encode(SEPOMEX_ENCODING))
+
+
+def test_file_without_header_is_rejected():
+    with pytest.raises(mvc_exc.ItemNotStored):
+        find_sepomex_header(io.BytesIO(b'not|a|catalog\r\n'))
+
+
+@pytest.mark.parametrize('newline', ['\r\n', '\n'])
+@pytest.mark.parametrize('trailing_newline', [True, False])
+@pytest.mark.parametrize('read_block', [97, 64 * 1024])
+def test_records_read_by_blocks_are_the_lines_of_the_file(tmp_path, monkeypatch, sepomex_lines, newline,
+                                                          trailing_newline, read_block):
+    monkeypatch.setattr(catalog_import, 'SEPOMEX_READ_BLOCK', read_block)
+
+    path = write_sepomex_file(tmp_path / 'CPdescarga.txt', sepomex_lines, newline, trailing_newline)
+
+    with open(path, 'rb') as sepomex_file:
+        header, data_start, file_newline = find_sepomex_header(sepomex_file)
+        end = sepomex_file.seek(0, io.SEEK_END)
+
+        records = list(read_sepomex_records(sepomex_file, header, file_newline, data_start, end))
+
+    assert records == [make_record(line) for line in sepomex_lines]
+    assert records[0][1] == 'Colonia 0 Peñón'
+
+
+@pytest.mark.parametrize('chunks', [1, 2, 7, 50, 1000])
+def test_ranges_of_the_file_cover_every_line_once(tmp_path, sepomex_lines, chunks):
+    path = write_sepomex_file(tmp_path / 'CPdescarga.txt', sepomex_lines)
+
+    with open(path, 'rb') as sepomex_file:
+        header, data_start, newline = find_sepomex_header(sepomex_file)
+        end = sepomex_file.seek(0, io.SEEK_END)
+
+        ranges = split_sepomex_file(sepomex_file, data_start, end, chunks)
+
+        records = [record for start, stop in ranges
+                   for record in read_sepomex_records(sepomex_file, header, newline, start, stop)]
+
+    assert ranges[0][0] == data_start and ranges[-1][1] == end
+    assert all(previous[1] == following[0] for previous, following in zip(ranges, ranges[1:]))
+    assert records == [make_record(line) for line in sepomex_lines]
+
+
+def test_merge_of_partitions_is_the_catalog_of_the_whole_file(sepomex_lines):
+    records = [make_record(line) for line in sepomex_lines]
+
+    random.Random(21).shuffle(records)
+
+    whole = build_catalog_rows(records)
+
+    merged = CatalogRows()
+
+    for start in range(0, len(records), 37):
+        merged.merge(build_catalog_rows(records[start:start + 37]))
+
+    assert get_catalog(merged) == get_catalog(whole)
+
+
+def test_catalog_rows_resolve_the_ids_by_natural_key(sepomex_lines):
+    catalog_rows = build_catalog_rows(make_record(line) for line in sepomex_lines + sepomex_lines[:10])
+
+    assert catalog_rows.get_stats() == {"records": len(sepomex_lines) + 10, "estado": 4, "municipio": 12,
+                                        "ciudad": 12, "colonia": len(sepomex_lines)}
+
+    state_ids = {row[0] for row in catalog_rows.states.values()}
+    town_ids = {row[0] for row in catalog_rows.towns.values()}
+    city_ids = {row[0] for row in catalog_rows.cities.values()}
+
+    assert all(row[3] in state_ids for row in catalog_rows.towns.values())
+    assert all(row[3] in town_ids for row in catalog_rows.cities.values())
+    assert all(row[5] is None or row[5] in city_ids for row in catalog_rows.suburbs.values())
+    assert any(row[5] is None for row in catalog_rows.suburbs.values())
+
+
+def test_parse_on_a_pool_gives_the_same_ids(tmp_path, sepomex_lines):
+    random.Random(22).shuffle(sepomex_lines)
+
+    path = write_sepomex_file(tmp_path / 'CPdescarga.txt', sepomex_lines)
+
+    assert get_catalog(parse_sepomex_file(path, workers=3)) == get_catalog(parse_sepomex_file(path, workers=1))
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+import pytest
+from contextlib import contextmanager
+from types import SimpleNamespace
+from cache_controller import postal_code_index as index_module
+from cache_controller.postal_code_index import PostalCodeIndex
+from cache_controller.response_cache import ResponseCache
+from db_controller import catalog_notifications
+from db_controller.catalog_events import get_changed_postal_codes, build_catalog_payload, publish_catalog_changes, \
+    expand_catalog_changes, CATALOG_ENTITIES, MAX_NOTIFY_PAYLOAD
+from db_controller.catalog_notifications import CatalogNotificationListener
+
+
+class Row:
+    r"""
+    Row of the catalog read by the reload of the postal codes instead of the database.
+    """
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class FakeQuery:
+    r"""
+    Query of the hierarchy filtered by the postal codes of the IN criterion.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.postal_codes = None
+
+    def filter(self, criterion):
+        self.postal_codes = set(criterion.compile().params.values())
+        return self
+
+    def order_by(self, *columns):
+        return iter([row for row in self.rows if row[0].codigo_postal in self.postal_codes])
+
+
+class PublishSession:
+    r"""
+    Session of the transaction of a write, records the statements of the publish of the changes.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def get_bind(self):
+        return SimpleNamespace(dialect=SimpleNamespace(name='postgresql'))
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+
+def make_colonia_changes(postal_codes):
+    return [('colonia', {'id_colonia': number, 'codigo_postal': '{:05d}'.format(number)})
+            for number in range(1, postal_codes + 1)]
+
+
+def make_hierarchy(postal_code, id_colonia, nombre_colonia):
+    return (Row(id_colonia=id_colonia, codigo_postal=postal_code, nombre_colonia=nombre_colonia),
+            Row(id_ciudad=1, nombre_ciudad='Ciudad de México'),
+            Row(id_municipio=15, nombre_municipio='Cuauhtémoc'),
+            Row(id_estado=9, nombre_estado='Ciudad de México'))
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    state = {'version': 5, 'rows': [], 'builds': 0}
+
+    @contextmanager
+    def session_scope():
+        yield None
+
+    def build(self):
+        state['builds'] += 1
+        self._version = state['version']
+
+    monkeypatch.setattr(index_module, 'session_scope', session_scope)
+    monkeypatch.setattr(index_module, 'get_catalog_version', lambda session: (state['version'], None))
+    monkeypatch.setattr(index_module.ColoniaModel, 'query_hierarchy', lambda session: FakeQuery(state['rows']))
+    monkeypatch.setattr(PostalCodeIndex, 'build', build)
+
+    return state
+
+
+@pytest.fixture
+def postal_code_index():
+    postal_code_index = PostalCodeIndex()
+    postal_code_index._entries = {'01000': ({'Suburb': 'Centro'},), '01010': ({'Suburb': 'Roma'},),
+                                  '01020': ({'Suburb': 'Juárez'},)}
+    postal_code_index._version = 5
+
+    return postal_code_index
+
+
+def test_changed_postal_codes_only_for_colonias():
+    assert get_changed_postal_codes([('colonia', {'codigo_postal': '01000'}),
+                                     ('colonia', {'id_colonia': 3, 'codigo_postal': '01010'})]) == {'01000', '01010'}
+
+    assert get_changed_postal_codes([('colonia', {'id_colonia': 3})]) is None
+    assert get_changed_postal_codes([('colonia', {})]) is None
+    assert get_changed_postal_codes([('colonia', {'codigo_postal': '01000'}), ('estado', {'clave_estado': 9})]) is None
+
+
+def test_notify_payload_lists_the_postal_codes_once():
+    changes = make_colonia_changes(250) + [('colonia', {'codigo_postal': '00001'})]
+
+    payload = build_catalog_payload(changes, 6, None)
+
+    assert payload is not None and len(payload) <= MAX_NOTIFY_PAYLOAD
+
+    message = json.loads(payload)
+
+    assert message['version'] == 6
+    assert list(message['changes']) == ['colonia']
+    assert len(message['changes']['colonia']['codigo_postal']) == 250
+    assert get_changed_postal_codes(expand_catalog_changes(message['changes'])) == get_changed_postal_codes(changes)
+
+
+def test_notify_payload_of_a_parent_invalidates_the_entity():
+    changes = [('colonia', {'codigo_postal': '01000'}), ('colonia', {'id_colonia': 3}), ('estado', {'id_estado': 9})]
+
+    message = json.loads(build_catalog_payload(changes, 6, None))
+
+    assert message['changes'] == {'colonia': {}, 'estado': {}}
+    assert expand_catalog_changes(message['changes']) == [('colonia', {}), ('estado', {})]
+
+
+def test_changes_too_big_for_notify_are_saved_by_version(monkeypatch):
+    changes = make_colonia_changes(5000)
+    session = PublishSession()
+
+    publish_catalog_changes(session, changes, 6, None)
+
+    delete, insert, notify = session.statements
+    saved = insert.compile().params
+
+    assert saved['version'] == 6
+    assert get_changed_postal_codes(expand_catalog_changes(json.loads(saved['changes']))) == \
+        get_changed_postal_codes(changes)
+
+    payload = [value for value in notify.compile().params.values() if value.startswith('{')][0]
+
+    assert json.loads(payload)['changes'] is None
+
+    # The other workers read the changes saved by the version notified
+    @contextmanager
+    def session_scope():
+        yield None
+
+    notified = []
+
+    monkeypatch.setattr(catalog_notifications, 'session_scope', session_scope)
+    monkeypatch.setattr(catalog_notifications, 'get_process_token', lambda: 'other-worker')
+    monkeypatch.setattr(catalog_notifications, 'set_known_catalog_version', lambda version, updated_date: None)
+    monkeypatch.setattr(catalog_notifications, 'notify_catalog_listeners',
+                        lambda changes, version: notified.append((changes, version)))
+    monkeypatch.setattr(catalog_notifications, 'get_saved_catalog_changes',
+                        lambda session, version: expand_catalog_changes(json.loads(saved['changes'])))
+
+    CatalogNotificationListener().dispatch(payload)
+
+    assert get_changed_postal_codes(notified[0][0]) == get_changed_postal_codes(changes)
+    assert notified[0][1] == 6
+
+    # Already deleted, everything is invalidated
+    monkeypatch.setattr(catalog_notifications, 'get_saved_catalog_changes', lambda session, version: None)
+
+    CatalogNotificationListener().dispatch(payload)
+
+    assert notified[1][0] == [(entity, {}) for entity in CATALOG_ENTITIES]
+
+
+def test_index_reloads_only_the_postal_codes_written(catalog, postal_code_index):
+    catalog['version'] = 6
+    catalog['rows'] = [make_hierarchy('01000', 1, 'Centro Histórico'), make_hierarchy('01010', 2, 'Roma Norte')]
+
+    # 01020 was deleted, 01010 was not written
+    postal_code_index.on_catalog_change([('colonia', {'codigo_postal': '01000'}),
+                                         ('colonia', {'codigo_postal': '01020'})], 6)
+    postal_code_index.refresh()
+
+    assert catalog['builds'] == 0
+    assert postal_code_index.version == 6
+    assert postal_code_index._entries['01000'][0]['Suburb']['nombre_colonia'] == 'Centro Histórico'
+    assert postal_code_index._entries['01000'][0]['State']['id_estado'] == 9
+    assert postal_code_index._entries['01010'] == ({'Suburb': 'Roma'},)
+    assert '01020' not in postal_code_index._entries
+
+
+def test_index_is_built_again_when_a_version_was_missed(catalog, postal_code_index):
+    catalog['version'] = 7
+
+    postal_code_index.on_catalog_change([('colonia', {'codigo_postal': '01000'})], 7)
+    postal_code_index.refresh()
+
+    assert catalog['builds'] == 1
+    assert postal_code_index.version == 7
+
+
+def test_index_is_built_again_after_a_write_of_a_parent(catalog, postal_code_index):
+    catalog['version'] = 6
+
+    postal_code_index.on_catalog_change([('estado', {'clave_estado': 9})], 6)
+    postal_code_index.refresh()
+
+    assert catalog['builds'] == 1
+
+
+def test_index_is_built_again_when_the_database_is_ahead(catalog, postal_code_index):
+    # The version 7 is committed and not notified yet
+    catalog['version'] = 7
+
+    postal_code_index.on_catalog_change([('colonia', {'codigo_postal': '01000'})], 6)
+    postal_code_index.refresh()
+
+    assert catalog['builds'] == 1
+    assert postal_code_index.version == 7
+
+
+def test_response_cache_keeps_the_postal_codes_not_written():
+    response_cache = ResponseCache(1024 * 1024, 0)
+
+    response_cache.put('/codigo_postal/01000', 5, b'{"01000": []}', '01000')
+    response_cache.put('/codigo_postal/01010', 5, b'{"01010": []}', '01010')
+    response_cache.put('/codigo_postal/01020', 4, b'{"01020": []}', '01020')
+    response_cache.put('/colonia/filter', 5, b'[]')
+
+    response_cache.on_catalog_change([('colonia', {'codigo_postal': '01000'})], 6)
+
+    assert response_cache.get('/codigo_postal/01000', 6) is None
+    assert response_cache.get('/codigo_postal/01010', 6).etag == 'catalog-6'
+    assert response_cache.get('/codigo_postal/01020', 6) is None
+    assert response_cache.get('/colonia/filter', 6) is None
+    assert response_cache.get_stats()['entries'] == 1
+    assert response_cache.get_stats()['bytes'] == len(b'{"01010": []}')
+
+
+def test_response_cache_cleared_by_a_write_of_a_parent():
+    response_cache = ResponseCache(1024 * 1024, 0)
+
+    response_cache.put('/codigo_postal/01010', 5, b'{"01010": []}', '01010')
+
+    response_cache.on_catalog_change([('municipio', {'clave_estado': 9, 'clave_municipio': 15})], 6)
+
+    assert response_cache.get_stats()['entries'] == 0
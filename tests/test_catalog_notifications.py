@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import threading
+import time
+import pytest
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from db_controller import catalog_events
+from db_controller import catalog_notifications
+from db_controller.catalog_events import CATALOG_CHANNEL, CATALOG_ENTITIES, build_catalog_payload, \
+    get_known_catalog_version
+from db_controller.catalog_notifications import CatalogNotificationListener
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+
+        time.sleep(0.01)
+
+    return True
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, statement):
+        self.connection.statements.append(statement)
+
+
+class FakeConnection:
+    r"""
+    DBAPI connection of psycopg2 listening, the notifications sent are received on the next poll.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.isolation_level = None
+        self.notifies = []
+        self.pending = []
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def set_isolation_level(self, isolation_level):
+        self.isolation_level = isolation_level
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def send(self, payload):
+        with self.lock:
+            self.pending.append(SimpleNamespace(payload=payload))
+
+    def poll(self):
+        with self.lock:
+            self.notifies.extend(self.pending)
+            self.pending = []
+
+    def close(self):
+        self.closed = True
+
+
+class FakePoolConnection:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.detached = False
+
+    def detach(self):
+        self.detached = True
+
+
+class FakeEngine:
+
+    def __init__(self, connection):
+        self.pool_connection = FakePoolConnection(connection)
+
+    def raw_connection(self):
+        return self.pool_connection
+
+
+def fake_select(readers, writers, errors, timeout):
+    if readers[0].pending:
+        return readers, [], []
+
+    time.sleep(0.01)
+
+    return [], [], []
+
+
+@pytest.fixture
+def notified(monkeypatch):
+    r"""
+    Changes dispatched to the catalog listeners of the process.
+    """
+
+    notified_changes = []
+
+    @contextmanager
+    def session_scope():
+        yield None
+
+    monkeypatch.setattr(catalog_events, '_known_version', (None, None, 0.0))
+    monkeypatch.setattr(catalog_notifications, 'session_scope', session_scope)
+    monkeypatch.setattr(catalog_notifications, 'get_process_token', lambda: 'this-worker')
+    monkeypatch.setattr(catalog_notifications, 'notify_catalog_listeners',
+                        lambda changes, version: notified_changes.append((changes, version)))
+
+    return notified_changes
+
+
+def test_notifications_of_this_worker_are_not_dispatched_again(monkeypatch, notified):
+    monkeypatch.setattr(catalog_events, 'get_process_token', lambda: 'this-worker')
+
+    payload = build_catalog_payload([('colonia', {'codigo_postal': '01000'})], 3, None)
+
+    catalog_listener = CatalogNotificationListener()
+    catalog_listener.dispatch(payload)
+
+    assert notified == []
+    assert catalog_listener.received == 0
+
+
+def test_notified_changes_are_dispatched_to_the_listeners(monkeypatch, notified):
+    monkeypatch.setattr(catalog_events, 'get_process_token', lambda: 'writer-worker')
+
+    changes = [('colonia', {'codigo_postal': '01010'}), ('colonia', {'codigo_postal': '01000'}),
+               ('colonia', {'codigo_postal': '01000'}), ('estado', {})]
+    updated_date = datetime(2021, 5, 1, 10, 30)
+
+    catalog_listener = CatalogNotificationListener()
+    catalog_listener.dispatch(build_catalog_payload(changes, 7, updated_date))
+
+    assert notified == [([('colonia', {'codigo_postal': '01000'}), ('colonia', {'codigo_postal': '01010'}),
+                          ('estado', {})], 7)]
+    assert catalog_listener.received == 1
+    assert catalog_events._known_version[:2] == (7, updated_date)
+
+
+def test_resync_invalidates_all_the_entities_when_the_version_changed(monkeypatch, notified):
+    versions = [(4, None)]
+
+    monkeypatch.setattr(catalog_notifications, 'get_catalog_version', lambda session: versions[0])
+
+    catalog_listener = CatalogNotificationListener()
+
+    # First connection of the process, nothing was cached before
+    catalog_listener.resync()
+
+    assert notified == []
+
+    catalog_events.set_known_catalog_version(4, None)
+    catalog_listener.resync()
+
+    assert notified == []
+
+    # Notifications lost while disconnected
+    versions[0] = (6, None)
+    catalog_listener.resync()
+
+    assert notified == [([(entity, {}) for entity in CATALOG_ENTITIES], 6)]
+    assert get_known_catalog_version() == 6
+
+
+def test_connection_listens_on_autocommit_out_of_the_pool():
+    connection = FakeConnection()
+    engine_db = FakeEngine(connection)
+
+    assert CatalogNotificationListener(engine_db).connect() is connection
+
+    assert engine_db.pool_connection.detached
+    assert connection.isolation_level == ISOLATION_LEVEL_AUTOCOMMIT
+    assert connection.statements == ['LISTEN {}'.format(CATALOG_CHANNEL)]
+
+
+def test_listener_thread_dispatches_and_reconnects(monkeypatch, notified):
+    monkeypatch.setattr(catalog_events, 'get_process_token', lambda: 'writer-worker')
+    monkeypatch.setattr(catalog_notifications, 'select', SimpleNamespace(select=fake_select))
+    monkeypatch.setattr(catalog_notifications, 'RECONNECT_SECONDS', 0.01)
+    monkeypatch.setattr(catalog_notifications, 'get_catalog_version', lambda session: (1, None))
+
+    connections = []
+
+    def connect(self):
+        if not connections:
+            connections.append(None)
+            raise ConnectionError('Database not available')
+
+        connections.append(FakeConnection())
+
+        return connections[-1]
+
+    monkeypatch.setattr(CatalogNotificationListener, 'connect', connect)
+
+    catalog_listener = CatalogNotificationListener()
+    catalog_listener.start()
+
+    assert wait_until(lambda: len(connections) == 2)
+
+    connections[1].send(build_catalog_payload([('colonia', {'codigo_postal': '01000'})], 2, None))
+
+    assert wait_until(lambda: len(notified) == 1)
+    assert notified[0] == ([('colonia', {'codigo_postal': '01000'})], 2)
+
+    catalog_listener.stop()
+
+    assert not catalog_listener._thread.is_alive()
+    assert connections[1].closed
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import re
+import pytest
+from contextlib import contextmanager
+from types import SimpleNamespace
+from sqlalchemy.exc import OperationalError
+from db_controller import catalog_import
+from db_controller import mvc_exceptions as mvc_exc
+from db_controller.catalog_events import CATALOG_WRITES_KEY, CATALOG_ENTITIES
+from db_controller.catalog_import import CATALOG_TABLES, LIVE_SCHEMA, STAGING_SCHEMA, PREVIOUS_SCHEMA, \
+    SWAP_LOCK_TIMEOUT, swap_catalog, rollback_catalog
+from db_controller.database_backend import WRITE_ISOLATION_LEVEL
+
+TABLE_NAMES = [model.__tablename__ for model, sequence, columns in CATALOG_TABLES]
+
+
+class FakeConnection:
+    r"""
+    Connection of PostgreSQL that records the statements and moves the tables between the schemas.
+    Every table is labeled with the import that loaded it.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.statements = []
+        self.error = None
+
+    def execute(self, statement, parameters=None):
+        self.statements.append(statement)
+
+        if self.error is not None and statement.startswith(self.error[0]):
+            raise self.error[1]
+
+        drop = re.match(r'DROP TABLE IF EXISTS (\w+)\.(\w+) CASCADE', statement)
+        move = re.match(r'ALTER TABLE (\w+)\.(\w+) SET SCHEMA (\w+)', statement)
+
+        if drop:
+            self.tables.pop((drop.group(1), drop.group(2)), None)
+
+        elif move:
+            assert (move.group(3), move.group(2)) not in self.tables
+            self.tables[(move.group(3), move.group(2))] = self.tables.pop((move.group(1), move.group(2)))
+
+        elif statement.startswith('SELECT tablename FROM pg_tables'):
+            return [SimpleNamespace(tablename=table_name) for schema, table_name in self.tables
+                    if schema == parameters[0]]
+
+        return None
+
+
+class FakeDatabase:
+
+    def __init__(self, tables):
+        self.connection = FakeConnection(tables)
+        self.sessions = []
+
+    @contextmanager
+    def session_scope(self, isolation_level=None):
+        session = SimpleNamespace(info={}, isolation_level=isolation_level,
+                                  connection=lambda: self.connection)
+
+        self.sessions.append(session)
+
+        yield session
+
+    def get_labels(self, schema):
+        return set(label for (table_schema, table_name), label in self.tables.items() if table_schema == schema)
+
+    @property
+    def tables(self):
+        return self.connection.tables
+
+
+def make_tables(*labels_by_schema):
+    return {(schema, table_name): label for schema, label in labels_by_schema for table_name in TABLE_NAMES}
+
+
+@pytest.fixture
+def database(monkeypatch):
+    fake_database = FakeDatabase(make_tables((LIVE_SCHEMA, 'import-1'), (STAGING_SCHEMA, 'import-2')))
+
+    monkeypatch.setattr(catalog_import, 'session_scope', fake_database.session_scope)
+
+    return fake_database
+
+
+def test_swap_makes_live_the_staging_tables(database):
+    swap_catalog()
+
+    assert database.get_labels(LIVE_SCHEMA) == {'import-2'}
+    assert database.get_labels(PREVIOUS_SCHEMA) == {'import-1'}
+    assert database.get_labels(STAGING_SCHEMA) == set()
+
+    session = database.sessions[0]
+
+    assert session.isolation_level == WRITE_ISOLATION_LEVEL
+    assert session.info[CATALOG_WRITES_KEY] == [(entity, {}) for entity in CATALOG_ENTITIES]
+
+
+def test_swap_locks_the_live_tables_before_move_them(database):
+    swap_catalog()
+
+    statements = database.connection.statements
+    lock_position = statements.index('LOCK TABLE {} IN ACCESS EXCLUSIVE MODE'.format(
+        ', '.join('{}.{}'.format(LIVE_SCHEMA, table_name) for table_name in TABLE_NAMES)))
+
+    assert statements[lock_position - 1] == 'SET LOCAL lock_timeout = \'{}\''.format(SWAP_LOCK_TIMEOUT)
+    assert all(not statement.startswith('ALTER TABLE') for statement in statements[:lock_position])
+
+    # The sequences continue after the ids of the new live tables
+    assert sum(statement.startswith('SELECT setval') for statement in statements[lock_position:]) == \
+        len(CATALOG_TABLES)
+
+
+def test_swap_drops_the_tables_of_the_import_before_the_previous_one(database):
+    database.tables.update(make_tables((PREVIOUS_SCHEMA, 'import-0')))
+
+    swap_catalog()
+
+    assert database.get_labels(PREVIOUS_SCHEMA) == {'import-1'}
+    assert 'import-0' not in database.tables.values()
+
+
+def test_rollback_makes_live_the_previous_tables_and_can_be_reverted(database):
+    swap_catalog()
+    rollback_catalog()
+
+    assert database.get_labels(LIVE_SCHEMA) == {'import-1'}
+    assert database.get_labels(PREVIOUS_SCHEMA) == {'import-2'}
+    assert database.get_labels(STAGING_SCHEMA) == set()
+    assert database.sessions[1].info[CATALOG_WRITES_KEY] == [(entity, {}) for entity in CATALOG_ENTITIES]
+
+    rollback_catalog()
+
+    assert database.get_labels(LIVE_SCHEMA) == {'import-2'}
+    assert database.get_labels(PREVIOUS_SCHEMA) == {'import-1'}
+
+
+def test_rollback_without_previous_tables(database):
+    with pytest.raises(mvc_exc.ItemNotStored, match=PREVIOUS_SCHEMA):
+        rollback_catalog()
+
+    assert database.get_labels(LIVE_SCHEMA) == {'import-1'}
+
+    # Incomplete, the swap of a table is never done alone
+    database.tables[(PREVIOUS_SCHEMA, TABLE_NAMES[0])] = 'import-0'
+
+    with pytest.raises(mvc_exc.ItemNotStored):
+        rollback_catalog()
+
+    assert not any(statement.startswith('ALTER TABLE') for statement in database.connection.statements)
+
+
+def test_rollback_error_of_the_database(database):
+    swap_catalog()
+
+    database.connection.error = ('LOCK TABLE', OperationalError('LOCK TABLE', {}, Exception('lock timeout')))
+
+    with pytest.raises(mvc_exc.DatabaseError, match='rollback'):
+        rollback_catalog()
+
+
+def test_import_is_only_on_postgresql(monkeypatch, tmp_path):
+    monkeypatch.setattr(catalog_import, 'get_engine_db',
+                        lambda: SimpleNamespace(dialect=SimpleNamespace(name='sqlite')))
+
+    with pytest.raises(mvc_exc.DatabaseError, match='PostgreSQL'):
+        catalog_import.import_catalog(str(tmp_path / 'CPdescarga.txt'))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import pytest
+from sqlalchemy.orm import Session
+from apps.colonia.ColoniaModel import ColoniaModel
+from db_controller import catalog_sync
+from db_controller.catalog_events import CATALOG_WRITES_KEY, get_changed_postal_codes
+from db_controller.catalog_import import build_catalog_rows
+from db_controller.catalog_sync import diff_rows, get_change_key, sync_catalog_rows
+from test_catalog_import import make_sepomex_lines, make_record
+
+
+class FakeSession:
+    r"""
+    Session of the sync, the statements are recorded instead of executed.
+    """
+
+    def __init__(self):
+        self.info = {}
+        self.statements = []
+
+    def connection(self):
+        return self
+
+    def execute(self, statement, parameters=None):
+        self.statements.append((str(statement).split()[0], parameters))
+
+
+def get_target_keys(catalog_rows):
+    r"""
+    Rows of the database by natural key as read by read_catalog_keys, from the catalog of a file.
+    """
+
+    return {
+        'estado': {key: (row[0], row[-1]) for key, row in catalog_rows.states.items()},
+        'municipio': {key: (row[0], row[-1]) for key, row in catalog_rows.towns.items()},
+        'ciudad': {key: (row[0], row[-1]) for key, row in catalog_rows.cities.items()},
+        'colonia': {key: (row[0], row[-1]) for key, row in catalog_rows.suburbs.items()},
+    }
+
+
+@pytest.fixture
+def database(monkeypatch):
+    lines = make_sepomex_lines()
+    target_keys = get_target_keys(build_catalog_rows(make_record(line) for line in lines))
+
+    monkeypatch.setattr(catalog_sync, 'read_catalog_keys', lambda connection, entity: target_keys[entity])
+
+    return lines
+
+
+def test_diff_rows_by_natural_key_and_hash():
+    source_rows = {'a': ({'row_hash': '1'}, None), 'b': ({'row_hash': '2'}, None), 'c': ({'row_hash': '3'}, None)}
+    target_keys = {'b': (2, '2'), 'c': (3, 'old'), 'd': (4, '4')}
+
+    assert diff_rows(source_rows, target_keys) == (['a'], ['c'], ['d'])
+
+
+def test_rows_without_hash_are_updated():
+    assert diff_rows({'a': ({'row_hash': '1'}, None)}, {'a': (1, None)}) == ([], ['a'], [])
+
+
+def test_change_keys_of_the_parents():
+    assert get_change_key('estado', 9) == {'clave_estado': 9}
+    assert get_change_key('ciudad', (9, 15, 1)) == {'clave_estado': 9, 'clave_municipio': 15, 'clave_ciudad': 1}
+
+
+def test_sync_of_the_same_file_writes_nothing(database):
+    session = FakeSession()
+
+    report = sync_catalog_rows(session, build_catalog_rows(make_record(line) for line in database))
+
+    assert session.statements == []
+    assert CATALOG_WRITES_KEY not in session.info
+    assert report['codigo_postal'] == []
+    assert all(report[entity]['inserted'] == report[entity]['updated'] == report[entity]['deleted'] == 0
+               for entity in ('estado', 'municipio', 'ciudad', 'colonia'))
+
+
+def test_sync_of_colonias_records_only_their_postal_codes(database):
+    lines = list(database)
+
+    deleted = lines.pop(0)
+    updated = lines[5].split('|')
+    updated[13] = 'Semiurbano'
+    lines[5] = '|'.join(updated)
+    inserted = lines[7].split('|')
+    inserted[1] = 'Colonia Nueva'
+    lines.append('|'.join(inserted))
+
+    session = FakeSession()
+
+    report = sync_catalog_rows(session, build_catalog_rows(make_record(line) for line in lines))
+
+    postal_codes = {deleted.split('|')[0], updated[0], inserted[0]}
+
+    assert report['colonia'] == {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": len(lines) - 2}
+    assert report['codigo_postal'] == sorted(postal_codes)
+    assert [statement for statement, parameters in session.statements] == ['INSERT', 'UPDATE', 'DELETE']
+
+    # The caches evict only the postal codes written
+    assert get_changed_postal_codes(session.info[CATALOG_WRITES_KEY]) == postal_codes
+
+
+def test_dry_run_only_reports(database):
+    session = FakeSession()
+
+    report = sync_catalog_rows(session, build_catalog_rows(make_record(line) for line in database[1:]),
+                               dry_run=True)
+
+    assert report['colonia']['deleted'] == 1
+    assert session.statements == []
+    assert CATALOG_WRITES_KEY not in session.info
+
+
+def test_lookups_by_postal_code_select_only_the_columns_of_the_covering_index():
+    cover_columns = set(column.name for index in ColoniaModel.__table__.indexes
+                        if 'ix_colonia_codigo_postal_cover' == index.name for column in index.columns)
+
+    for query in (Session().query(ColoniaModel), ColoniaModel.query_hierarchy(Session())):
+        colonia_columns = set(column.name for column in query.statement.inner_columns
+                              if column.table is ColoniaModel.__table__)
+
+        assert 'row_hash' not in colonia_columns
+        assert colonia_columns <= cover_columns
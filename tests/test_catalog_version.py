@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import pytest
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from db_controller import database_backend
+from db_controller import mvc_exceptions as mvc_exc
+from db_controller.database_backend import get_engine_db, init_db_connection, session_scope, WRITE_ISOLATION_LEVEL
+from db_controller.catalog_events import CatalogVersionModel, increment_catalog_version, get_catalog_version, \
+    mark_catalog_write
+
+
+class FakeResult:
+
+    def first(self):
+        return None
+
+
+class FakeSession:
+    r"""
+    Session of a database without the row of the catalog version.
+    """
+
+    def execute(self, statement):
+        return FakeResult()
+
+
+class FakeConnection:
+    r"""
+    Connection of the pool, records the isolation level set by the request.
+    """
+
+    def __init__(self, isolation_level=None):
+        self.isolation_level = isolation_level
+
+    def execution_options(self, isolation_level):
+        return FakeConnection(isolation_level)
+
+
+class FakeEngine:
+
+    def connect(self):
+        return FakeConnection()
+
+
+@pytest.fixture
+def catalog_database():
+    r"""
+    Table of the catalog version on the PostgreSQL database of DATABASE_URL, the test is skipped without it.
+    """
+
+    try:
+        with get_engine_db().begin() as connection:
+            CatalogVersionModel.__table__.create(bind=connection, checkfirst=True)
+            connection.execute('INSERT INTO catalog_version (id_catalog, version, updated_date) '
+                               'VALUES (1, 1, now()) ON CONFLICT (id_catalog) DO NOTHING')
+
+    except OperationalError as exc:
+        pytest.skip('PostgreSQL is not available: {}'.format(exc))
+
+
+def test_missing_version_row_raises_a_clear_error():
+    with pytest.raises(mvc_exc.DatabaseError, match='catalog version'):
+        increment_catalog_version(FakeSession())
+
+
+@pytest.mark.parametrize('method, isolation_level', [('GET', None), ('POST', WRITE_ISOLATION_LEVEL)])
+def test_requests_that_write_run_on_the_write_isolation_level(monkeypatch, method, isolation_level):
+    monkeypatch.setattr(database_backend, 'get_engine_db', lambda: FakeEngine())
+
+    with Flask(__name__).test_request_context('/colonia/', method=method):
+        connection, session = init_db_connection()
+
+        assert connection.isolation_level == isolation_level
+
+
+def test_overlapping_writers_increment_the_version_one_after_the_other(catalog_database):
+    with session_scope() as session:
+        version, updated_date = get_catalog_version(session)
+
+    with session_scope(WRITE_ISOLATION_LEVEL) as first_writer:
+        with session_scope(WRITE_ISOLATION_LEVEL) as second_writer:
+            # Both transactions are started before any of them is committed
+            get_catalog_version(first_writer)
+            get_catalog_version(second_writer)
+
+            mark_catalog_write(first_writer, 'colonia', {'codigo_postal': '01000'})
+            mark_catalog_write(second_writer, 'colonia', {'codigo_postal': '01010'})
+
+            first_writer.commit()
+
+        # The second writer is committed at the end of his block, after the first one
+
+    with session_scope() as session:
+        assert get_catalog_version(session)[0] == version + 2
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import pytest
+from datetime import datetime, timezone
+from flask import Flask, jsonify
+from cache_controller import response_cache as response_cache_module
+from cache_controller.response_cache import ResponseCache, cached_response
+from handler_controller import conditional_requests
+from handler_controller.conditional_requests import catalog_conditional, note_served_catalog_version
+
+UPDATED_DATE = datetime(2021, 5, 4, 12, 30, 15, 500000, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    state = {'version': 5, 'index_version': 5, 'calls': 0}
+
+    def get_current_catalog_version(max_age):
+        return state['version'], UPDATED_DATE
+
+    monkeypatch.setattr(conditional_requests, 'get_current_catalog_version', get_current_catalog_version)
+    monkeypatch.setattr(response_cache_module, 'get_current_catalog_version', get_current_catalog_version)
+    monkeypatch.setattr(response_cache_module, 'response_cache', ResponseCache(1024 * 1024, 0))
+
+    return state
+
+
+@pytest.fixture
+def client(catalog):
+    app = Flask(__name__)
+
+    @app.route('/codigo_postal/<codigo_postal>')
+    @catalog_conditional
+    @cached_response
+    def get_postal_code(codigo_postal):
+        catalog['calls'] += 1
+
+        # Answered from the index on memory, maybe behind the catalog version
+        note_served_catalog_version(catalog['index_version'])
+
+        return jsonify({codigo_postal: catalog['index_version']})
+
+    return app.test_client()
+
+
+def test_etag_and_last_modified_of_the_catalog_version(client):
+    resp = client.get('/codigo_postal/01000')
+
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] == '"catalog-5"'
+    assert resp.headers['Last-Modified'] == 'Tue, 04 May 2021 12:30:15 GMT'
+
+
+def test_not_modified_on_the_same_etag(client, catalog):
+    resp = client.get('/codigo_postal/01000', headers={'If-None-Match': '"catalog-5"'})
+
+    assert resp.status_code == 304
+    assert catalog['calls'] == 0
+
+
+def test_modified_since_the_same_second_is_not_trusted(client):
+    resp = client.get('/codigo_postal/01000', headers={'If-Modified-Since': 'Tue, 04 May 2021 12:30:15 GMT'})
+
+    assert resp.status_code == 200
+
+    resp = client.get('/codigo_postal/01000', headers={'If-Modified-Since': 'Tue, 04 May 2021 12:30:16 GMT'})
+
+    assert resp.status_code == 304
+
+
+def test_response_is_cached_on_the_catalog_version(client, catalog):
+    client.get('/codigo_postal/01000')
+    resp = client.get('/codigo_postal/01000')
+
+    assert resp.status_code == 200
+    assert resp.get_json() == {'01000': 5}
+    assert catalog['calls'] == 1
+
+
+def test_data_behind_the_catalog_version_is_tagged_with_the_index_version_and_not_cached(client, catalog):
+    # The write of the version 6 is known, the index is still reloading
+    catalog['version'] = 6
+
+    resp = client.get('/codigo_postal/01000')
+
+    assert resp.headers['ETag'] == '"catalog-5"'
+    assert 'Last-Modified' not in resp.headers
+
+    # A client with the data of the version 5 is not told it has the version 6
+    resp = client.get('/codigo_postal/01000', headers={'If-None-Match': '"catalog-5"'})
+
+    assert resp.status_code == 200
+    assert catalog['calls'] == 2
+
+    catalog['index_version'] = 6
+
+    resp = client.get('/codigo_postal/01000')
+
+    assert resp.headers['ETag'] == '"catalog-6"'
+    assert resp.get_json() == {'01000': 6}
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import pytest
+from cache_controller import filter_cache
+from cache_controller.backends import InProcessCacheBackend
+from cache_controller.filter_cache import make_filter_key, on_catalog_change, POSTAL_CODE_NAMESPACE
+
+TTL_BY_NAMESPACE = {'estado': 60, 'colonia': 60, POSTAL_CODE_NAMESPACE: 60}
+
+
+@pytest.fixture
+def cache_backend(monkeypatch):
+    backend = InProcessCacheBackend(TTL_BY_NAMESPACE, 1024 * 1024, stale_seconds=30)
+
+    monkeypatch.setattr(filter_cache, 'cache_backend', backend)
+
+    return backend
+
+
+def put(backend, namespace, key, value):
+    backend.put(namespace, key, value, backend.generation(namespace))
+
+
+def test_filter_key_ignores_the_order_of_the_filters():
+    filter_spec = [{'field': 'codigo_postal', 'op': 'eq', 'value': '01000'},
+                   {'field': 'nombre_colonia', 'op': 'like', 'value': 'San'}]
+
+    assert make_filter_key(filter_spec, 1, 25) == make_filter_key(list(reversed(filter_spec)), '1', '25')
+    assert make_filter_key(filter_spec, 1, 25) != make_filter_key(filter_spec, 2, 25)
+    assert make_filter_key([{'field': 'id_estado', 'op': 'eq', 'value': 9}], 1, 25) == \
+        make_filter_key([{'field': 'id_estado', 'op': 'eq', 'value': '9'}], 1, 25)
+
+
+def test_write_of_an_entity_invalidates_only_that_entity(cache_backend):
+    put(cache_backend, 'estado', 'key', b'[1]')
+    put(cache_backend, 'colonia', 'key', b'[2]')
+
+    on_catalog_change([('colonia', {'id_colonia': 10})], 2)
+
+    assert cache_backend.get('estado', 'key') == b'[1]'
+    assert cache_backend.get('colonia', 'key') is None
+
+
+def test_write_of_colonias_evicts_only_their_postal_codes(cache_backend):
+    put(cache_backend, POSTAL_CODE_NAMESPACE, '01000', [{'Suburb': 'Centro'}])
+    put(cache_backend, POSTAL_CODE_NAMESPACE, '01010', [{'Suburb': 'Roma'}])
+
+    on_catalog_change([('colonia', {'id_colonia': 10, 'codigo_postal': '01000'})], 2)
+
+    assert cache_backend.get_many(POSTAL_CODE_NAMESPACE, ['01000', '01010']) == [None, [{'Suburb': 'Roma'}]]
+
+
+def test_write_of_a_parent_invalidates_all_the_postal_codes(cache_backend):
+    put(cache_backend, POSTAL_CODE_NAMESPACE, '01000', [{'Suburb': 'Centro'}])
+    put(cache_backend, POSTAL_CODE_NAMESPACE, '01010', [{'Suburb': 'Roma'}])
+
+    on_catalog_change([('ciudad', {'clave_estado': 9, 'clave_municipio': 15, 'clave_ciudad': 1}),
+                       ('colonia', {'codigo_postal': '01000'})], 2)
+
+    assert cache_backend.get_many(POSTAL_CODE_NAMESPACE, ['01000', '01010']) == [None, None]
+
+
+def test_value_read_before_an_eviction_is_not_saved(cache_backend):
+    generation = cache_backend.generation(POSTAL_CODE_NAMESPACE)
+
+    # The write is committed while the value is read from the database
+    on_catalog_change([('colonia', {'codigo_postal': '01000'})], 2)
+
+    cache_backend.put(POSTAL_CODE_NAMESPACE, '01000', [{'Suburb': 'Old'}], generation)
+
+    assert cache_backend.get(POSTAL_CODE_NAMESPACE, '01000') is None
+
+
+def test_in_process_backend_evicts_the_least_recently_used():
+    backend = InProcessCacheBackend(TTL_BY_NAMESPACE, 10)
+
+    put(backend, 'estado', 'a', b'12345')
+    put(backend, 'estado', 'b', b'12345')
+
+    assert backend.get('estado', 'a') == b'12345'
+
+    put(backend, 'estado', 'c', b'12345')
+
+    assert backend.get_many('estado', ['a', 'b', 'c']) == [b'12345', None, b'12345']
+    assert backend.get_stats()['evictions'] == 1
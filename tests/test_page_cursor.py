@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import base64
+import pytest
+from utilities.Utility import encode_page_cursor, decode_page_cursor, get_page_limit, get_page_number, \
+    MAX_PAGE_LIMIT, DEFAULT_PAGE_LIMIT
+
+
+@pytest.mark.parametrize('last_id', [1, 25, 145000, '77'])
+def test_cursor_round_trip(last_id):
+    assert decode_page_cursor(encode_page_cursor(last_id)) == int(last_id)
+
+
+def test_cursor_is_urlsafe():
+    cursor = encode_page_cursor(10 ** 12)
+
+    assert cursor == base64.urlsafe_b64encode(b'id:1000000000000').decode('ascii')
+    assert all(character.isalnum() or character in '-_=' for character in cursor)
+
+
+@pytest.mark.parametrize('cursor', [None, ''])
+def test_first_page_without_cursor(cursor):
+    assert decode_page_cursor(cursor) == 0
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor',
+    base64.urlsafe_b64encode(b'offset:10').decode('ascii'),
+    base64.urlsafe_b64encode(b'id:-10').decode('ascii'),
+    base64.urlsafe_b64encode(b'id:10:20').decode('ascii'),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode('ascii'),
+])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_page_cursor(cursor)
+
+
+def test_page_limit_bounded():
+    assert get_page_limit(None) == DEFAULT_PAGE_LIMIT
+    assert get_page_limit('abc') == DEFAULT_PAGE_LIMIT
+    assert get_page_limit(0) == 1
+    assert get_page_limit(MAX_PAGE_LIMIT + 1) == MAX_PAGE_LIMIT
+
+
+def test_page_number_starts_on_one():
+    assert get_page_number(None) == 1
+    assert get_page_number('3') == 3
+    assert get_page_number(-2) == 1
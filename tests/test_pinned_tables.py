@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import pytest
+from contextlib import contextmanager
+from flask import Flask, g
+from sqlalchemy.exc import OperationalError
+from apps.estado.EstadoModel import EstadoModel
+from cache_controller import pinned_tables
+from cache_controller.pinned_tables import PinnedTable, like_to_regex
+from utilities.Utility import decode_page_cursor
+
+STATES = [(1, 1, 'Aguascalientes'), (2, 2, 'Baja California'), (3, 3, 'Baja California Sur'),
+          (9, 9, 'Ciudad de México'), (15, 15, 'México'), (19, 19, 'Nuevo León')]
+
+
+class FakeQuery:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def order_by(self, column):
+        return self
+
+    def all(self):
+        if self.catalog.error is not None:
+            raise self.catalog.error
+
+        self.catalog.reads += 1
+
+        return list(self.catalog.rows)
+
+
+class FakeSession:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def query(self, model):
+        return FakeQuery(self.catalog)
+
+
+class FakeCatalog:
+    r"""
+    Rows of the table estado and the catalog version, as the database would answer them.
+    """
+
+    def __init__(self):
+        self.version = 1
+        self.error = None
+        self.reads = 0
+        self.rows = []
+
+        for id_estado, clave_estado, nombre_estado in STATES:
+            row = EstadoModel({'clave_estado': clave_estado, 'nombre_estado': nombre_estado})
+            row.id_estado = id_estado
+
+            self.rows.append(row)
+
+    @contextmanager
+    def session_scope(self):
+        yield FakeSession(self)
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    fake_catalog = FakeCatalog()
+
+    monkeypatch.setattr(pinned_tables, 'session_scope', fake_catalog.session_scope)
+    monkeypatch.setattr(pinned_tables, 'get_catalog_version', lambda session: (fake_catalog.version, None))
+    monkeypatch.setattr(pinned_tables, 'get_current_catalog_version',
+                        lambda max_age: (fake_catalog.version, None))
+
+    return fake_catalog
+
+
+@pytest.fixture
+def pinned_states(catalog):
+    return PinnedTable(EstadoModel, 'id_estado', 'clave_estado', 'nombre_estado', 'State')
+
+
+def names(items):
+    return [item['State']['nombre_estado'] for item in items]
+
+
+def test_table_is_loaded_on_the_first_lookup_only(catalog, pinned_states):
+    assert pinned_states.get_stats() == {'loaded': False, 'catalog_version': None, 'rows': 0}
+
+    assert len(pinned_states.get_all()) == len(STATES)
+    assert len(pinned_states.get_all()) == len(STATES)
+
+    assert catalog.reads == 1
+    assert pinned_states.get_stats() == {'loaded': True, 'catalog_version': 1, 'rows': len(STATES)}
+    assert pinned_states.get_all()[0] == {'State': {'id_estado': '1', 'nombre_estado': 'Aguascalientes',
+                                                    'clave_estado': 1}}
+
+
+def test_deferred_columns_are_not_pinned(pinned_states):
+    snapshot = pinned_states.load()
+
+    assert set(snapshot.values[0]) == {'id_estado', 'nombre_estado', 'clave_estado'}
+
+
+def test_pages_follow_the_cursor_of_the_last_id(pinned_states):
+    data = {'after_id': 0, 'limit': 4}
+    first_page = pinned_states.get_page(data)
+
+    assert names(first_page) == ['Aguascalientes', 'Baja California', 'Baja California Sur', 'Ciudad de México']
+    assert decode_page_cursor(data['next_cursor']) == 9
+
+    data = {'after_id': decode_page_cursor(data['next_cursor']), 'limit': 4}
+
+    assert names(pinned_states.get_page(data)) == ['México', 'Nuevo León']
+    assert data['next_cursor'] is None
+
+
+def test_filters_by_clave_and_name(pinned_states):
+    equal_spec = [{'field': 'clave_estado', 'op': '==', 'value': '15'}]
+
+    assert names(pinned_states.get_by_filters({}, equal_spec)) == ['México']
+
+    # ilike without wildcards is looked up on the normalized names
+    name_spec = [{'field': 'nombre_estado', 'op': 'ilike', 'value': 'MÉXICO'}]
+
+    assert names(pinned_states.get_by_filters({}, name_spec)) == ['México']
+
+    like_spec = [{'field': 'nombre_estado', 'op': 'ilike', 'value': 'baja%'}]
+
+    assert names(pinned_states.get_by_filters({}, like_spec)) == ['Baja California', 'Baja California Sur']
+    assert names(pinned_states.get_by_filters({'offset': 2, 'limit': 1}, like_spec)) == ['Baja California Sur']
+
+    both_spec = like_spec + [{'field': 'clave_estado', 'op': '==', 'value': 2}]
+
+    assert names(pinned_states.get_by_filters({}, both_spec)) == ['Baja California']
+
+
+def test_filter_operator_not_supported(pinned_states):
+    with pytest.raises(ValueError):
+        pinned_states.get_by_filters({}, [{'field': 'clave_estado', 'op': '>', 'value': 1}])
+
+
+@pytest.mark.parametrize('pattern, text, matches', [
+    ('%ciudad%', 'Ciudad de México', True),
+    ('m_xico', 'México', True),
+    ('m_xico', 'Mexico City', False),
+    ('50%.', '50%.', True),
+    ('a.c', 'abc', False),
+])
+def test_like_wildcards(pattern, text, matches):
+    assert (like_to_regex(pattern).match(text) is not None) == matches
+
+
+def test_table_is_loaded_again_on_a_new_catalog_version(catalog, pinned_states):
+    pinned_states.get_all()
+
+    catalog.rows[0].nombre_estado = 'Aguascalientes de Ags.'
+    catalog.version = 2
+
+    assert names(pinned_states.get_all())[0] == 'Aguascalientes de Ags.'
+    assert catalog.reads == 2
+    assert pinned_states.get_stats()['catalog_version'] == 2
+
+
+def test_snapshot_is_kept_when_the_database_is_not_available(catalog, pinned_states):
+    pinned_states.get_all()
+
+    catalog.version = 2
+    catalog.error = OperationalError('SELECT', {}, Exception('connection refused'))
+
+    with Flask(__name__).test_request_context('/estado/'):
+        assert len(pinned_states.get_all()) == len(STATES)
+        assert g.catalog_served_version == 1
+
+    assert pinned_states.get_stats()['catalog_version'] == 1
+
+
+def test_error_is_raised_without_a_snapshot(catalog, pinned_states):
+    catalog.error = OperationalError('SELECT', {}, Exception('connection refused'))
+
+    with pytest.raises(OperationalError):
+        pinned_states.get_all()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import pytest
+from contextlib import contextmanager
+from cache_controller import postal_code_bloom as bloom_module
+from cache_controller.postal_code_bloom import BloomFilter, PostalCodeBloom, postal_code_may_exist, \
+    REBUILD_BACKOFF_SECONDS
+
+# The fixture catalog replaces it, the builds are called by the tests
+rebuild_on_background = PostalCodeBloom.rebuild_on_background
+
+POSTAL_CODES = ['{:05d}'.format(number) for number in range(0, 100000, 3)]
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom_filter = BloomFilter(len(POSTAL_CODES), 0.001, 1024 * 1024)
+
+    for postal_code in POSTAL_CODES:
+        bloom_filter.add(postal_code)
+
+    assert all(postal_code in bloom_filter for postal_code in POSTAL_CODES)
+    assert bloom_filter.count == len(POSTAL_CODES)
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom_filter = BloomFilter(len(POSTAL_CODES), 0.01, 1024 * 1024)
+
+    for postal_code in POSTAL_CODES:
+        bloom_filter.add(postal_code)
+
+    absent = ['{:05d}'.format(number) for number in range(1, 100000, 3)]
+    false_positives = sum(1 for postal_code in absent if postal_code in bloom_filter)
+
+    assert bloom_filter.fp_rate == pytest.approx(0.01, rel=0.2)
+    assert false_positives / len(absent) < 0.02
+
+
+def test_bloom_filter_bounded_by_max_bytes():
+    bloom_filter = BloomFilter(len(POSTAL_CODES), 0.000001, 1024)
+
+    assert bloom_filter.size_bytes == 1024
+    assert bloom_filter.hash_count >= 1
+
+
+class FakeCatalog:
+    r"""
+    Catalog read by the builds of the filter instead of the database.
+    """
+
+    def __init__(self, version, postal_codes):
+        self.version = version
+        self.postal_codes = postal_codes
+        self.on_read = None
+
+    @contextmanager
+    def session_scope(self):
+        yield self
+
+    def get_catalog_version(self, session):
+        return self.version, None
+
+    def get_all_postal_codes(self, session):
+        postal_codes = list(self.postal_codes)
+
+        if self.on_read is not None:
+            self.on_read()
+
+        return postal_codes
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    fake_catalog = FakeCatalog(5, ['01000', '01010'])
+
+    monkeypatch.setattr(bloom_module, 'session_scope', fake_catalog.session_scope)
+    monkeypatch.setattr(bloom_module, 'get_catalog_version', fake_catalog.get_catalog_version)
+    monkeypatch.setattr(bloom_module.ColoniaModel, 'get_all_postal_codes', fake_catalog.get_all_postal_codes)
+    monkeypatch.setattr(bloom_module, 'get_current_catalog_version', lambda max_age: (fake_catalog.version, None))
+    monkeypatch.setattr(PostalCodeBloom, 'rebuild_on_background', lambda self: None)
+
+    return fake_catalog
+
+
+def test_postal_code_bloom_rejects_only_when_fresh(catalog):
+    postal_code_bloom = PostalCodeBloom(0.001, 1024)
+
+    # Not built, every postal code may exist
+    assert postal_code_bloom.might_contain('99999')
+
+    postal_code_bloom.build()
+
+    assert postal_code_bloom.might_contain('01000')
+    assert not postal_code_bloom.might_contain('99999')
+    assert postal_code_bloom.rejected == 1
+
+
+def test_postal_code_bloom_stale_after_a_write(catalog):
+    postal_code_bloom = PostalCodeBloom(0.001, 1024)
+    postal_code_bloom.build()
+
+    catalog.postal_codes.append('99999')
+    catalog.version = 6
+
+    postal_code_bloom.on_catalog_change([('colonia', {'codigo_postal': '99999'})], 6)
+
+    assert postal_code_bloom.is_stale()
+    assert postal_code_bloom.might_contain('99999')
+
+    postal_code_bloom.build()
+
+    assert not postal_code_bloom.is_stale()
+    assert postal_code_bloom.might_contain('99999')
+
+
+def test_postal_code_bloom_stale_on_a_newer_version_not_notified(catalog):
+    postal_code_bloom = PostalCodeBloom(0.001, 1024)
+    postal_code_bloom.build()
+
+    # Written by other node, this process only sees the catalog version
+    catalog.version = 7
+
+    assert postal_code_bloom.is_stale()
+    assert postal_code_bloom.might_contain('99999')
+
+
+def test_postal_code_bloom_write_during_build_keeps_it_stale(catalog):
+    postal_code_bloom = PostalCodeBloom(0.001, 1024)
+
+    # The write is committed after the postal codes were read
+    catalog.on_read = lambda: postal_code_bloom.on_catalog_change([('colonia', {'codigo_postal': '99999'})], 6)
+
+    postal_code_bloom.build()
+
+    assert postal_code_bloom.is_stale()
+    assert postal_code_bloom.might_contain('99999')
+
+
+class InlineThread:
+    r"""
+    Thread that runs his target when it is started, so the background builds end before the asserts.
+    """
+
+    def __init__(self, target, name=None, daemon=None):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+def test_postal_code_bloom_build_failed_is_tried_again_with_backoff(catalog, monkeypatch):
+    now = [1000.0]
+    reads = []
+
+    def database_down():
+        reads.append(now[0])
+        raise ConnectionError('Database not available')
+
+    monkeypatch.setattr(PostalCodeBloom, 'rebuild_on_background', rebuild_on_background)
+    monkeypatch.setattr(bloom_module.threading, 'Thread', InlineThread)
+    monkeypatch.setattr(bloom_module.time, 'monotonic', lambda: now[0])
+
+    postal_code_bloom = PostalCodeBloom(0.001, 1024)
+
+    # The build on the start of the worker failed, no filter and no build running
+    catalog.on_read = database_down
+
+    assert postal_code_bloom.might_contain('99999')
+    assert postal_code_bloom.might_contain('99999')
+    assert reads == [1000.0]
+
+    now[0] += REBUILD_BACKOFF_SECONDS
+
+    assert postal_code_bloom.might_contain('99999')
+    assert reads == [1000.0, 1000.0 + REBUILD_BACKOFF_SECONDS]
+
+    # The wait is doubled after every failure
+    now[0] += REBUILD_BACKOFF_SECONDS
+
+    assert postal_code_bloom.might_contain('99999')
+    assert len(reads) == 2
+
+    now[0] += REBUILD_BACKOFF_SECONDS
+    catalog.on_read = None
+
+    assert postal_code_bloom.might_contain('99999')
+    assert not postal_code_bloom.might_contain('99999')
+    assert postal_code_bloom.get_stats()['ready']
+
+
+@pytest.mark.parametrize('postal_code', [None, ''])
+def test_postal_code_without_value_may_exist(catalog, monkeypatch, postal_code):
+    postal_code_bloom = PostalCodeBloom(0.001, 1024)
+    postal_code_bloom.build()
+
+    monkeypatch.setattr(bloom_module, 'postal_code_bloom', postal_code_bloom)
+    monkeypatch.setattr(bloom_module.cfg_app, 'postal_code_bloom_enabled', True)
+
+    assert postal_code_may_exist(postal_code)
+    assert not postal_code_may_exist('99999')
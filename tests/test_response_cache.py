@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import gzip
+import json
+import pytest
+from flask import Flask, Response
+from cache_controller import response_cache as response_cache_module
+from cache_controller.response_cache import ResponseCache, cached_response
+from handler_controller import conditional_requests
+from handler_controller.conditional_requests import catalog_conditional, note_served_catalog_version, \
+    GZIP_ETAG_SUFFIX
+
+GZIP_MIN_BYTES = 256
+
+
+def make_body(size):
+    return json.dumps({'Suburbs': ['x' * size]}).encode('utf-8')
+
+
+@pytest.fixture
+def response_cache(monkeypatch):
+    cache = ResponseCache(1024 * 1024, GZIP_MIN_BYTES)
+
+    monkeypatch.setattr(response_cache_module, 'response_cache', cache)
+    monkeypatch.setattr(response_cache_module.cfg_app, 'response_cache_enabled', True)
+
+    return cache
+
+
+@pytest.fixture
+def client(monkeypatch, response_cache):
+    r"""
+    Client of an app with a lookup by postal code as the ones of the API, counting the calls of the view.
+    """
+
+    state = {'version': 3, 'served_version': None, 'calls': 0, 'status': 200, 'size': 1024}
+
+    def get_current_catalog_version(max_age):
+        return state['version'], None
+
+    monkeypatch.setattr(response_cache_module, 'get_current_catalog_version', get_current_catalog_version)
+    monkeypatch.setattr(conditional_requests, 'get_current_catalog_version', get_current_catalog_version)
+
+    app = Flask(__name__)
+
+    @app.route('/colonia/<codigo_postal>')
+    @catalog_conditional
+    @cached_response
+    def lookup(codigo_postal):
+        state['calls'] += 1
+
+        note_served_catalog_version(state['served_version'])
+
+        return Response(make_body(state['size']), status=state['status'], mimetype='application/json')
+
+    @app.route('/stream/')
+    @cached_response
+    def stream():
+        state['calls'] += 1
+
+        return Response((chunk for chunk in [b'[', b']']), mimetype='application/json')
+
+    test_client = app.test_client()
+    test_client.state = state
+
+    return test_client
+
+
+def test_only_the_big_bodies_are_gzipped(response_cache):
+    small_entry = response_cache.put('small', 1, make_body(10))
+    big_entry = response_cache.put('big', 1, make_body(1024))
+
+    assert small_entry.gzip_body is None
+    assert gzip.decompress(big_entry.gzip_body) == big_entry.body
+    assert response_cache.get_stats()['bytes'] == len(small_entry.body) + len(big_entry.body) + \
+        len(big_entry.gzip_body)
+
+
+def test_gzip_is_disabled_with_min_bytes_zero():
+    assert ResponseCache(1024 * 1024, 0).put('big', 1, make_body(1024)).gzip_body is None
+
+
+def test_entries_of_other_version_are_not_responded(response_cache):
+    response_cache.put('key', 1, b'[]')
+
+    assert response_cache.get('key', 2) is None
+    assert response_cache.get('key', 1).body == b'[]'
+    assert response_cache.get_stats()['hit_ratio'] == 0.5
+
+
+def test_least_recently_used_responses_are_evicted_first():
+    cache = ResponseCache(300, 0)
+
+    cache.put('first', 1, b'1' * 100)
+    cache.put('second', 1, b'2' * 100)
+    cache.put('third', 1, b'3' * 100)
+
+    cache.get('first', 1)
+    cache.put('fourth', 1, b'4' * 100)
+
+    assert cache.get('second', 1) is None
+    assert cache.get('first', 1) is not None
+    assert cache.get_stats()['evictions'] == 1
+    assert cache.get_stats()['bytes'] == 300
+
+    # A response bigger than the cache is responded without evict the others
+    assert cache.put('huge', 1, b'5' * 301).body == b'5' * 301
+    assert cache.get_stats()['entries'] == 3
+
+
+def test_hit_responds_the_encoded_body_without_call_the_view(client):
+    first = client.get('/colonia/01000')
+    second = client.get('/colonia/01000')
+
+    assert client.state['calls'] == 1
+    assert second.data == first.data
+    assert second.headers['ETag'] == '"catalog-3"'
+    assert 'Accept-Encoding' in second.headers['Vary']
+    assert 'Content-Encoding' not in second.headers
+
+
+def test_gzip_is_responded_to_the_clients_that_accept_it(client, response_cache):
+    plain = client.get('/colonia/01000')
+    compressed = client.get('/colonia/01000', headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] == '"catalog-3{}"'.format(GZIP_ETAG_SUFFIX)
+    assert gzip.decompress(compressed.data) == plain.data
+    assert response_cache.get(('/colonia/01000', ()), 3).postal_code == '01000'
+
+    # The small bodies are responded plain
+    client.state['size'] = 10
+    small = client.get('/colonia/01010', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in small.headers
+
+
+def test_gzip_etag_is_validated_by_the_conditional_requests(client):
+    client.get('/colonia/01000', headers={'Accept-Encoding': 'gzip'})
+
+    resp = client.get('/colonia/01000', headers={'Accept-Encoding': 'gzip',
+                                                 'If-None-Match': '"catalog-3{}"'.format(GZIP_ETAG_SUFFIX)})
+
+    assert resp.status_code == 304
+    assert client.state['calls'] == 1
+
+
+def test_query_string_is_part_of_the_key(client):
+    client.get('/colonia/01000?limit=10&offset=1')
+    client.get('/colonia/01000?offset=1&limit=10')
+    client.get('/colonia/01000?limit=20&offset=1')
+
+    assert client.state['calls'] == 2
+
+
+@pytest.mark.parametrize('status', [404, 500])
+def test_errors_are_not_saved(client, response_cache, status):
+    client.state['status'] = status
+
+    client.get('/colonia/01000')
+    client.get('/colonia/01000')
+
+    assert client.state['calls'] == 2
+    assert response_cache.get_stats()['entries'] == 0
+
+
+def test_data_of_a_previous_version_is_not_saved(client, response_cache):
+    # The postal code index is still reloading the write of the version 3
+    client.state['served_version'] = 2
+
+    resp = client.get('/colonia/01000')
+
+    assert resp.headers['ETag'] == '"catalog-2"'
+    assert response_cache.get_stats()['entries'] == 0
+
+
+def test_streamed_responses_are_not_saved(client, response_cache):
+    client.get('/stream/')
+    client.get('/stream/')
+
+    assert client.state['calls'] == 2
+    assert response_cache.get_stats()['entries'] == 0
+
+
+def test_new_catalog_version_misses(client):
+    client.get('/colonia/01000')
+
+    client.state['version'] = 4
+
+    assert client.get('/colonia/01000').headers['ETag'] == '"catalog-4"'
+    assert client.state['calls'] == 2
+
+
+def test_disabled_cache_calls_the_view(monkeypatch, client):
+    monkeypatch.setattr(response_cache_module.cfg_app, 'response_cache_enabled', False)
+
+    client.get('/colonia/01000')
+    client.get('/colonia/01000')
+
+    assert client.state['calls'] == 2
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import json
+import pytest
+from flask import Flask
+from apps.estado.EstadoModel import EstadoModel
+from db_controller.database_backend import STREAM_BATCH_SIZE
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+
+
+class FakeStreamQuery:
+    r"""
+    Query of the session that records the options of the cursor, the rows are fetched while they are iterated.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.options = {}
+        self.fetched = 0
+
+    def order_by(self, column):
+        return self
+
+    def execution_options(self, **options):
+        self.options.update(options)
+        return self
+
+    def yield_per(self, count):
+        self.options['yield_per'] = count
+        return self
+
+    def __iter__(self):
+        for row in self.rows:
+            self.fetched += 1
+            yield row
+
+
+class FakeSession:
+
+    def __init__(self, query):
+        self._query = query
+
+    def query(self, model):
+        return self._query
+
+
+def make_state(id_estado, nombre_estado):
+    state = EstadoModel({'clave_estado': id_estado, 'nombre_estado': nombre_estado})
+    state.id_estado = id_estado
+
+    return state
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_stream_writes_one_json_object_by_line(app):
+    rows = [{'State': {'id_estado': '1', 'nombre_estado': 'Aguascalientes'}},
+            {'State': {'id_estado': '9', 'nombre_estado': 'Ciudad de México'}}]
+
+    with app.test_request_context('/estado/?stream=ndjson'):
+        resp, status_code = HandlerResponse.response_stream(iter(rows))
+
+        body = b''.join(resp.iter_encoded())
+
+    assert status_code == 200
+    assert resp.mimetype == 'application/x-ndjson'
+    assert resp.is_streamed
+    assert [json.loads(line) for line in body.decode('utf-8').splitlines()] == rows
+
+
+def test_stream_reads_the_rows_while_they_are_written(app):
+    query = FakeStreamQuery([make_state(1, 'Aguascalientes'), make_state(2, 'Baja California'),
+                             make_state(3, 'Baja California Sur')])
+
+    with app.test_request_context('/estado/?stream=ndjson'):
+        resp, status_code = HandlerResponse.response_stream(EstadoModel.stream_all_states(FakeSession(query)))
+
+        # Nothing is read from the database until the first line is written
+        assert query.fetched == 0
+
+        lines = resp.iter_encoded()
+        first_line = next(lines)
+
+        assert query.fetched == 1
+        assert json.loads(first_line) == {'State': {'id_estado': '1', 'nombre_estado': 'Aguascalientes',
+                                                    'clave_estado': 1}}
+
+        assert len(list(lines)) == 2
+
+    assert query.options == {'stream_results': True, 'yield_per': STREAM_BATCH_SIZE}
+
+
+def test_data_is_serialized_once_as_json(app):
+    data = [{'State': {'id_estado': '1', 'nombre_estado': 'Aguascalientes'}}]
+
+    with app.app_context():
+        resp, status_code = HandlerResponse.response_success('States', data, next_cursor='aWQ6MQ==')
+
+        assert status_code == 200
+        assert resp.get_json() == {'message': 'States', 'data': data, 'next_cursor': 'aWQ6MQ=='}
+
+        resp, status_code = HandlerResponse.response_success('States', data)
+
+        assert 'next_cursor' not in resp.get_json()
+
+
+def test_encoded_data_is_passed_through_untouched(app):
+    encoded_data = b'[{"Suburb": {"nombre_colonia": "Ju\\u00e1rez", "codigo_postal": "06600"}}]'
+
+    with app.app_context():
+        resp, status_code = HandlerResponse.response_success('Suburbs "Juárez"', encoded_data, 'aWQ6MTA=')
+
+    body = resp.get_data()
+
+    assert status_code == 200
+    assert resp.mimetype == 'application/json'
+    # The bytes are copied as they are, never decoded and encoded again
+    assert encoded_data in body
+    assert json.loads(body) == {'message': 'Suburbs "Juárez"', 'data': json.loads(encoded_data),
+                                'next_cursor': 'aWQ6MTA='}
+
+
+def test_encoded_resource_created(app):
+    with app.app_context():
+        resp, status_code = HandlerResponse.response_resource_created('State created', b'{"id_estado": "33"}')
+
+    assert status_code == 201
+    assert json.loads(resp.get_data()) == {'message': 'State created', 'data': {'id_estado': '33'}}
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.H05.1 ($Rev: 2 $)"
+
+import threading
+import pytest
+from cache_controller.single_flight import SingleFlight
+
+CALLERS = 8
+
+
+def run_concurrently(flights, key, function):
+    results = [None] * CALLERS
+    errors = [None] * CALLERS
+
+    def call(number):
+        try:
+            results[number] = flights.do(key, function)
+        except Exception as exc:
+            errors[number] = exc
+
+    threads = [threading.Thread(target=call, args=(number,)) for number in range(CALLERS)]
+
+    for thread in threads:
+        thread.start()
+
+    return threads, results, errors
+
+
+def test_concurrent_calls_of_a_key_run_once():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def lookup():
+        calls.append(1)
+        release.wait(5)
+        return ['01000']
+
+    threads, results, errors = run_concurrently(flights, ('codigo_postal', '01000'), lookup)
+
+    # Every caller is waiting on the flight of the first one
+    while flights.get_stats()['coalesced'] < CALLERS - 1:
+        pass
+
+    release.set()
+
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [['01000']] * CALLERS
+    assert errors == [None] * CALLERS
+    assert flights.get_stats() == {"executions": 1, "coalesced": CALLERS - 1, "in_flight": 0}
+
+
+def test_error_is_raised_to_every_caller_and_not_cached():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def lookup():
+        release.wait(5)
+        raise RuntimeError('database not available')
+
+    threads, results, errors = run_concurrently(flights, 'key', lookup)
+
+    while flights.get_stats()['coalesced'] < CALLERS - 1:
+        pass
+
+    release.set()
+
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+    # The next call runs the function again
+    assert flights.do('key', lambda: 'loaded') == 'loaded'
+
+
+def test_sequential_calls_are_not_coalesced():
+    flights = SingleFlight()
+
+    assert flights.do('key', lambda: 1) == 1
+    assert flights.do('key', lambda: 2) == 2
+
+    with pytest.raises(ValueError):
+        flights.do('other', lambda: int('x'))
+
+    assert flights.get_stats() == {"executions": 3, "coalesced": 0, "in_flight": 0}
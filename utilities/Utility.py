@@ -12,8 +12,13 @@ __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
 from settings.settings import *
 from datetime import datetime
+import base64
 import pytz
 
+# Rows by page of the listings of the catalog
+DEFAULT_PAGE_LIMIT = 10
+MAX_PAGE_LIMIT = 1000
+
 
 # Define y obtiene el configurador para las constantes generales del sistema
 def get_config_settings_app():
@@ -64,3 +69,73 @@ def set_utc_date_data(data_date, timezone_date):
     utc_hour_convert = date_on_utc[1]
 
     return utc_date_convert, utc_hour_convert
+
+
+# Codifica el ultimo id de una pagina como cursor opaco para la siguiente pagina
+def encode_page_cursor(last_id):
+    """
+    Encode the last id of a page as the opaque cursor to request the next page.
+
+    :param last_id: The id of the last row of the page.
+    :return cursor: String urlsafe with the cursor of the next page.
+    """
+
+    return base64.urlsafe_b64encode('id:{}'.format(int(last_id)).encode('utf-8')).decode('ascii')
+
+
+# Decodifica el cursor opaco de una pagina al ultimo id de la pagina anterior
+def decode_page_cursor(cursor):
+    """
+    Decode the opaque cursor of a page to the id of the last row of the previous page.
+
+    :param cursor: String with the cursor received on the request, None to the first page.
+    :return after_id: The id after which the page starts, 0 to the first page.
+    :raise ValueError: If the cursor was not generated by encode_page_cursor.
+    """
+
+    if not cursor:
+        return 0
+
+    try:
+        prefix, last_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split(':')
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError('Invalid page cursor: {}'.format(cursor)) from exc
+
+    if 'id' != prefix or not last_id.isdigit():
+        raise ValueError('Invalid page cursor: {}'.format(cursor))
+
+    return int(last_id)
+
+
+# Obtiene el limite de filas por pagina dentro del maximo permitido
+def get_page_limit(limit):
+    """
+    Get the number of rows by page requested, bounded to MAX_PAGE_LIMIT.
+
+    :param limit: The limit received on the request.
+    :return limit: Integer with the rows by page.
+    """
+
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        limit = DEFAULT_PAGE_LIMIT
+
+    return max(1, min(limit, MAX_PAGE_LIMIT))
+
+
+# Obtiene el numero de pagina solicitado, la primera pagina es 1
+def get_page_number(offset):
+    """
+    Get the number of page requested by the offset of the filters, the first page is 1.
+
+    :param offset: The offset received on the request.
+    :return page: Integer with the number of page.
+    """
+
+    try:
+        page = int(offset)
+    except (TypeError, ValueError):
+        page = 1
+
+    return max(1, page)